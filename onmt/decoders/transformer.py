@@ -8,6 +8,7 @@ import torch.nn as nn
 from onmt.decoders.decoder import DecoderBase
 from onmt.modules import MultiHeadedAttention, AverageAttention
 from onmt.modules.position_ffn import PositionwiseFeedForward
+from onmt.utils.misc import checkpointed
 
 
 class TransformerDecoderLayer(nn.Module):
@@ -39,6 +40,9 @@ class TransformerDecoderLayer(nn.Module):
         self.layer_norm_1 = nn.LayerNorm(d_model, eps=1e-6)
         self.layer_norm_2 = nn.LayerNorm(d_model, eps=1e-6)
         self.drop = nn.Dropout(dropout)
+        # activations recomputed during backward: "none", "all" or
+        # "attention" (see TransformerDecoder.set_checkpoint)
+        self.checkpoint = "none"
 
     def forward(self, inputs, memory_bank, src_pad_mask, tgt_pad_mask,
                 layer_cache=None, step=None):
@@ -66,28 +70,54 @@ class TransformerDecoderLayer(nn.Module):
             future_mask = future_mask.triu_(1).view(1, tgt_len, tgt_len)
             dec_mask = torch.gt(tgt_pad_mask + future_mask, 0)
 
+        # nothing is recomputed when decoding step by step
+        if self.checkpoint == "all" and layer_cache is None:
+            return checkpointed(self, self._forward, inputs, memory_bank,
+                                src_pad_mask, dec_mask)
+        return self._forward(inputs, memory_bank, src_pad_mask, dec_mask,
+                             layer_cache, step)
+
+    def _forward(self, inputs, memory_bank, src_pad_mask, dec_mask,
+                 layer_cache=None, step=None):
+        recompute = self.checkpoint == "attention" and layer_cache is None
         input_norm = self.layer_norm_1(inputs)
 
-        if isinstance(self.self_attn, MultiHeadedAttention):
-            query, attn = self.self_attn(input_norm, input_norm, input_norm,
-                                         mask=dec_mask,
-                                         layer_cache=layer_cache,
-                                         type="self")
-        elif isinstance(self.self_attn, AverageAttention):
-            query, attn = self.self_attn(input_norm, mask=dec_mask,
-                                         layer_cache=layer_cache, step=step)
+        if recompute:
+            query = checkpointed(self, self._self_attn, input_norm, dec_mask)
+        else:
+            query = self._self_attn(input_norm, dec_mask, layer_cache, step)
 
         query = self.drop(query) + inputs
 
         query_norm = self.layer_norm_2(query)
-        mid, attn = self.context_attn(memory_bank, memory_bank, query_norm,
-                                      mask=src_pad_mask,
-                                      layer_cache=layer_cache,
-                                      type="context")
+        if recompute:
+            mid, attn = checkpointed(self, self._context_attn, memory_bank,
+                                     query_norm, src_pad_mask)
+        else:
+            mid, attn = self._context_attn(memory_bank, query_norm,
+                                           src_pad_mask, layer_cache)
         output = self.feed_forward(self.drop(mid) + query)
 
         return output, attn
 
+    def _self_attn(self, input_norm, dec_mask, layer_cache=None, step=None):
+        if isinstance(self.self_attn, MultiHeadedAttention):
+            query, _ = self.self_attn(input_norm, input_norm, input_norm,
+                                      mask=dec_mask,
+                                      layer_cache=layer_cache,
+                                      type="self")
+        elif isinstance(self.self_attn, AverageAttention):
+            query, _ = self.self_attn(input_norm, mask=dec_mask,
+                                      layer_cache=layer_cache, step=step)
+        return query
+
+    def _context_attn(self, memory_bank, query_norm, src_pad_mask,
+                      layer_cache=None):
+        return self.context_attn(memory_bank, memory_bank, query_norm,
+                                 mask=src_pad_mask,
+                                 layer_cache=layer_cache,
+                                 type="context")
+
 
 class TransformerDecoder(DecoderBase):
     """The Transformer decoder from "Attention is All You Need".
@@ -141,6 +171,11 @@ class TransformerDecoder(DecoderBase):
         self._copy = copy_attn
         self.layer_norm = nn.LayerNorm(d_model, eps=1e-6)
 
+    def set_checkpoint(self, checkpoint, every=1):
+        """See :func:`onmt.encoders.TransformerEncoder.set_checkpoint()`."""
+        for i, layer in enumerate(self.transformer_layers):
+            layer.checkpoint = checkpoint if i % every == 0 else "none"
+
     @classmethod
     def from_opt(cls, opt, embeddings):
         """Alternate constructor."""
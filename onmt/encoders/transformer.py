@@ -7,6 +7,7 @@ import torch.nn as nn
 from onmt.encoders.encoder import EncoderBase
 from onmt.modules import MultiHeadedAttention
 from onmt.modules.position_ffn import PositionwiseFeedForward
+from onmt.utils.misc import checkpointed
 
 
 class TransformerEncoderLayer(nn.Module):
@@ -32,6 +33,9 @@ class TransformerEncoderLayer(nn.Module):
         self.feed_forward = PositionwiseFeedForward(d_model, d_ff, dropout)
         self.layer_norm = nn.LayerNorm(d_model, eps=1e-6)
         self.dropout = nn.Dropout(dropout)
+        # activations recomputed during backward: "none", "all" or
+        # "attention" (see TransformerEncoder.set_checkpoint)
+        self.checkpoint = "none"
 
     def forward(self, inputs, mask):
         """
@@ -44,12 +48,24 @@ class TransformerEncoderLayer(nn.Module):
 
             * outputs ``(batch_size, src_len, model_dim)``
         """
+        if self.checkpoint == "all":
+            return checkpointed(self, self._forward, inputs, mask)
+        return self._forward(inputs, mask)
+
+    def _forward(self, inputs, mask):
         input_norm = self.layer_norm(inputs)
-        context, _ = self.self_attn(input_norm, input_norm, input_norm,
-                                    mask=mask, type="self")
+        if self.checkpoint == "attention":
+            context = checkpointed(self, self._self_attn, input_norm, mask)
+        else:
+            context = self._self_attn(input_norm, mask)
         out = self.dropout(context) + inputs
         return self.feed_forward(out)
 
+    def _self_attn(self, input_norm, mask):
+        context, _ = self.self_attn(input_norm, input_norm, input_norm,
+                                    mask=mask, type="self")
+        return context
+
 
 class TransformerEncoder(EncoderBase):
     """The Transformer encoder from "Attention is All You Need"
@@ -94,6 +110,14 @@ class TransformerEncoder(EncoderBase):
              for i in range(num_layers)])
         self.layer_norm = nn.LayerNorm(d_model, eps=1e-6)
 
+    def set_checkpoint(self, checkpoint, every=1):
+        """Recompute the activations of every ``every``-th layer during
+        the backward pass instead of keeping them, to save memory:
+        ``"all"`` of them, only those of the ``"attention"`` or
+        ``"none"``."""
+        for i, layer in enumerate(self.transformer):
+            layer.checkpoint = checkpoint if i % every == 0 else "none"
+
     @classmethod
     def from_opt(cls, opt, embeddings):
         """Alternate constructor."""
@@ -5,7 +5,8 @@ e.g., from a line of text to a sequence of embeddings.
 """
 from onmt.inputters.inputter import \
     load_old_vocab, get_fields, OrderedIterator, \
-    build_vocab, old_style_vocab, filter_example
+    build_vocab, old_style_vocab, filter_example, filter_raw_example, \
+    count_tokens, counts_path, src_map_field
 from onmt.inputters.dataset_base import Dataset
 from onmt.inputters.text_dataset import text_sort_key, TextDataReader
 from onmt.inputters.image_dataset import img_sort_key, ImageDataReader
@@ -20,7 +21,8 @@ str2sortkey = {
 
 
 __all__ = ['Dataset', 'load_old_vocab', 'get_fields', 'DataReaderBase',
-           'filter_example', 'old_style_vocab',
-           'build_vocab', 'OrderedIterator',
+           'filter_example', 'filter_raw_example', 'old_style_vocab',
+           'build_vocab', 'count_tokens', 'counts_path', 'src_map_field',
+           'OrderedIterator',
            'text_sort_key', 'img_sort_key', 'audio_sort_key',
            'TextDataReader', 'ImageDataReader', 'AudioDataReader']
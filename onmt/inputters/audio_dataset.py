@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import multiprocessing
 import os
 from tqdm import tqdm
 
@@ -6,6 +7,7 @@ import torch
 from torchtext.data import Field
 
 from onmt.inputters.datareader_base import DataReaderBase
+from onmt.inputters.feature_cache import FeatureCache, load_features
 
 # imports of datatype-specific dependencies
 try:
@@ -16,6 +18,18 @@ except ImportError:
     torchaudio, librosa, np = None, None, None
 
 
+_features_reader = None
+
+
+def _init_features_worker(reader):
+    global _features_reader
+    _features_reader = reader
+
+
+def _extract_features(audio_path):
+    return _features_reader._features(audio_path)
+
+
 class AudioDataReader(DataReaderBase):
     """Read audio data from disk.
 
@@ -29,6 +43,13 @@ class AudioDataReader(DataReaderBase):
             by std or not.
         truncate (int or NoneType): maximum audio length
             (0 or None for unlimited).
+        cache_dir (str or NoneType): directory where the spectrograms
+            are cached, see
+            :class:`onmt.inputters.feature_cache.FeatureCache`. The
+            examples then hold references to the cache instead of the
+            spectrograms. No cache if ``None``.
+        num_workers (int): number of processes extracting the
+            spectrograms, extracted by the reader if 0 or 1.
 
     Raises:
         onmt.inputters.datareader_base.MissingDependencyException: If
@@ -36,7 +57,8 @@ class AudioDataReader(DataReaderBase):
     """
 
     def __init__(self, sample_rate=0, window_size=0, window_stride=0,
-                 window=None, normalize_audio=True, truncate=None):
+                 window=None, normalize_audio=True, truncate=None,
+                 cache_dir=None, num_workers=0):
         self._check_deps()
         self.sample_rate = sample_rate
         self.window_size = window_size
@@ -44,11 +66,15 @@ class AudioDataReader(DataReaderBase):
         self.window = window
         self.normalize_audio = normalize_audio
         self.truncate = truncate
+        self.cache = FeatureCache(cache_dir) if cache_dir else None
+        self.num_workers = num_workers
 
     @classmethod
     def from_opt(cls, opt):
         return cls(sample_rate=opt.sample_rate, window_size=opt.window_size,
-                   window_stride=opt.window_stride, window=opt.window)
+                   window_stride=opt.window_stride, window=opt.window,
+                   cache_dir=opt.feature_cache,
+                   num_workers=opt.num_feature_workers)
 
     @classmethod
     def _check_deps(cls):
@@ -93,6 +119,27 @@ class AudioDataReader(DataReaderBase):
             spect.div_(std)
         return spect
 
+    def _features(self, audio_path):
+        if self.cache is None:
+            return self.extract_features(audio_path)
+        params = {"sample_rate": self.sample_rate,
+                  "window_size": self.window_size,
+                  "window_stride": self.window_stride,
+                  "window": self.window,
+                  "normalize_audio": self.normalize_audio,
+                  "truncate": self.truncate}
+        return self.cache.get(audio_path, params, self.extract_features)
+
+    def _audio_path(self, line, src_dir):
+        line = line.decode("utf-8").strip()
+        audio_path = os.path.join(src_dir, line)
+        if not os.path.exists(audio_path):
+            audio_path = line
+
+        assert os.path.exists(audio_path), \
+            'audio path %s not found' % line
+        return audio_path
+
     def read(self, data, side, src_dir=None):
         """Read data into dicts.
 
@@ -106,7 +153,9 @@ class AudioDataReader(DataReaderBase):
             src_dir (str): Location of source audio files. See ``data``.
 
         Yields:
-            A dictionary containing audio data for each line.
+            A dictionary containing audio data for each line: the
+            spectrogram, or a :class:`onmt.inputters.feature_cache.CachedArray`
+            with a cache.
         """
 
         assert src_dir is not None and os.path.exists(src_dir),\
@@ -115,17 +164,27 @@ class AudioDataReader(DataReaderBase):
         if isinstance(data, str):
             data = DataReaderBase._read_file(data)
 
-        for i, line in enumerate(tqdm(data)):
-            line = line.decode("utf-8").strip()
-            audio_path = os.path.join(src_dir, line)
-            if not os.path.exists(audio_path):
-                audio_path = line
-
-            assert os.path.exists(audio_path), \
-                'audio path %s not found' % line
-
-            spect = self.extract_features(audio_path)
-            yield {side: spect, side + '_path': line, 'indices': i}
+        lines = list(data)
+        audio_paths = [self._audio_path(line, src_dir) for line in lines]
+        # the workers of a pool cannot have their own pool
+        if self.num_workers > 1 and \
+                not multiprocessing.current_process().daemon:
+            # a bound method cannot be pickled on python 2
+            pool = multiprocessing.Pool(
+                self.num_workers, initializer=_init_features_worker,
+                initargs=(self,))
+            spects = pool.imap(_extract_features, audio_paths, chunksize=4)
+        else:
+            pool = None
+            spects = map(self._features, audio_paths)
+        try:
+            for i, (line, spect) in enumerate(
+                    zip(lines, tqdm(spects, total=len(lines)))):
+                line = line.decode("utf-8").strip()
+                yield {side: spect, side + '_path': line, 'indices': i}
+        finally:
+            if pool is not None:
+                pool.terminate()
 
 
 def audio_sort_key(ex):
@@ -168,7 +227,7 @@ class AudioSeqField(Field):
 
         assert not self.pad_first and not self.truncate_first \
             and not self.fix_length and self.sequential
-        minibatch = list(minibatch)
+        minibatch = [load_features(x) for x in minibatch]
         lengths = [x.size(1) for x in minibatch]
         max_len = max(lengths)
         nfft = minibatch[0].size(0)
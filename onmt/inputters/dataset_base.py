@@ -1,12 +1,17 @@
 # coding: utf-8
 
+import hashlib
 from itertools import chain, starmap
 from collections import Counter
 
+import numpy as np
+import six
 import torch
 from torchtext.data import Dataset as TorchtextDataset
 from torchtext.data import Example
-from torchtext.vocab import Vocab
+
+from onmt.inputters.example_store import ExampleStoreBuilder, \
+    ExampleViews, CopyVocabs
 
 
 def _join_dicts(*args):
@@ -21,6 +26,83 @@ def _join_dicts(*args):
     return dict(chain(*[d.items() for d in args]))
 
 
+def example_lengths(examples):
+    """Lengths of the ``src`` and ``tgt`` sides of ``examples``.
+
+    Returns:
+        dict[str, numpy.ndarray]: ``int64`` array of the length of the
+        first layer of each side the examples have.
+    """
+
+    lengths = {}
+    for side in ["src", "tgt"]:
+        if len(examples) and hasattr(examples[0], side):
+            lengths[side] = np.fromiter(
+                (_first_layer_length(getattr(ex, side)) for ex in examples),
+                dtype=np.int64, count=len(examples))
+    return lengths
+
+
+def _first_layer_length(value):
+    # features cached on disk only know their shape
+    if hasattr(value, "shape"):
+        return value.shape[1]
+    return len(value[0])
+
+
+def dataset_store(dataset):
+    """The :class:`onmt.inputters.example_store.ExampleStore` of the
+    examples of ``dataset``. It is built from the examples of datasets
+    holding :class:`torchtext.data.Example` objects, such as datasets
+    saved by older versions."""
+
+    if isinstance(dataset.examples, ExampleViews):
+        return dataset.examples.store
+    builder = ExampleStoreBuilder(dataset.fields)
+    for ex in dataset.examples:
+        builder.add(ex)
+    return builder.finish()
+
+
+def _example_fields(fields, ex_dict, can_copy):
+    # the fields of the examples built from dicts like ex_dict
+    names = set(ex_dict)
+    if can_copy:
+        names.add("src_map")
+        if "tgt" in ex_dict:
+            names.add("alignment")
+    return {k: [(k, v)] for k, v in fields.items() if k in names}
+
+
+def _text_digest(ex_dict):
+    """md5 digest of the text of an example, including the path of
+    non-text data."""
+    md5 = hashlib.md5()
+    for k, v in sorted(ex_dict.items()):
+        if isinstance(v, six.string_types):
+            for string in (k, v):
+                if isinstance(string, six.text_type):
+                    string = string.encode("utf-8")
+                # the length keeps the strings apart
+                md5.update(("%d:" % len(string)).encode("ascii"))
+                md5.update(string)
+    return md5.digest()
+
+
+def _copy_vocab_stoi(src, specials):
+    """The ``stoi`` of ``torchtext.vocab.Vocab(Counter(src),
+    specials=specials)``, without building the vocab."""
+
+    counter = Counter(src)
+    for tok in specials:
+        del counter[tok]
+    # sort by frequency, then alphabetically, like torchtext
+    words = sorted(counter.items(), key=lambda tup: tup[0])
+    words.sort(key=lambda tup: tup[1], reverse=True)
+    itos = list(specials) + [w for w, _ in words]
+    return {tok: i for i, tok in enumerate(itos)}
+
+
 def _dynamic_dict(example, src_field, tgt_field):
     """Create copy-vocab and numericalize with it.
 
@@ -31,6 +113,10 @@ def _dynamic_dict(example, src_field, tgt_field):
     alignment has an initial and final UNK token to match the BOS and EOS
     tokens.
 
+    The copy-vocab itself is not kept: it is rebuilt from the source
+    tokens when it is needed (see
+    :class:`onmt.inputters.example_store.CopyVocabs`).
+
     Args:
         example (dict): An example dictionary with a ``"src"`` key and
             maybe a ``"tgt"`` key. (This argument changes in place!)
@@ -38,25 +124,23 @@ def _dynamic_dict(example, src_field, tgt_field):
         tgt_field (torchtext.data.Field): Field object.
 
     Returns:
-        torchtext.data.Vocab and ``example``, changed as described.
+        ``example``, changed as described.
     """
 
     src = src_field.tokenize(example["src"])
     # make a small vocab containing just the tokens in the source sequence
     unk = src_field.unk_token
     pad = src_field.pad_token
-    src_ex_vocab = Vocab(Counter(src), specials=[unk, pad])
-    unk_idx = src_ex_vocab.stoi[unk]
+    stoi = _copy_vocab_stoi(src, [unk, pad])
+    unk_idx = stoi[unk]
     # Map source tokens to indices in the dynamic dict.
-    src_map = torch.LongTensor([src_ex_vocab.stoi[w] for w in src])
-    example["src_map"] = src_map
+    example["src_map"] = np.array([stoi[w] for w in src], dtype=np.int32)
 
     if "tgt" in example:
         tgt = tgt_field.tokenize(example["tgt"])
-        mask = torch.LongTensor(
-            [unk_idx] + [src_ex_vocab.stoi[w] for w in tgt] + [unk_idx])
-        example["alignment"] = mask
-    return src_ex_vocab, example
+        mask = [unk_idx] + [stoi.get(w, unk_idx) for w in tgt] + [unk_idx]
+        example["alignment"] = np.array(mask, dtype=np.int32)
+    return example
 
 
 class Dataset(TorchtextDataset):
@@ -67,8 +151,11 @@ class Dataset(TorchtextDataset):
     raw data should be processed to produce tensors. When a dataset is
     instantiated, it applies the fields' preprocessing pipeline (but not
     the bit that numericalizes it or turns it into batch tensors) to the raw
-    data, producing a list of :class:`torchtext.data.Example` objects.
-    torchtext's iterators then know how to use these examples to make batches.
+    data. The results are stored in flat arrays (see
+    :class:`onmt.inputters.example_store.ExampleStore`) and ``examples``
+    holds light views of them that behave like
+    :class:`torchtext.data.Example` objects. torchtext's iterators then
+    know how to use these examples to make batches.
 
     Args:
         fields (dict[str, Field]): a dict with the structure
@@ -98,37 +185,73 @@ class Dataset(TorchtextDataset):
         filter_pred (Callable[[torchtext.data.Example], bool]): A function
             that accepts Example objects and returns a boolean value
             indicating whether to include that example in the dataset.
+        raw_filter (Callable[[dict], str or NoneType]): A function that
+            accepts the dicts yielded by the readers, before any example
+            is built from them, and returns why the example is rejected
+            or ``None`` to include it (see
+            :func:`onmt.inputters.filter_raw_example`).
+        dedup (bool): Reject the examples whose text is the same as the
+            text of a previous example of the dataset.
 
     Attributes:
-        src_vocabs (List[torchtext.data.Vocab]): Used with dynamic dict/copy
-            attention. There is a very short vocab for each src example.
-            It contains just the source words, e.g. so that the generator can
-            predict to copy them.
+        src_vocabs (Sequence[torchtext.data.Vocab]): Used with dynamic
+            dict/copy attention. There is a very short vocab for each src
+            example, built when it is accessed. It contains just the source
+            words, e.g. so that the generator can predict to copy them.
+            It is indexed by the ``indices`` of the examples.
+        lengths (dict[str, numpy.ndarray]): The ``src`` and ``tgt``
+            lengths of the examples, used to plan batches (see
+            :func:`example_lengths`).
+        rejected (Counter): The number of examples rejected by
+            ``raw_filter`` for each reason, and of ``"duplicate"``
+            examples.
     """
 
     def __init__(self, fields, readers, data, dirs, sort_key,
-                 filter_pred=None):
+                 filter_pred=None, raw_filter=None, dedup=False):
         self.sort_key = sort_key
         can_copy = 'src_map' in fields and 'alignment' in fields
 
         read_iters = [r.read(dat[1], dat[0], dir_) for r, dat, dir_
                       in zip(readers, data, dirs)]
 
-        # self.src_vocabs is used in collapse_copy_scores and Translator.py
-        self.src_vocabs = []
-        examples = []
+        builder = None
+        self.rejected = Counter()
+        seen = set()
         for ex_dict in starmap(_join_dicts, zip(*read_iters)):
+            if builder is None:
+                ex_fields = _example_fields(fields, ex_dict, can_copy)
+                builder = ExampleStoreBuilder(
+                    {k: nf_list[0][1] for k, nf_list in ex_fields.items()})
+            if raw_filter is not None:
+                reason = raw_filter(ex_dict)
+                if reason is not None:
+                    self.rejected[reason] += 1
+                    continue
+            if dedup:
+                key = _text_digest(ex_dict)
+                if key in seen:
+                    self.rejected["duplicate"] += 1
+                    continue
+                seen.add(key)
             if can_copy:
                 src_field = fields['src']
                 tgt_field = fields['tgt']
                 # this assumes src_field and tgt_field are both text
-                src_ex_vocab, ex_dict = _dynamic_dict(
+                ex_dict = _dynamic_dict(
                     ex_dict, src_field.base_field, tgt_field.base_field)
-                self.src_vocabs.append(src_ex_vocab)
-            ex_fields = {k: [(k, v)] for k, v in fields.items() if
-                         k in ex_dict}
             ex = Example.fromdict(ex_dict, ex_fields)
-            examples.append(ex)
+            if filter_pred is None or filter_pred(ex):
+                builder.add(ex)
+        store = builder.finish()
+
+        # self.src_vocabs is used in collapse_copy_scores and Translator.py
+        if can_copy:
+            src_base_field = fields['src'].base_field
+            self.src_vocabs = CopyVocabs(
+                store, [src_base_field.unk_token, src_base_field.pad_token])
+        else:
+            self.src_vocabs = []
 
         # fields needs to have only keys that examples have as attrs
         fields = []
@@ -136,7 +259,8 @@ class Dataset(TorchtextDataset):
             assert len(nf_list) == 1
             fields.append(nf_list[0])
 
-        super(Dataset, self).__init__(examples, fields, filter_pred)
+        super(Dataset, self).__init__(ExampleViews(store), fields)
+        self.lengths = store.lengths()
 
     def __getattr__(self, attr):
         # avoid infinite recursion when fields isn't defined
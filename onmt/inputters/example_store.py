@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""Compact, array-backed storage for the examples of a dataset.
+
+Each text side (``src``/``tgt``) is stored as one ``int32`` token-id
+array per field layer (the tokens and each word feature) plus an
+``int64`` offsets array shared by its layers. The ids index a token
+table per layer. The copy attention sequences (``src_map`` and
+``alignment``) are flat ``int32`` arrays with their own offsets and
+``indices`` is an ``int64`` array. Other attributes, such as image or
+audio tensors, are kept as they are.
+
+Code that needs per-example access gets light :class:`ExampleView`
+objects that decode their attributes on access.
+
+Once the vocabularies are built, a store can be numericalized (see
+:meth:`ExampleStore.numericalize`): each layer table is mapped to the ids
+of the layer's vocab by a ``"<layer>.vocab_ids"`` array, so batches are
+built from integer ids without looking up any token string.
+"""
+import hashlib
+import operator
+from array import array
+from collections import Counter, OrderedDict
+
+import numpy as np
+import torch
+from torchtext.vocab import Vocab
+
+
+SEQ_NAMES = ("src_map", "alignment")
+
+
+def text_layers(fields):
+    """Map each multi-layer text attribute of ``fields`` to its layer
+    names."""
+    layers = {}
+    for name, field in fields.items():
+        try:
+            f_iter = iter(field)
+        except TypeError:
+            continue
+        layers[name] = [sub_n for sub_n, _ in f_iter]
+    return layers
+
+
+def vocab_digest(vocab):
+    """A digest of the tokens of ``vocab``, in order."""
+    return hashlib.md5("\n".join(vocab.itos).encode("utf-8")).hexdigest()
+
+
+class ExampleStore(object):
+    """The examples of a dataset, stored as flat arrays.
+
+    Args:
+        meta (dict): Layout of the store: ``n_examples``, ``text`` (see
+            :func:`text_layers`), ``seqs`` (names of the copy attention
+            sequences) and ``vocab_sizes`` (size of each layer table).
+        arrays (dict[str, numpy.ndarray]): The flat arrays.
+        tables (dict[str, List[str]] or NoneType): The token table of
+            each layer. Missing tables are decoded from the
+            ``"<layer>.vocab"`` arrays on first use.
+        objects (dict[str, list] or NoneType): Values of the attributes
+            that are not stored as arrays.
+    """
+
+    def __init__(self, meta, arrays, tables=None, objects=None):
+        self.meta = meta
+        self.arrays = arrays
+        self._tables = tables if tables is not None else {}
+        self.objects = objects if objects is not None else {}
+
+    def __len__(self):
+        return self.meta["n_examples"]
+
+    def table(self, layer):
+        """The token strings for the ids of ``layer``."""
+        if layer not in self._tables:
+            if self.meta["vocab_sizes"][layer] == 0:
+                self._tables[layer] = []
+            else:
+                self._tables[layer] = self.arrays[layer + ".vocab"] \
+                    .tobytes().decode("utf-8").split("\n")
+        return self._tables[layer]
+
+    def has(self, name):
+        if name == "indices":
+            return name in self.arrays
+        return name in self.meta["text"] or name in self.meta["seqs"] \
+            or name in self.objects
+
+    def get(self, i, name):
+        """Value of attribute ``name`` of the ``i``-th example, in the
+        same form as the attributes of a :class:`torchtext.data.Example`
+        built by :class:`onmt.inputters.Dataset`."""
+        if name in self.meta["text"]:
+            offsets = self.arrays[name + ".offsets"]
+            start, end = offsets[i], offsets[i + 1]
+            return [[table[t] for t in
+                     self.arrays[layer + ".ids"][start:end].tolist()]
+                    for layer, table in
+                    ((layer, self.table(layer))
+                     for layer in self.meta["text"][name])]
+        if name in self.meta["seqs"]:
+            offsets = self.arrays[name + ".offsets"]
+            return torch.from_numpy(self.arrays[name][
+                offsets[i]:offsets[i + 1]].astype(np.int64))
+        if name == "indices":
+            return int(self.arrays["indices"][i])
+        if name in self.objects:
+            return self.objects[name][i]
+        raise KeyError(name)
+
+    def numericalize(self, fields):
+        """Map the table of each text layer to the ids of the vocab of
+        its field in ``fields``. Layers already mapped to the same vocab,
+        e.g. by ``preprocess.py -numericalize``, are kept as they are.
+
+        Args:
+            fields (dict[str, Field]): Fields with a vocab, keyed by
+                attribute name like the examples.
+        """
+
+        digests = self.meta.setdefault("vocab_digests", {})
+        for side, names in self.meta["text"].items():
+            for layer, field in fields[side]:
+                digest = vocab_digest(field.vocab)
+                if digests.get(layer) == digest and \
+                        layer + ".vocab_ids" in self.arrays:
+                    continue
+                stoi = field.vocab.stoi
+                self.arrays[layer + ".vocab_ids"] = np.array(
+                    [stoi[tok] for tok in self.table(layer)], dtype=np.int64)
+                digests[layer] = digest
+
+    def vocab_ids(self, i, name):
+        """Vocab ids of the text attribute ``name`` of the ``i``-th
+        example, as an ``int64`` array of shape ``(n_layers, len)``, or
+        ``None`` if the store is not numericalized."""
+        layers = self.meta["text"].get(name)
+        if not layers or any(layer + ".vocab_ids" not in self.arrays
+                             for layer in layers):
+            return None
+        offsets = self.arrays[name + ".offsets"]
+        start, end = offsets[i], offsets[i + 1]
+        return np.stack([
+            self.arrays[layer + ".vocab_ids"][
+                self.arrays[layer + ".ids"][start:end]]
+            for layer in layers])
+
+    def lengths(self):
+        """See :attr:`onmt.inputters.Dataset.lengths`."""
+        lengths = {}
+        for side in ["src", "tgt"]:
+            if side in self.meta["text"]:
+                lengths[side] = np.diff(self.arrays[side + ".offsets"])
+            elif side in self.objects:
+                lengths[side] = np.fromiter(
+                    (len(x[0]) for x in self.objects[side]),
+                    dtype=np.int64, count=len(self))
+        return lengths
+
+
+class ExampleStoreBuilder(object):
+    """Append examples to a new :class:`ExampleStore`.
+
+    Args:
+        fields (dict[str, Field]): The fields of the attributes of the
+            examples.
+    """
+
+    def __init__(self, fields):
+        self.layers = text_layers(fields)
+        self.seq_names = [n for n in SEQ_NAMES if n in fields]
+        self.has_indices = "indices" in fields
+        self.object_names = [
+            n for n in fields if n not in self.layers
+            and n not in self.seq_names and n != "indices"]
+        self.n_examples = 0
+        # int64 offsets and indices are collected in lists, since
+        # ``array`` has no 64 bits type on python 2
+        self.offsets = {n: [0] for n in list(self.layers) + self.seq_names}
+        self.ids = {layer: array("i")
+                    for names in self.layers.values() for layer in names}
+        self.tables = {layer: {} for layer in self.ids}
+        self.seqs = {n: [] for n in self.seq_names}
+        self.indices = []
+        self.objects = {n: [] for n in self.object_names}
+
+    def add(self, ex):
+        for side, names in self.layers.items():
+            data = getattr(ex, side)
+            self.offsets[side].append(self.offsets[side][-1] + len(data[0]))
+            for layer, toks in zip(names, data):
+                table = self.tables[layer]
+                self.ids[layer].extend(
+                    table.setdefault(tok, len(table)) for tok in toks)
+        for n in self.seq_names:
+            seq = getattr(ex, n)
+            self.offsets[n].append(self.offsets[n][-1] + len(seq))
+            self.seqs[n].append(np.asarray(seq, dtype=np.int32))
+        if self.has_indices:
+            self.indices.append(ex.indices)
+        for n in self.object_names:
+            self.objects[n].append(getattr(ex, n))
+        self.n_examples += 1
+
+    def finish(self):
+        """Returns:
+            ExampleStore: the added examples."""
+        arrays = {}
+        tables = {}
+        vocab_sizes = {}
+        for side, names in self.layers.items():
+            arrays[side + ".offsets"] = np.array(
+                self.offsets[side], dtype=np.int64)
+            for layer in names:
+                arrays[layer + ".ids"] = np.frombuffer(
+                    self.ids[layer], dtype=np.int32)
+                tables[layer] = sorted(
+                    self.tables[layer], key=self.tables[layer].get)
+                vocab_sizes[layer] = len(tables[layer])
+        for n in self.seq_names:
+            arrays[n + ".offsets"] = np.array(
+                self.offsets[n], dtype=np.int64)
+            arrays[n] = np.concatenate(self.seqs[n]) if self.seqs[n] \
+                else np.zeros(0, dtype=np.int32)
+        if self.has_indices:
+            arrays["indices"] = np.array(self.indices, dtype=np.int64)
+        meta = {"n_examples": self.n_examples, "text": self.layers,
+                "seqs": self.seq_names, "vocab_sizes": vocab_sizes}
+        return ExampleStore(meta, arrays, tables, self.objects)
+
+
+class ExampleView(object):
+    """Lightweight stand-in for :class:`torchtext.data.Example` that reads
+    its attributes from an :class:`ExampleStore` on access."""
+
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store, i):
+        self._store = store
+        self._i = i
+
+    @property
+    def store(self):
+        """The :class:`ExampleStore` of the example."""
+        return self._store
+
+    @property
+    def position(self):
+        """Position of the example in its store."""
+        return self._i
+
+    def __getattr__(self, name):
+        if name.startswith("__") or not self._store.has(name):
+            raise AttributeError(name)
+        return self._store.get(self._i, name)
+
+
+def batch_values(examples, name):
+    """The values of attribute ``name`` of ``examples`` to build a batch
+    from. Text attributes of numericalized examples are given as their
+    :meth:`ExampleStore.vocab_ids`."""
+    if examples and isinstance(examples[0], ExampleView) and \
+            examples[0].store.vocab_ids(0, name) is not None:
+        return [ex.store.vocab_ids(ex.position, name) for ex in examples]
+    return [getattr(ex, name) for ex in examples]
+
+
+class ExampleViews(object):
+    """Sequence of the :class:`ExampleView` of each example of a store."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = operator.index(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return ExampleView(self.store, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield ExampleView(self.store, i)
+
+
+class CopyVocabs(object):
+    """The copy vocab of each example of a store, built on demand.
+
+    Like :attr:`onmt.inputters.Dataset.src_vocabs`, this is indexed by
+    the example ``indices`` attribute, not by position in the store. The
+    vocabs are indexed once per example of each batch, by the copy
+    generator and the copy loss, so the ``cache_size`` last used ones are
+    kept rather than built again.
+
+    Args:
+        store (ExampleStore): Examples with a ``src`` side.
+        specials (List[str]): The unk and pad tokens.
+        cache_size (int): Number of vocabs kept.
+    """
+
+    def __init__(self, store, specials, cache_size=4096):
+        self.store = store
+        self.specials = specials
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_cache"] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("cache_size", 4096)
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        indices = self.store.arrays["indices"]
+        return int(indices[-1]) + 1 if len(indices) else 0
+
+    def _build(self, index):
+        indices = self.store.arrays["indices"]
+        pos = int(np.searchsorted(indices, index))
+        if pos == len(indices) or indices[pos] != index:
+            raise IndexError(index)
+        src = self.store.get(pos, "src")[0]
+        return Vocab(Counter(src), specials=self.specials)
+
+    def __getitem__(self, index):
+        index = operator.index(index)
+        # the most recently used vocab is the last one
+        vocab = self._cache.pop(index, None)
+        if vocab is None:
+            vocab = self._build(index)
+            if len(self._cache) >= self.cache_size:
+                self._cache.popitem(last=False)
+        self._cache[index] = vocab
+        return vocab
@@ -0,0 +1,87 @@
+"""On-disk cache of the features extracted from media files.
+
+The features of a file are saved as a ``float16`` ``.npy`` array named
+after a hash of the file path, its size and modification time and the
+extraction parameters, so that they are extracted again when any of
+them changes. Datasets hold :class:`CachedArray` references to these
+arrays instead of the features, which are memory-mapped when batched.
+"""
+import hashlib
+import os
+
+import numpy as np
+import torch
+
+
+class CachedArray(object):
+    """Reference to features saved in a :class:`FeatureCache`.
+
+    Args:
+        path (str): The ``.npy`` file of the features.
+        shape (tuple[int]): Their shape.
+    """
+
+    def __init__(self, path, shape):
+        self.path = path
+        self.shape = tuple(shape)
+
+    def size(self, dim=None):
+        """Like ``torch.Tensor.size``."""
+        if dim is None:
+            return torch.Size(self.shape)
+        return self.shape[dim]
+
+    def load(self):
+        """The features, as a ``torch.FloatTensor``."""
+        array = np.load(self.path, mmap_mode="r")
+        return torch.from_numpy(array.astype(np.float32))
+
+
+def load_features(value):
+    """The features of ``value`` if it is a :class:`CachedArray`, else
+    ``value``."""
+    return value.load() if isinstance(value, CachedArray) else value
+
+
+class FeatureCache(object):
+    """Features of media files saved in ``cache_dir``."""
+
+    def __init__(self, cache_dir):
+        # the paths of the features are saved in the shards, and used
+        # from other working directories
+        self.cache_dir = os.path.abspath(cache_dir)
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def _path(self, path, params):
+        stat = os.stat(path)
+        # st_mtime_ns is not in python 2
+        key = repr((os.path.abspath(path), stat.st_size,
+                    int(stat.st_mtime * 1e9), sorted(params.items())))
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".npy")
+
+    def get(self, path, params, extract):
+        """The features of ``path`` extracted with ``params``.
+
+        Args:
+            path (str): The media file.
+            params (dict): The extraction parameters.
+            extract (callable): Extract the features of ``path`` as a
+                tensor, if they are not in the cache yet.
+
+        Returns:
+            CachedArray: A reference to the cached features.
+        """
+
+        cache_path = self._path(path, params)
+        if os.path.exists(cache_path):
+            return CachedArray(
+                cache_path, np.load(cache_path, mmap_mode="r").shape)
+        array = extract(path).numpy().astype(np.float16)
+        # concurrent extractions of the same file write the same array
+        tmp_path = "%s.%d.tmp" % (cache_path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.rename(tmp_path, cache_path)
+        return CachedArray(cache_path, array.shape)
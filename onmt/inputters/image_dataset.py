@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
 import os
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+from operator import methodcaller
 
 import torch
 from torchtext.data import Field
@@ -16,6 +19,38 @@ except ImportError:
     Image, transforms, cv2 = None, None, None
 
 
+def _load_image(img_path, channel_size):
+    if channel_size == 1:
+        return transforms.ToTensor()(
+            Image.fromarray(cv2.imread(img_path, 0)))
+    return transforms.ToTensor()(Image.open(img_path))
+
+
+class LazyImage(object):
+    """An image read from disk when it is batched.
+
+    Args:
+        path (str): The image file.
+        shape (tuple[int]): ``(channels, height, width)`` of the image.
+        channel_size (int): See :class:`ImageDataReader`.
+    """
+
+    def __init__(self, path, shape, channel_size):
+        self.path = path
+        self.shape = tuple(shape)
+        self.channel_size = channel_size
+
+    def size(self, dim=None):
+        """Like ``torch.Tensor.size``."""
+        if dim is None:
+            return torch.Size(self.shape)
+        return self.shape[dim]
+
+    def load(self):
+        """The image, as a ``torch.FloatTensor``."""
+        return _load_image(self.path, self.channel_size)
+
+
 class ImageDataReader(DataReaderBase):
     """Read image data from disk.
 
@@ -23,20 +58,23 @@ class ImageDataReader(DataReaderBase):
         truncate (tuple[int] or NoneType): maximum img size. Use
             ``(0,0)`` or ``None`` for unlimited.
         channel_size (int): Number of channels per image.
+        lazy (bool): only read the size of the images, which are
+            decoded when they are batched (see :class:`LazyImage`).
 
     Raises:
         onmt.inputters.datareader_base.MissingDependencyException: If
             importing any of ``PIL``, ``torchvision``, or ``cv2`` fail.
     """
 
-    def __init__(self, truncate=None, channel_size=3):
+    def __init__(self, truncate=None, channel_size=3, lazy=False):
         self._check_deps()
         self.truncate = truncate
         self.channel_size = channel_size
+        self.lazy = lazy
 
     @classmethod
     def from_opt(cls, opt):
-        return cls(channel_size=opt.image_channel_size)
+        return cls(channel_size=opt.image_channel_size, lazy=opt.lazy_images)
 
     @classmethod
     def _check_deps(cls):
@@ -58,6 +96,7 @@ class ImageDataReader(DataReaderBase):
 
         Yields:
             a dictionary containing image data, path and index for each line.
+            The image data is a :class:`LazyImage` in lazy mode.
         """
         if isinstance(images, str):
             images = DataReaderBase._read_file(images)
@@ -71,11 +110,16 @@ class ImageDataReader(DataReaderBase):
             assert os.path.exists(img_path), \
                 'img path %s not found' % filename
 
-            if self.channel_size == 1:
-                img = transforms.ToTensor()(
-                    Image.fromarray(cv2.imread(img_path, 0)))
+            if self.lazy:
+                # only the header of the image is read
+                with Image.open(img_path) as header:
+                    width, height = header.size
+                    channels = 1 if self.channel_size == 1 \
+                        else len(header.getbands())
+                img = LazyImage(
+                    img_path, (channels, height, width), self.channel_size)
             else:
-                img = transforms.ToTensor()(Image.open(img_path))
+                img = _load_image(img_path, self.channel_size)
             if self.truncate and self.truncate != (0, 0):
                 if not (img.size(1) <= self.truncate[0]
                         and img.size(2) <= self.truncate[1]):
@@ -89,7 +133,9 @@ def img_sort_key(ex):
 
 
 def batch_img(data, vocab):
-    """Pad and batch a sequence of images."""
+    """Pad and batch a sequence of images, loading the lazy ones."""
+    data = [img.load() if isinstance(img, LazyImage) else img
+            for img in data]
     c = data[0].size(0)
     h = max([t.size(1) for t in data])
     w = max([t.size(2) for t in data])
@@ -99,8 +145,65 @@ def batch_img(data, vocab):
     return imgs
 
 
-def image_fields(**kwargs):
+class ImageBatcher(object):
+    """Like :func:`batch_img`, with the lazy images loaded by a pool of
+    threads.
+
+    Args:
+        num_threads (int): number of threads loading the images.
+        cache_size (int): number of loaded images kept in memory, the
+            least recently used being dropped. No cache if 0.
+    """
+
+    def __init__(self, num_threads=4, cache_size=0):
+        self.num_threads = num_threads
+        self.cache_size = cache_size
+        self._pool = None
+        self._cache = OrderedDict()
+
+    def __getstate__(self):
+        # the pool and the cache are not shared with other processes
+        state = dict(self.__dict__)
+        state["_pool"] = None
+        state["_cache"] = OrderedDict()
+        return state
+
+    def _load(self, images):
+        if self.num_threads > 1 and len(images) > 1:
+            if self._pool is None:
+                self._pool = ThreadPool(self.num_threads)
+            return self._pool.map(methodcaller("load"), images)
+        return [img.load() for img in images]
+
+    def __call__(self, data, vocab):
+        data = list(data)
+        missing = OrderedDict()
+        for i, img in enumerate(data):
+            if not isinstance(img, LazyImage):
+                continue
+            key = (img.path, img.channel_size)
+            if key in self._cache:
+                # move_to_end is not in python 2
+                data[i] = self._cache[key] = self._cache.pop(key)
+            else:
+                missing.setdefault(key, []).append(i)
+        if missing:
+            loaded = self._load([data[ids[0]] for ids in missing.values()])
+            for (key, ids), img in zip(missing.items(), loaded):
+                for i in ids:
+                    data[i] = img
+                if self.cache_size > 0:
+                    self._cache[key] = img
+                    if len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        return batch_img(data, vocab)
+
+
+def image_fields(num_threads=4, cache_size=0, **kwargs):
+    """The field of images, loaded by an :class:`ImageBatcher` with
+    ``num_threads`` and ``cache_size``."""
     img = Field(
         use_vocab=False, dtype=torch.float,
-        postprocessing=batch_img, sequential=False)
+        postprocessing=ImageBatcher(num_threads, cache_size),
+        sequential=False)
     return img
@@ -2,20 +2,39 @@
 import glob
 import os
 import codecs
+import json
 import math
+import random
+import threading
 
-from collections import Counter, defaultdict
-from itertools import chain, cycle
+from collections import Counter, defaultdict, deque
+from functools import partial
+from itertools import chain, islice
 
+import numpy as np
+import six
 import torch
+import torch.multiprocessing
+from six.moves import queue
 import torchtext.data
 from torchtext.data import Field
 from torchtext.vocab import Vocab
 
-from onmt.inputters.text_dataset import text_fields, TextMultiField
+from onmt.inputters.text_dataset import text_fields, TextMultiField, \
+    text_sort_key, TextDataReader, _layer_tokenize_kwargs
+from onmt.inputters.dataset_base import Dataset, example_lengths
+from onmt.inputters.example_store import ExampleViews, batch_values
 from onmt.inputters.image_dataset import image_fields
 from onmt.inputters.audio_dataset import audio_fields
+from onmt.inputters.mmap_dataset import MmapDataset, is_mmap_shard, \
+    MMAP_EXT
+from onmt.inputters.manifest import manifest_path, load_manifest, \
+    epoch_batches
+from onmt.inputters.token_counts import TokenCounts, merge_counts, \
+    most_common
 from onmt.utils.logging import logger
+from onmt.utils.misc import corpus_shards, read_shard
+from onmt.utils.tokenization import build_tokenizer, tokenize
 # backwards compatibility
 from onmt.inputters.text_dataset import _feature_tokenize  # noqa: F401
 from onmt.inputters.image_dataset import (  # noqa: F401
@@ -24,6 +43,9 @@ from onmt.inputters.image_dataset import (  # noqa: F401
 import gc
 
 
+COUNTS_EXT = ".counts"
+
+
 # monkey-patch to make torchtext Vocab's pickleable
 def _getstate(self):
     return dict(self.__dict__, stoi=dict(self.stoi))
@@ -38,24 +60,42 @@ Vocab.__getstate__ = _getstate
 Vocab.__setstate__ = _setstate
 
 
+def _flat_positions(data):
+    """Concatenate the sequences of ``data``. Returns the concatenated
+    values and the position and batch index of each of them."""
+    lengths = np.array([len(t) for t in data], dtype=np.int64)
+    starts = np.cumsum(lengths) - lengths
+    flat = torch.cat([torch.as_tensor(t).long() for t in data])
+    batch_idx = np.repeat(np.arange(len(data)), lengths)
+    pos = np.arange(flat.size(0)) - np.repeat(starts, lengths)
+    return flat, torch.from_numpy(pos), torch.from_numpy(batch_idx), \
+        int(lengths.max())
+
+
 def make_src(data, vocab):
-    src_size = max([t.size(0) for t in data])
-    src_vocab_size = max([t.max() for t in data]) + 1
+    flat, pos, batch_idx, src_size = _flat_positions(data)
+    src_vocab_size = int(flat.max()) + 1
     alignment = torch.zeros(src_size, len(data), src_vocab_size)
-    for i, sent in enumerate(data):
-        for j, t in enumerate(sent):
-            alignment[j, i, t] = 1
+    alignment[pos, batch_idx, flat] = 1
     return alignment
 
 
 def make_tgt(data, vocab):
-    tgt_size = max([t.size(0) for t in data])
+    flat, pos, batch_idx, tgt_size = _flat_positions(data)
     alignment = torch.zeros(tgt_size, len(data)).long()
-    for i, sent in enumerate(data):
-        alignment[:sent.size(0), i] = sent
+    alignment[pos, batch_idx] = flat
     return alignment
 
 
+def make_src_index(data, vocab):
+    """Index form of :func:`make_src`: the copy-vocab id of each source
+    token, ``(src_len, batch)``. Padding positions get id -1."""
+    flat, pos, batch_idx, src_size = _flat_positions(data)
+    src_map = torch.full((src_size, len(data)), -1, dtype=torch.long)
+    src_map[pos, batch_idx] = flat
+    return src_map
+
+
 def get_fields(
     src_data_type,
     n_src_feats,
@@ -65,7 +105,8 @@ def get_fields(
     eos='</s>',
     dynamic_dict=False,
     src_truncate=None,
-    tgt_truncate=None
+    tgt_truncate=None,
+    src_map_index=False
 ):
     """
     Args:
@@ -86,6 +127,8 @@ def get_fields(
             ``src_data_type``'s data reader - see there for more details).
         tgt_truncate: Cut off tgt sequences beyond this (passed to
             :class:`TextDataReader` - see there for more details).
+        src_map_index (bool): Batch the source map as copy-vocab ids
+            instead of one-hot vectors (see :func:`src_map_field`).
 
     Returns:
         A dict mapping names to fields. These names need to match
@@ -120,10 +163,7 @@ def get_fields(
     fields["indices"] = indices
 
     if dynamic_dict:
-        src_map = Field(
-            use_vocab=False, dtype=torch.float,
-            postprocessing=make_src, sequential=False)
-        fields["src_map"] = src_map
+        fields["src_map"] = src_map_field(src_map_index)
 
         align = Field(
             use_vocab=False, dtype=torch.long,
@@ -133,6 +173,26 @@ def get_fields(
     return fields
 
 
+def src_map_field(index=False):
+    """The field batching the copy-vocab ids of the source tokens.
+
+    Args:
+        index (bool): Give the ids themselves, as a ``(src_len, batch)``
+            LongTensor (see :func:`make_src_index`), instead of a
+            one-hot ``(src_len, batch, extra_words)`` FloatTensor (see
+            :func:`make_src`). :class:`onmt.modules.CopyGenerator`
+            accepts both.
+    """
+
+    if index:
+        return Field(
+            use_vocab=False, dtype=torch.long,
+            postprocessing=make_src_index, sequential=False)
+    return Field(
+        use_vocab=False, dtype=torch.float,
+        postprocessing=make_src, sequential=False)
+
+
 def load_old_vocab(vocab, data_type="text", dynamic_dict=False):
     """Update a legacy vocab/field format.
 
@@ -235,6 +295,22 @@ def old_style_vocab(vocab):
         _old_style_nesting(vocab)
 
 
+def load_dataset(path):
+    """Load a dataset shard saved by ``preprocess.py``.
+
+    Args:
+        path (str): A pickled ``*.pt`` shard or a binary shard.
+
+    Returns:
+        :class:`onmt.inputters.Dataset` or
+        :class:`onmt.inputters.mmap_dataset.MmapDataset`
+    """
+
+    if is_mmap_shard(path):
+        return MmapDataset(path)
+    return torch.load(path)
+
+
 def filter_example(ex, use_src_len=True, use_tgt_len=True,
                    min_src_len=1, max_src_len=float('inf'),
                    min_tgt_len=1, max_tgt_len=float('inf')):
@@ -263,6 +339,50 @@ def filter_example(ex, use_src_len=True, use_tgt_len=True,
         (not use_tgt_len or min_tgt_len <= tgt_len <= max_tgt_len)
 
 
+def filter_raw_example(ex_dict, min_src_len=1, max_src_len=float('inf'),
+                       min_tgt_len=1, max_tgt_len=float('inf'),
+                       src_truncate=None, tgt_truncate=None, max_ratio=0):
+    """Return why a raw example is rejected, ``None`` if it is not.
+
+    The same as :func:`filter_example`, from the text read for the
+    example before the example is built (see
+    :class:`onmt.inputters.Dataset` ``raw_filter``). Only the text sides
+    of the example are checked. If used as ``raw_filter``, use
+    :func:`partial()` for all keyword arguments.
+
+    Args:
+        ex_dict (dict): The example read, with the ``src`` and ``tgt``
+            text whose tokens are joined by whitespace.
+        src_truncate (int or NoneType): The source is truncated to this
+            number of tokens.
+        tgt_truncate (int or NoneType): Similar to above.
+        max_ratio (float): Maximum ratio of the lengths of the source
+            and the target, not checked if 0.
+        The others are those of :func:`filter_example`.
+
+    Returns:
+        str or NoneType: ``"length"`` or ``"ratio"``.
+    """
+
+    lengths = {}
+    for side, truncate in [("src", src_truncate), ("tgt", tgt_truncate)]:
+        value = ex_dict.get(side)
+        if isinstance(value, six.string_types):
+            length = len(value.split())
+            lengths[side] = length if truncate is None \
+                else min(length, truncate)
+    src_len = lengths.get("src")
+    tgt_len = lengths.get("tgt")
+    if src_len is not None and not min_src_len <= src_len <= max_src_len:
+        return "length"
+    if tgt_len is not None and not min_tgt_len <= tgt_len <= max_tgt_len:
+        return "length"
+    if max_ratio and src_len is not None and tgt_len is not None and \
+            max(src_len, tgt_len) > max_ratio * max(min(src_len, tgt_len), 1):
+        return "ratio"
+    return None
+
+
 def _pad_vocab_to_multiple(vocab, multiple):
     vocab_size = len(vocab)
     if vocab_size % multiple == 0:
@@ -276,10 +396,7 @@ def _pad_vocab_to_multiple(vocab, multiple):
 
 def _build_field_vocab(field, counter, size_multiple=1, **kwargs):
     # this is basically copy-pasted from torchtext.
-    all_specials = [
-        field.unk_token, field.pad_token, field.init_token, field.eos_token
-    ]
-    specials = [tok for tok in all_specials if tok is not None]
+    specials = _field_specials(field)
     field.vocab = field.vocab_cls(counter, specials=specials, **kwargs)
     if size_multiple > 1:
         _pad_vocab_to_multiple(field.vocab, size_multiple)
@@ -290,32 +407,101 @@ def _load_vocab(vocab_path, name, counters):
     vocab = _read_vocab_file(vocab_path, name)
     vocab_size = len(vocab)
     logger.info('Loaded %s vocab has %d tokens.' % (name, vocab_size))
-    for i, token in enumerate(vocab):
-        # keep the order of tokens specified in the vocab file by
-        # adding them to the counter with decreasing counting values
-        counters[name][token] = vocab_size - i
+    # keep the order of tokens specified in the vocab file by
+    # adding them to the counter with decreasing counting values
+    counters[name].update(
+        {token: vocab_size - i for i, token in enumerate(vocab)})
     return vocab, vocab_size
 
 
+def _field_specials(field):
+    all_specials = [
+        field.unk_token, field.pad_token, field.init_token, field.eos_token
+    ]
+    return [tok for tok in all_specials if tok is not None]
+
+
 def _build_fv_from_multifield(multifield, counters, build_fv_args,
                               size_multiple=1):
     for name, field in multifield:
+        # only the counts of the tokens of the vocab are loaded
+        counter = most_common(
+            counters[name].items(), specials=_field_specials(field),
+            **build_fv_args[name])
         _build_field_vocab(
             field,
-            counters[name],
+            counter,
             size_multiple=size_multiple,
             **build_fv_args[name])
         logger.info(" * %s vocab size: %d." % (name, len(field.vocab)))
 
 
+def count_tokens(examples, fields, skip_names=(), counters=None):
+    """Count the tokens of the sequential fields of some examples.
+
+    Args:
+        examples (Iterable[torchtext.data.Example]): Examples to count.
+        fields (dict[str, Field]): Fields of the examples.
+        skip_names (Iterable[str]): (Sub)field names not to count.
+        counters (dict[str, Counter] or NoneType): Counters to update.
+            A new ``defaultdict(Counter)`` is used if not given.
+
+    Returns:
+        dict[str, Counter]: ``counters``, keyed by (sub)field name.
+    """
+
+    if counters is None:
+        counters = defaultdict(Counter)
+    for ex in examples:
+        for name, field in fields.items():
+            try:
+                f_iter = iter(field)
+            except TypeError:
+                f_iter = [(name, field)]
+                all_data = [getattr(ex, name, None)]
+            else:
+                all_data = getattr(ex, name)
+            for (sub_n, sub_f), fd in zip(
+                    f_iter, all_data):
+                if sub_f.sequential and sub_n not in skip_names:
+                    counters[sub_n].update(fd)
+    return counters
+
+
+def counts_path(data_path):
+    """Location of the token counts saved next to a dataset shard."""
+    return os.path.splitext(data_path)[0] + COUNTS_EXT
+
+
+def _shard_counts(fields, skip_names, path):
+    """Token counts of a train dataset file, keyed by (sub)field name."""
+    if os.path.exists(counts_path(path)):
+        logger.info(" * merging token counts of %s." % path)
+        counters = torch.load(counts_path(path))
+    else:
+        logger.info(" * reloading %s." % path)
+        dataset = load_dataset(path)
+        counters = count_tokens(dataset.examples, fields, skip_names)
+    return {name: counter for name, counter in counters.items()
+            if name not in skip_names}
+
+
 def build_vocab(train_dataset_files, fields, data_type, share_vocab,
                 src_vocab_path, src_vocab_size, src_words_min_frequency,
                 tgt_vocab_path, tgt_vocab_size, tgt_words_min_frequency,
-                vocab_size_multiple=1):
+                vocab_size_multiple=1, num_workers=1, max_counts=0,
+                spill_dir=None):
     """Build the fields for all data sides.
 
+    The tokens are counted by ``num_workers`` processes. The counts of
+    each (sub)field are spilled to disk beyond ``max_counts`` distinct
+    tokens, and only the counts of the tokens of the vocabularies are
+    loaded back (see :mod:`onmt.inputters.token_counts`).
+
     Args:
-        train_dataset_files: a list of train dataset pt file.
+        train_dataset_files: a list of train dataset pt file. The token
+            counts saved next to a file (see :func:`counts_path`) are
+            used instead of reloading it when they exist.
         fields (dict[str, Field]): fields to build vocab for.
         data_type (str): A supported data type string.
         share_vocab (bool): share source and target vocabulary?
@@ -329,12 +515,33 @@ def build_vocab(train_dataset_files, fields, data_type, share_vocab,
             include a target word in the vocabulary.
         vocab_size_multiple (int): ensure that the vocabulary size is a
             multiple of this value.
+        num_workers (int): number of processes counting the tokens of
+            the train dataset files.
+        max_counts (int): number of distinct tokens of a (sub)field
+            counted in memory, no limit if 0.
+        spill_dir (str or NoneType): directory where the counts are
+            spilled, the default temporary directory if ``None``.
 
     Returns:
         Dict of Fields
     """
 
-    counters = defaultdict(Counter)
+    counters = defaultdict(partial(TokenCounts, max_counts, spill_dir))
+    try:
+        return _build_vocab(
+            counters, train_dataset_files, fields, data_type, share_vocab,
+            src_vocab_path, src_vocab_size, src_words_min_frequency,
+            tgt_vocab_path, tgt_vocab_size, tgt_words_min_frequency,
+            vocab_size_multiple, num_workers)
+    finally:
+        for counts in counters.values():
+            counts.close()
+
+
+def _build_vocab(counters, train_dataset_files, fields, data_type,
+                 share_vocab, src_vocab_path, src_vocab_size,
+                 src_words_min_frequency, tgt_vocab_path, tgt_vocab_size,
+                 tgt_words_min_frequency, vocab_size_multiple, num_workers):
 
     if src_vocab_path:
         try:
@@ -361,34 +568,21 @@ def build_vocab(train_dataset_files, fields, data_type, share_vocab,
     else:
         tgt_vocab = None
 
-    for i, path in enumerate(train_dataset_files):
-        dataset = torch.load(path)
-        logger.info(" * reloading %s." % path)
-        for ex in dataset.examples:
-            for name, field in fields.items():
-                try:
-                    f_iter = iter(field)
-                except TypeError:
-                    f_iter = [(name, field)]
-                    all_data = [getattr(ex, name, None)]
-                else:
-                    all_data = getattr(ex, name)
-                for (sub_n, sub_f), fd in zip(
-                        f_iter, all_data):
-                    has_vocab = (sub_n == 'src' and src_vocab) or \
-                                (sub_n == 'tgt' and tgt_vocab)
-                    if sub_f.sequential and not has_vocab:
-                        val = fd
-                        counters[sub_n].update(val)
-
-        # Drop the none-using from memory but keep the last
-        if i < len(train_dataset_files) - 1:
-            dataset.examples = None
-            gc.collect()
-            del dataset.examples
-            gc.collect()
-            del dataset
-            gc.collect()
+    skip_names = [name for name, vocab in [("src", src_vocab),
+                                           ("tgt", tgt_vocab)] if vocab]
+    shard_counts = partial(_shard_counts, fields, skip_names)
+    if num_workers > 1 and len(train_dataset_files) > 1:
+        pool = torch.multiprocessing.Pool(num_workers)
+        results = pool.imap_unordered(shard_counts, train_dataset_files)
+    else:
+        pool = None
+        results = map(shard_counts, train_dataset_files)
+    for shard_counters in results:
+        for name, counter in shard_counters.items():
+            counters[name].update(counter)
+    if pool is not None:
+        pool.close()
+        pool.join()
 
     build_fv_args = defaultdict(dict)
     build_fv_args["src"] = dict(
@@ -414,22 +608,24 @@ def build_vocab(train_dataset_files, fields, data_type, share_vocab,
             src_field = src_multifield.base_field
             tgt_field = tgt_multifield.base_field
             _merge_field_vocabs(
-                src_field, tgt_field, vocab_size=src_vocab_size,
+                src_field, tgt_field,
+                merge_counts(counters["src"].items(),
+                             counters["tgt"].items()),
+                vocab_size=src_vocab_size,
                 min_freq=src_words_min_frequency,
                 vocab_size_multiple=vocab_size_multiple)
             logger.info(" * merged vocab size: %d." % len(src_field.vocab))
     return fields  # is the return necessary?
 
 
-def _merge_field_vocabs(src_field, tgt_field, vocab_size, min_freq,
+def _merge_field_vocabs(src_field, tgt_field, counts, vocab_size, min_freq,
                         vocab_size_multiple):
-    # in the long run, shouldn't it be possible to do this by calling
-    # build_vocab with both the src and tgt data?
+    # counts are the merged (token, count) of src and tgt
     specials = [tgt_field.unk_token, tgt_field.pad_token,
                 tgt_field.init_token, tgt_field.eos_token]
-    merged = sum(
-        [src_field.vocab.freqs, tgt_field.vocab.freqs], Counter()
-    )
+    merged = most_common(
+        counts, max_size=vocab_size, min_freq=min_freq,
+        specials=_field_specials(tgt_field))
     merged_vocab = Vocab(
         merged, specials=specials,
         max_size=vocab_size, min_freq=min_freq
@@ -495,29 +691,186 @@ def batch_iter(data, batch_size, batch_size_fn=None, batch_size_multiple=1):
         yield minibatch
 
 
+def _full_count(tok_lengths, start, low, batch_size, guess):
+    """Smallest ``count >= low`` such that the ``count`` examples from
+    ``start`` make a batch of at least ``batch_size``, searched from
+    ``guess``. Returns ``(count, size)``, or ``None`` if there is none.
+
+    The size of a batch is its number of examples times their maximum
+    length, so it grows with ``count``: the sizes of a window of counts
+    are searched at once, in a window doubled until it has the count.
+    """
+
+    # every example has a length >= 1, so batch_size examples are full
+    high = min(max(batch_size, low), len(tok_lengths) - start)
+    if low > high:
+        return None
+    window = min(max(2 * guess, low), high)
+    while True:
+        sizes = np.arange(1, window + 1) * np.maximum.accumulate(
+            tok_lengths[start:start + window])
+        count = max(int(np.searchsorted(sizes, batch_size)) + 1, low)
+        if count <= window:
+            return count, int(sizes[count - 1])
+        if window == high:
+            return None
+        window = min(2 * window, high)
+
+
+def plan_batches(src_lengths, tgt_lengths, batch_size, batch_type="sents",
+                 batch_size_multiple=1):
+    """Split a sequence of examples into consecutive batches.
+
+    This gives the same batches as :func:`batch_iter`, computed from the
+    example lengths only. With ``batch_type="tokens"``, the size of a
+    batch is its number of src or tgt tokens once padded, counting
+    ``<s>``/``</s>``, whichever is larger.
+
+    Args:
+        src_lengths (numpy.ndarray): src length of each example.
+        tgt_lengths (numpy.ndarray or NoneType): tgt length of each
+            example, if any.
+        batch_size (int): maximum batch size.
+        batch_type (str): ``"sents"`` or ``"tokens"``.
+        batch_size_multiple (int): number of examples of a batch is a
+            multiple of this value, except for the last batch.
+
+    Returns:
+        List[Tuple[int, int]]: ``(start, end)`` of each batch. A batch can
+        be empty when one example is over ``batch_size`` on its own.
+    """
+
+    n = len(src_lengths)
+    if n == 0:
+        return []
+    if batch_type == "tokens":
+        # Src: [<bos> w1 ... wN <eos>], Tgt: [w1 ... wM <eos>]
+        tok_lengths = np.asarray(src_lengths, dtype=np.int64) + 2
+        if tgt_lengths is not None:
+            tok_lengths = np.maximum(
+                tok_lengths, np.asarray(tgt_lengths, dtype=np.int64) + 1)
+    else:
+        tok_lengths = np.ones(n, dtype=np.int64)
+
+    bounds = []
+    start, carried, count = 0, 0, 1
+    while start < n:
+        # carried examples only count towards the size once a new example
+        # is added; sorted examples give batches of similar counts
+        found = _full_count(
+            tok_lengths, start, carried + 1, batch_size, count)
+        if found is None:
+            bounds.append((start, n))
+            break
+        count, size = found
+        overflowed = int(size > batch_size)
+        if batch_size_multiple > 1:
+            overflowed += (count - overflowed) % batch_size_multiple
+        bounds.append((start, start + count - overflowed))
+        start += count - overflowed
+        carried = overflowed
+    return bounds
+
+
+def make_batch(dataset, minibatch, device=None):
+    """Same as ``torchtext.data.Batch(minibatch, dataset, device)``, with
+    the text of numericalized examples taken from their vocab ids (see
+    :func:`onmt.inputters.example_store.batch_values`)."""
+
+    tensors = {name: field.process(
+        batch_values(minibatch, name), device=device)
+        for name, field in dataset.fields.items() if field is not None}
+    return torchtext.data.Batch.fromvars(
+        dataset, len(minibatch), **tensors)
+
+
+class _RandomShuffler(object):
+    """Drop-in for :class:`torchtext.data.utils.RandomShuffler` that
+    draws from its own :class:`random.Random` instead of swapping the
+    global random state, so iterators can shuffle on different threads.
+    It gives the same permutations as the torchtext shuffler."""
+
+    def __init__(self, random_state=None):
+        self._random = random.Random()
+        self._random.setstate(
+            random.getstate() if random_state is None else random_state)
+
+    @property
+    def random_state(self):
+        return self._random.getstate()
+
+    @random_state.setter
+    def random_state(self, s):
+        self._random.setstate(s)
+
+    def __call__(self, data):
+        """Shuffle and return a new list."""
+        return self._random.sample(data, len(data))
+
+
 class OrderedIterator(torchtext.data.Iterator):
+    """Iterator yielding batches of similar lengths.
+
+    In training, the shuffled examples are taken by pools of
+    ``100 * batch_size``, each pool is sorted and split into batches and
+    these batches are shuffled. Batches are planned from the example
+    lengths (see :func:`plan_batches`).
+
+    Args:
+        batch_type (str): ``"sents"`` or ``"tokens"``, the unit of
+            ``batch_size`` in training.
+        batch_size_multiple (int): See :func:`plan_batches`.
+    """
 
     def __init__(self,
                  dataset,
                  batch_size,
                  batch_size_multiple=1,
+                 batch_type="sents",
                  **kwargs):
         super(OrderedIterator, self).__init__(dataset, batch_size, **kwargs)
         self.batch_size_multiple = batch_size_multiple
+        self.batch_type = batch_type
+        self.random_shuffler = _RandomShuffler()
+
+    def _sort_pool(self, pool, src_lengths, tgt_lengths):
+        if self.sort_key is not text_sort_key:
+            return np.array(sorted(
+                pool, key=lambda i: self.sort_key(self.dataset[i])),
+                dtype=np.int64)
+        if tgt_lengths is None:
+            keys = (src_lengths[pool],)
+        else:
+            keys = (tgt_lengths[pool], src_lengths[pool])
+        return pool[np.lexsort(keys)]
+
+    def _pool(self):
+        lengths = getattr(self.dataset, "lengths", None)
+        if not isinstance(lengths, dict):
+            # plain torchtext datasets (their __getattr__ is a generator)
+            # or datasets saved before the lengths were stored
+            lengths = example_lengths(self.dataset.examples)
+        src_lengths = lengths["src"]
+        tgt_lengths = lengths.get("tgt")
+        order = np.array(
+            self.random_shuffler(range(len(self.dataset))), dtype=np.int64)
+        pool_size = self.batch_size * 100
+        for p in range(0, len(order), pool_size):
+            pool = self._sort_pool(
+                order[p:p + pool_size], src_lengths, tgt_lengths)
+            p_batch = plan_batches(
+                src_lengths[pool],
+                tgt_lengths[pool] if tgt_lengths is not None else None,
+                self.batch_size,
+                batch_type=self.batch_type,
+                batch_size_multiple=self.batch_size_multiple)
+            for start, end in self.random_shuffler(p_batch):
+                if end > start:
+                    yield [self.dataset[i] for i in pool[start:end].tolist()]
 
     def create_batches(self):
         if self.train:
-            def _pool(data, random_shuffler):
-                for p in torchtext.data.batch(data, self.batch_size * 100):
-                    p_batch = batch_iter(
-                        sorted(p, key=self.sort_key),
-                        self.batch_size,
-                        batch_size_fn=self.batch_size_fn,
-                        batch_size_multiple=self.batch_size_multiple)
-                    for b in random_shuffler(list(p_batch)):
-                        yield b
-
-            self.batches = _pool(self.data(), self.random_shuffler)
+            self.batches = self._pool()
         else:
             self.batches = []
             for b in batch_iter(
@@ -527,6 +880,158 @@ class OrderedIterator(torchtext.data.Iterator):
                     batch_size_multiple=self.batch_size_multiple):
                 self.batches.append(sorted(b, key=self.sort_key))
 
+    def minibatches(self):
+        """Yield the lists of examples that iterating over ``self`` turns
+        into :class:`torchtext.data.Batch` objects, for one epoch."""
+        self.init_epoch()
+        for idx, minibatch in enumerate(self.batches):
+            # fast-forward if loaded from state
+            if self._iterations_this_epoch > idx:
+                continue
+            self.iterations += 1
+            self._iterations_this_epoch += 1
+            if self.sort_within_batch:
+                if self.sort:
+                    minibatch.reverse()
+                else:
+                    minibatch.sort(key=self.sort_key, reverse=True)
+            yield minibatch
+
+    def __iter__(self):
+        while True:
+            for minibatch in self.minibatches():
+                yield make_batch(self.dataset, minibatch, self.device)
+            if not self.repeat:
+                return
+
+
+_collate_fields = None
+
+
+def _init_collate_worker(fields):
+    global _collate_fields
+    _collate_fields = fields
+    # the training process already uses the cores
+    torch.set_num_threads(1)
+
+
+def _collate(data):
+    # Same as building a torchtext Batch, on CPU.
+    return {name: _collate_fields[name].process(values)
+            for name, values in data.items()}
+
+
+class _BatchCollator(object):
+    """Turn minibatches into :class:`torchtext.data.Batch` objects in a
+    pool of worker processes.
+
+    Workers are spawned on first use and reused until :func:`close`.
+    Their tensors are handed over through shared memory.
+
+    Args:
+        fields (dict[str, Field]): fields of the examples.
+        num_workers (int): number of worker processes.
+        queue_size (int): maximum number of batches being built ahead of
+            the one being consumed.
+        device: See :class:`OrderedIterator` ``device``.
+    """
+
+    def __init__(self, fields, num_workers, queue_size, device):
+        self.fields = fields
+        self.num_workers = num_workers
+        self.queue_size = max(queue_size, 1)
+        self.device = device
+        self._pool = None
+
+    def _submit(self, dataset, minibatch):
+        if self._pool is None:
+            ctx = torch.multiprocessing.get_context("spawn")
+            self._pool = ctx.Pool(
+                self.num_workers, initializer=_init_collate_worker,
+                initargs=(self.fields,))
+        data = {name: batch_values(minibatch, name)
+                for name in dataset.fields}
+        return dataset, len(minibatch), self._pool.apply_async(
+            _collate, (data,))
+
+    def _finish(self, dataset, batch_size, result):
+        tensors = result.get()
+        if torch.device(self.device).type != "cpu":
+            tensors = {name: tuple(t.to(self.device) for t in v)
+                       if isinstance(v, tuple) else v.to(self.device)
+                       for name, v in tensors.items()}
+        return torchtext.data.Batch.fromvars(
+            dataset, batch_size, **tensors)
+
+    def close(self, terminate=False):
+        """Stop the workers, once they are done with their batches unless
+        ``terminate``. They are spawned again by the next batch."""
+        if self._pool is None:
+            return
+        if terminate:
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        self._pool.join()
+        self._pool = None
+
+    def __call__(self, minibatches):
+        """Yield the batches of ``(dataset, minibatch)`` pairs, in order."""
+        pending = deque()
+        for dataset, minibatch in minibatches:
+            pending.append(self._submit(dataset, minibatch))
+            if len(pending) > self.queue_size:
+                yield self._finish(*pending.popleft())
+        while pending:
+            yield self._finish(*pending.popleft())
+
+
+class _ShardPrefetcher(object):
+    """Call ``load`` on each of ``paths`` on a background thread.
+
+    At most ``size`` results are loaded ahead of the one in use: a slot
+    is taken before loading a path and given back when the consumer
+    takes the result.
+    """
+
+    def __init__(self, load, paths, size):
+        self._load = load
+        self._paths = paths
+        self._slots = threading.Semaphore(size)
+        self._results = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for path in self._paths:
+                self._slots.acquire()
+                if self._closed:
+                    return
+                # collect the shards released by the consumer
+                gc.collect()
+                self._results.put((self._load(path), None))
+        except Exception as err:
+            self._results.put((None, err))
+        else:
+            self._results.put((None, None))
+
+    def __iter__(self):
+        while True:
+            result, err = self._results.get()
+            if err is not None:
+                raise err
+            if result is None:
+                return
+            self._slots.release()
+            yield result
+
+    def close(self):
+        self._closed = True
+        self._slots.release()
+
 
 class DatasetLazyIter(object):
     """Yield data from sharded dataset files.
@@ -536,116 +1041,553 @@ class DatasetLazyIter(object):
         fields (dict[str, Field]): fields dict for the
             datasets.
         batch_size (int): batch size.
-        batch_size_fn: custom batch process function.
+        batch_type (str): See :class:`OrderedIterator` ``batch_type``.
         device: See :class:`OrderedIterator` ``device``.
         is_train (bool): train or valid?
+        prefetch (int): number of shards to load, and start batching, on
+            a background thread while the current shard is consumed.
+            Shards are loaded when they are reached if 0.
+        num_workers (int): number of worker processes building the
+            batch tensors. Batches are built by the caller if 0.
+        queue_size (int): maximum number of batches being built by the
+            workers ahead of the one being consumed.
+        rank (int): rank of this process in distributed training.
+        world_size (int): number of processes of distributed training.
+            In training, each process only yields its part of the
+            batches: the batches of its own shards if it can cycle through
+            at least one shard, otherwise one batch in ``world_size`` of
+            all the shards. Without ``repeat``, all the processes yield
+            the same number of batches.
+        manifest (dict or NoneType): manifest of the dataset files (see
+            :func:`onmt.inputters.manifest.load_manifest`). The files
+            it records as empty are skipped without being loaded.
     """
 
-    def __init__(self, dataset_paths, fields, batch_size, batch_size_fn,
+    def __init__(self, dataset_paths, fields, batch_size, batch_type,
                  batch_size_multiple, device, is_train, repeat=True,
-                 num_batches_multiple=1):
+                 num_batches_multiple=1, prefetch=0, num_workers=0,
+                 queue_size=8, rank=0, world_size=1, manifest=None):
         self._paths = dataset_paths
         self.fields = fields
         self.batch_size = batch_size
-        self.batch_size_fn = batch_size_fn
+        self.batch_type = batch_type
         self.batch_size_multiple = batch_size_multiple
         self.device = device
         self.is_train = is_train
         self.repeat = repeat
         self.num_batches_multiple = num_batches_multiple
-
-    def _iter_dataset(self, path):
-        cur_dataset = torch.load(path)
+        self.prefetch = prefetch
+        self.rank = rank
+        self.world_size = world_size
+        self._position = None
+        self._resume_state = None
+        self.manifest = manifest
+        self._collator = _BatchCollator(
+            fields, num_workers, queue_size, device) if num_workers else None
+
+    def _read_dataset(self, path):
+        cur_dataset = load_dataset(path)
         logger.info('Loading dataset from %s, number of examples: %d' %
                     (path, len(cur_dataset)))
+        return cur_dataset
+
+    def _load_dataset(self, path, iter_state=None):
+        cur_dataset = self._read_dataset(path)
         cur_dataset.fields = self.fields
+        if isinstance(cur_dataset.examples, ExampleViews):
+            # batches are then built from vocab ids
+            cur_dataset.examples.store.numericalize(self.fields)
         cur_iter = OrderedIterator(
             dataset=cur_dataset,
             batch_size=self.batch_size,
             batch_size_multiple=self.batch_size_multiple,
-            batch_size_fn=self.batch_size_fn,
+            batch_type=self.batch_type,
             device=self.device,
             train=self.is_train,
             sort=False,
             sort_within_batch=True,
             repeat=False
         )
-        for batch in cur_iter:
-            yield batch
+        if iter_state is not None:
+            # the skipped minibatches are planned, but not built
+            cur_iter.load_state_dict(iter_state)
+        return cur_dataset, cur_iter
+
+    @staticmethod
+    def _minibatches(cur_iter):
+        # each minibatch with the state of the iterator once it is taken
+        for minibatch in cur_iter.minibatches():
+            yield minibatch, cur_iter.state_dict()
+
+    def _iter_dataset(self, shard):
+        index, path, iter_state = shard
+        cur_dataset, cur_iter = self._load_dataset(path, iter_state)
+        for minibatch, state in self._minibatches(cur_iter):
+            yield cur_dataset, minibatch, index, state
 
         cur_dataset.examples = None
         gc.collect()
         del cur_dataset
         gc.collect()
 
-    def __iter__(self):
-        num_batches = 0
+    def _prefetch_dataset(self, shard):
+        # Also shuffle the shard and batch its first pool of examples
+        # in the background, by pulling the first minibatch.
+        index, path, iter_state = shard
+        cur_dataset, cur_iter = self._load_dataset(path, iter_state)
+        minibatches = self._minibatches(cur_iter)
+        try:
+            first = next(minibatches)
+        except StopIteration:
+            return cur_dataset, index, iter([])
+        return cur_dataset, index, chain([first], minibatches)
+
+    def _iter_datasets(self, shards):
+        if not self.prefetch:
+            for shard in shards:
+                for item in self._iter_dataset(shard):
+                    yield item
+            return
+        prefetcher = _ShardPrefetcher(
+            self._prefetch_dataset, shards, self.prefetch)
+        try:
+            for cur_dataset, index, minibatches in prefetcher:
+                for minibatch, state in minibatches:
+                    yield cur_dataset, minibatch, index, state
+                # the background thread collects it before loading
+                # the next shard
+                cur_dataset.examples = None
+                del cur_dataset, minibatches
+        finally:
+            prefetcher.close()
+
+    def _partition(self):
+        """Return the shards read by this rank, and whether the ranks
+        take turns on their minibatches."""
         paths = self._paths
-        if self.is_train and self.repeat:
-            # Cycle through the shards indefinitely.
-            paths = cycle(paths)
-        for path in paths:
-            for batch in self._iter_dataset(path):
+        if self.manifest is not None:
+            shards = self.manifest["shards"]
+            paths = [path for path in paths
+                     if path not in shards or shards[path]["examples"]]
+        if not self.is_train or self.world_size == 1:
+            return paths, False
+        if self.repeat and len(paths) >= self.world_size:
+            # each rank cycles through its own shards
+            return paths[self.rank::self.world_size], False
+        # all the ranks read all the shards, but only build the batches
+        # of their turns, so that they get the same number of batches
+        return paths, True
+
+    def _shards(self, paths, position):
+        # (epoch, shard) index, path and iterator state of the shards,
+        # from the position. Without repeat, epoch 1 only completes the
+        # number of batches of epoch 0.
+        epoch, start = position["epoch"], position["shard"]
+        iter_state = position["iterator"]
+        while True:
+            for i, path in islice(enumerate(paths), start, None):
+                yield (epoch, i), path, iter_state
+                iter_state = None
+            epoch, start = epoch + 1, 0
+            if not self.is_train or (not self.repeat and epoch > 1):
+                return
+
+    def _iter_minibatches(self, paths, position):
+        num_batches = position["num_batches"]
+        for cur_dataset, minibatch, (epoch, shard), iter_state in \
+                self._iter_datasets(self._shards(paths, position)):
+            if epoch > 0 and not self.repeat and \
+                    num_batches % self.num_batches_multiple == 0:
+                # When the dataset is not repeated, we might need to
+                # ensure that the number of returned batches is the
+                # multiple of a given value. This is important for multi
+                # GPU training to ensure that all workers have the same
+                # number of batches to process.
+                return
+            num_batches += 1
+            yield cur_dataset, minibatch, {
+                "epoch": epoch, "shard": shard, "iterator": iter_state,
+                "num_batches": num_batches}
+
+    def state_dict(self):
+        """Return the position of the last batch taken from ``self``,
+        to resume the iteration after it with :meth:`load_state_dict`.
+
+        The position is that of the minibatches of all the ranks when
+        they take turns on them, and that of the rank otherwise.
+        """
+
+        if self._position is None:
+            return self._resume_state
+        return dict(self._position, world_size=self.world_size,
+                    rank=self.rank)
+
+    def load_state_dict(self, state_dict):
+        """Make the next iteration over ``self`` start after the batch
+        of ``state_dict``, from :meth:`state_dict`. The shards before it
+        are not loaded, and the batches before it are not built.
+
+        ``state_dict`` can also hold the states of all the ranks, as
+        ``{"ranks": {rank: state}}``, of which the state of
+        ``self.rank`` is used."""
+
+        if state_dict is not None and "ranks" in state_dict:
+            state_dict = state_dict["ranks"].get(self.rank)
+        self._resume_state = state_dict
+
+    def _resume_position(self, resume_state, take_turns):
+        # the position to resume from, and the number of minibatches
+        # to skip after it, or None if resume_state is not usable
+        if take_turns:
+            # the other ranks took the next minibatches, up to the last
+            # rank, in turn after the rank of the position
+            return resume_state, resume_state["world_size"] - 1 - \
+                resume_state.get("rank", 0)
+        saved_by = resume_state.get("rank", 0), resume_state["world_size"]
+        if self.is_train and saved_by != (self.rank, self.world_size) and \
+                max(saved_by[1], self.world_size) > 1:
+            # each rank has its own shards
+            logger.warning(
+                "The training data position was saved by another rank "
+                "or number of ranks, starting from the beginning.")
+            return None
+        return resume_state, 0
+
+    def __iter__(self):
+        paths, take_turns = self._partition()
+        resume_state, self._resume_state = self._resume_state, None
+        resume = None
+        if resume_state is not None:
+            resume = self._resume_position(resume_state, take_turns)
+        if resume is None:
+            position = {"epoch": 0, "shard": 0, "iterator": None,
+                        "num_batches": 0}
+            skip = 0
+        else:
+            position, skip = resume
+        items = self._iter_minibatches(paths, position)
+        if take_turns:
+            items = islice(items, skip + self.rank, None, self.world_size)
+
+        positions = deque()
+
+        def track(items):
+            for cur_dataset, minibatch, item_position in items:
+                positions.append(item_position)
+                yield cur_dataset, minibatch
+
+        items = track(items)
+        if self._collator:
+            batches = self._collator(items)
+        else:
+            batches = (make_batch(cur_dataset, minibatch, self.device)
+                       for cur_dataset, minibatch in items)
+        try:
+            for batch in batches:
+                self._position = positions.popleft()
                 yield batch
-                num_batches += 1
-        if self.is_train and not self.repeat and \
-           num_batches % self.num_batches_multiple != 0:
-            # When the dataset is not repeated, we might need to ensure that
-            # the number of returned batches is the multiple of a given value.
-            # This is important for multi GPU training to ensure that all
-            # workers have the same number of batches to process.
-            for path in paths:
-                for batch in self._iter_dataset(path):
-                    yield batch
-                    num_batches += 1
-                    if num_batches % self.num_batches_multiple == 0:
-                        return
-
-
-def max_tok_len(new, count, sofar):
+        except BaseException:
+            # also when the iteration is left before its end
+            self.close(terminate=True)
+            raise
+        self.close()
+
+    def close(self, terminate=False):
+        """Stop the worker processes, once they are done unless
+        ``terminate``. This is done when an iteration over ``self`` ends,
+        and they are started again by the next one."""
+        if getattr(self, "_collator", None) is not None:
+            self._collator.close(terminate)
+
+    def __del__(self):
+        self.close(terminate=True)
+
+
+class _RawCorpus(object):
+    """Iterate over the shards of parallel text files, as the byte ranges
+    of :func:`onmt.utils.misc.corpus_shards` of both files and the slice
+    of their lines to keep, ``rank::world_size``. The files are indexed
+    on the first iteration only."""
+
+    def __init__(self, src_path, tgt_path, shard_size, rank=0,
+                 world_size=1):
+        self.src_path = src_path
+        self.tgt_path = tgt_path
+        self.shard_size = shard_size
+        self.rank = rank
+        self.world_size = world_size
+        self._shards = None
+
+    def __iter__(self):
+        if self._shards is None:
+            self._shards = list(zip(
+                corpus_shards(self.src_path, self.shard_size),
+                corpus_shards(self.tgt_path, self.shard_size)))
+        lines = slice(self.rank, None, self.world_size)
+        for src_shard, tgt_shard in self._shards:
+            yield src_shard, tgt_shard, lines
+
+
+class _RawShardBuilder(object):
+    """Build a :class:`onmt.inputters.Dataset` from a shard of parallel
+    text of :class:`_RawCorpus`: read, tokenize, filter and numericalize
+    its lines.
+
+    The dataset is returned without its fields, like a saved shard.
     """
-    In token batching scheme, the number of sequences is limited
-    such that the total number of src/tgt tokens (including padding)
-    in a batch <= batch_size
+
+    def __init__(self, fields, raw_filter=None, tokenizer_opt=None,
+                 tokenizer_root=""):
+        self.fields = fields
+        self.raw_filter = raw_filter
+        self.tokenizer_opt = tokenizer_opt
+        self.tokenizer_root = tokenizer_root
+        self._tokenizer = None
+
+    def __getstate__(self):
+        # tokenizers are built again by each worker process
+        state = dict(self.__dict__)
+        state["_tokenizer"] = None
+        return state
+
+    def _tokenize(self, lines):
+        if self.tokenizer_opt is None:
+            return lines
+        if self._tokenizer is None:
+            self._tokenizer = build_tokenizer(
+                self.tokenizer_opt, self.tokenizer_root)
+        return [tokenize(self._tokenizer, self.tokenizer_opt["type"],
+                         line.decode("utf-8").strip()) for line in lines]
+
+    def __call__(self, shard):
+        src_shard, tgt_shard, lines = shard
+        src_lines = read_shard(src_shard)[lines]
+        tgt_lines = read_shard(tgt_shard)[lines]
+        assert len(src_lines) == len(tgt_lines)
+        reader = TextDataReader()
+        dataset = Dataset(
+            self.fields,
+            readers=[reader, reader],
+            data=[("src", self._tokenize(src_lines)),
+                  ("tgt", self._tokenize(tgt_lines))],
+            dirs=[None, None],
+            sort_key=text_sort_key,
+            raw_filter=self.raw_filter
+        )
+        dataset.examples.store.numericalize(self.fields)
+        dataset.fields = []
+        return dataset
+
+
+_raw_shard_builder = None
+
+
+def _init_raw_shard_worker(builder):
+    global _raw_shard_builder
+    _raw_shard_builder = builder
+    # the training process already uses the cores
+    torch.set_num_threads(1)
+
+
+def _build_raw_shard(shard):
+    return _raw_shard_builder(shard)
+
+
+class RawTextLazyIter(DatasetLazyIter):
+    """Yield data from parallel text files, without preprocessing.
+
+    The files are read by shards of ``shard_size`` lines. The lines of
+    each shard are tokenized, filtered and numericalized with the vocabs
+    of ``fields``, and the shard is then batched like a dataset file of
+    :class:`DatasetLazyIter`. Nothing is written to disk.
+
+    Args:
+        src_path (str): source text file.
+        tgt_path (str): target text file, aligned with ``src_path``.
+        shard_size (int): number of lines of a shard, all of them if 0.
+        raw_filter (callable or NoneType): See
+            :class:`onmt.inputters.Dataset` ``raw_filter``.
+        tokenizer_opt (dict or NoneType): See
+            :func:`onmt.utils.tokenization.build_tokenizer`. The lines
+            are taken as already tokenized if ``None``.
+        tokenizer_root (str): directory the paths of ``tokenizer_opt``
+            are relative to.
+        num_shard_workers (int): number of worker processes building the
+            shards. At most two shards per worker are read ahead of the
+            one being consumed. Shards are built by the caller if 0.
+
+    The other arguments are those of :class:`DatasetLazyIter`.
     """
-    # Maintains the longest src and tgt length in the current batch
-    global max_src_in_batch, max_tgt_in_batch  # this is a hack
-    # Reset current longest length at a new batch (count=1)
-    if count == 1:
-        max_src_in_batch = 0
-        max_tgt_in_batch = 0
-    # Src: [<bos> w1 ... wN <eos>]
-    max_src_in_batch = max(max_src_in_batch, len(new.src[0]) + 2)
-    # Tgt: [w1 ... wM <eos>]
-    max_tgt_in_batch = max(max_tgt_in_batch, len(new.tgt[0]) + 1)
-    src_elements = count * max_src_in_batch
-    tgt_elements = count * max_tgt_in_batch
-    return max(src_elements, tgt_elements)
-
-
-def build_dataset_iter(corpus_type, fields, opt, is_train=True):
+
+    def __init__(self, src_path, tgt_path, fields, batch_size, batch_type,
+                 batch_size_multiple, device, is_train, shard_size=0,
+                 raw_filter=None, tokenizer_opt=None, tokenizer_root="",
+                 num_shard_workers=0, **kwargs):
+        super(RawTextLazyIter, self).__init__(
+            _RawCorpus(src_path, tgt_path, shard_size), fields, batch_size,
+            batch_type, batch_size_multiple, device, is_train, **kwargs)
+        self._builder = _RawShardBuilder(
+            fields, raw_filter, tokenizer_opt, tokenizer_root)
+        self.num_shard_workers = num_shard_workers
+        self._pool = None
+        self._stop_reading = None
+
+    def _read_dataset(self, cur_dataset):
+        # the shards are built by _build_datasets
+        logger.info('Built dataset from raw text, number of examples: %d'
+                    % len(cur_dataset))
+        return cur_dataset
+
+    def _build_datasets(self, shards):
+        # the shards are replaced by their datasets
+        if not self.num_shard_workers:
+            for index, shard, iter_state in shards:
+                yield index, self._builder(shard), iter_state
+            return
+        if self._pool is None:
+            ctx = torch.multiprocessing.get_context("spawn")
+            self._pool = ctx.Pool(
+                self.num_shard_workers, initializer=_init_raw_shard_worker,
+                initargs=(self._builder,))
+        # the pool takes a slot before building a shard, given back when
+        # the shard is consumed
+        slots = threading.Semaphore(2 * self.num_shard_workers)
+        closed = []
+        pending = deque()
+
+        def stop_reading():
+            closed.append(True)
+            slots.release()
+        self._stop_reading = stop_reading
+
+        def read_shards():
+            for index, shard, iter_state in shards:
+                slots.acquire()
+                if closed:
+                    return
+                pending.append((index, iter_state))
+                yield shard
+
+        try:
+            for cur_dataset in self._pool.imap(
+                    _build_raw_shard, read_shards()):
+                slots.release()
+                index, iter_state = pending.popleft()
+                yield index, cur_dataset, iter_state
+        finally:
+            # let the pool stop reading when the iteration is left
+            stop_reading()
+
+    def _iter_datasets(self, shards):
+        return super(RawTextLazyIter, self)._iter_datasets(
+            self._build_datasets(shards))
+
+    def close(self, terminate=False):
+        super(RawTextLazyIter, self).close(terminate)
+        if getattr(self, "_pool", None) is not None:
+            # the pool reads the shards on a thread, which waits for
+            # slots that may never be given back
+            self._stop_reading()
+            if terminate:
+                self._pool.terminate()
+            else:
+                self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def _partition(self):
+        corpus = self._paths
+        if not self.is_train or self.world_size == 1:
+            return corpus, False
+        if self.repeat:
+            # each rank cycles through its own lines of each shard
+            return _RawCorpus(
+                corpus.src_path, corpus.tgt_path, corpus.shard_size,
+                self.rank, self.world_size), False
+        return corpus, True
+
+
+def _text_truncate(field):
+    # the number of tokens a TextMultiField truncates its text to
+    kwargs = _layer_tokenize_kwargs(field.fields) or {}
+    return kwargs.get("truncate")
+
+
+def _raw_text_iter(corpus_type, fields, opt, **kwargs):
+    if corpus_type == "train":
+        src, tgt = opt.train_src, opt.train_tgt
+    else:
+        src, tgt = opt.valid_src, opt.valid_tgt
+    if not src:
+        return None
+    raw_filter = partial(
+        filter_raw_example, max_src_len=opt.src_seq_length,
+        max_tgt_len=opt.tgt_seq_length,
+        src_truncate=_text_truncate(fields["src"]),
+        tgt_truncate=_text_truncate(fields["tgt"])) \
+        if corpus_type == "train" else None
+    tokenizer_opt, tokenizer_root = None, ""
+    if opt.tokenizer_config:
+        with codecs.open(opt.tokenizer_config, "r", "utf-8") as f:
+            tokenizer_opt = json.load(f)
+        tokenizer_root = os.path.dirname(opt.tokenizer_config)
+    return RawTextLazyIter(
+        src, tgt, fields,
+        shard_size=opt.shard_size,
+        raw_filter=raw_filter,
+        tokenizer_opt=tokenizer_opt,
+        tokenizer_root=tokenizer_root,
+        num_shard_workers=opt.num_shard_workers,
+        **kwargs)
+
+
+def build_dataset_iter(corpus_type, fields, opt, is_train=True, rank=0):
     """
     This returns user-defined train/validate data iterator for the trainer
     to iterate over. We implement simple ordered iterator strategy here,
     but more sophisticated strategy like curriculum learning is ok too.
+
+    With ``-train_src``, the data is read from the raw text files given
+    by the options (see :class:`RawTextLazyIter`) instead of the shards
+    of ``-data``. The training iterator of process ``rank`` only yields
+    the batches of this process (see :class:`DatasetLazyIter`).
     """
-    dataset_paths = list(sorted(
-        glob.glob(opt.data + '.' + corpus_type + '*.pt')))
-    if not dataset_paths:
-        return None
     batch_size = opt.batch_size if is_train else opt.valid_batch_size
-    batch_fn = max_tok_len if is_train and opt.batch_type == "tokens" else None
+    batch_type = opt.batch_type if is_train else "sents"
     batch_size_multiple = 8 if opt.model_dtype == "fp16" else 1
 
     device = "cuda" if opt.gpu_ranks else "cpu"
 
-    return DatasetLazyIter(
-        dataset_paths,
-        fields,
-        batch_size,
-        batch_fn,
-        batch_size_multiple,
-        device,
-        is_train,
+    iter_kwargs = dict(
+        batch_size=batch_size,
+        batch_type=batch_type,
+        batch_size_multiple=batch_size_multiple,
+        device=device,
+        is_train=is_train,
         repeat=not opt.single_pass,
-        num_batches_multiple=max(opt.accum_count) * opt.world_size)
+        num_batches_multiple=max(opt.accum_count) * opt.world_size,
+        prefetch=opt.prefetch_shards if is_train else 0,
+        num_workers=opt.num_collate_workers if is_train else 0,
+        queue_size=opt.collate_queue_size,
+        rank=rank,
+        world_size=opt.world_size)
+    if opt.train_src:
+        return _raw_text_iter(corpus_type, fields, opt, **iter_kwargs)
+
+    dataset_paths = list(sorted(
+        glob.glob(opt.data + '.' + corpus_type + '*.pt') +
+        glob.glob(opt.data + '.' + corpus_type + '*' + MMAP_EXT)))
+    if not dataset_paths:
+        return None
+    manifest = load_manifest(manifest_path(opt.data, corpus_type))
+    if manifest is not None and is_train:
+        n_batches = epoch_batches(
+            manifest, batch_size, batch_type, batch_size_multiple)
+        logger.info(' * %d %s examples in %d shards, %d filtered out; '
+                    'an epoch is %s%d steps.' % (
+                        manifest["examples"], corpus_type,
+                        len(manifest["shards"]), manifest["filtered"],
+                        "about " if batch_type == "tokens" else "",
+                        -(-n_batches // iter_kwargs["num_batches_multiple"])))
+    return DatasetLazyIter(
+        dataset_paths, fields, manifest=manifest, **iter_kwargs)
@@ -0,0 +1,139 @@
+"""Manifest of the shards of a corpus saved by ``preprocess.py``.
+
+The manifest is a small JSON file next to the shards,
+``<save_data>.<corpus_type>.manifest.json``. It records for each shard
+its number of examples and tokens, the joint histogram of their src and
+tgt lengths, the number of examples filtered out (and of those rejected
+before being built, by reason) and its size on disk,
+so that training can know about the shards without loading them. The
+counts of the whole corpus are the sums of those of its shards: e.g.
+the ``"duplicate"`` examples are only those repeated within a shard.
+"""
+import codecs
+import json
+import math
+import os
+
+import numpy as np
+
+MANIFEST_EXT = ".manifest.json"
+
+
+def manifest_path(data, corpus_type):
+    """Path of the manifest of ``corpus_type`` for the ``-data`` or
+    ``-save_data`` prefix ``data``."""
+    return data + "." + corpus_type + MANIFEST_EXT
+
+
+def shard_stats(dataset, path, n_read):
+    """Return the manifest entry of a shard.
+
+    Args:
+        dataset (onmt.inputters.Dataset): The examples of the shard.
+        path (str): Where the shard is saved.
+        n_read (int): Number of examples read, before filtering.
+
+    Returns:
+        dict: ``path`` (relative to the manifest), ``examples``,
+        ``filtered``, ``rejected`` (see
+        :class:`onmt.inputters.Dataset` ``rejected``), ``bytes``,
+        ``src_tokens``, ``tgt_tokens`` and ``lengths``, a list of
+        ``[src_len, tgt_len, count]``.
+    """
+
+    src = dataset.lengths["src"]
+    tgt = dataset.lengths.get("tgt")
+    if tgt is None:
+        tgt = np.zeros_like(src)
+    pairs, counts = np.unique(
+        np.stack([src, tgt], 1).reshape(-1, 2), axis=0, return_counts=True)
+    return {
+        "path": os.path.basename(path),
+        "examples": len(dataset),
+        "filtered": n_read - len(dataset),
+        "rejected": dict(getattr(dataset, "rejected", {})),
+        "bytes": os.path.getsize(path),
+        "src_tokens": int(src.sum()),
+        "tgt_tokens": int(tgt.sum()),
+        "lengths": [[int(s), int(t), int(c)]
+                    for (s, t), c in zip(pairs, counts)],
+    }
+
+
+def save_manifest(path, shards):
+    """Save the manifest entries ``shards`` (see :func:`shard_stats`),
+    in the order of the shards."""
+    manifest = {
+        "examples": sum(s["examples"] for s in shards),
+        "filtered": sum(s["filtered"] for s in shards),
+        "shards": shards,
+    }
+    with codecs.open(path, "w", "utf-8") as f:
+        json.dump(manifest, f)
+
+
+def load_manifest(path):
+    """Load a manifest saved by :func:`save_manifest`, with the shards
+    keyed by their path next to it. Returns ``None`` if there is no
+    manifest."""
+    if not os.path.isfile(path):
+        return None
+    with codecs.open(path, "r", "utf-8") as f:
+        manifest = json.load(f)
+    root = os.path.dirname(path)
+    manifest["shards"] = {os.path.join(root, s["path"]): s
+                          for s in manifest["shards"]}
+    return manifest
+
+
+def shard_lengths(stats):
+    """The src and tgt lengths of the examples of a shard from its
+    manifest entry, sorted like a pool of
+    :class:`onmt.inputters.inputter.OrderedIterator`."""
+    lengths = np.array(stats["lengths"], dtype=np.int64).reshape(-1, 3)
+    order = np.lexsort((lengths[:, 1], lengths[:, 0]))
+    lengths = lengths[order]
+    return (np.repeat(lengths[:, 0], lengths[:, 2]),
+            np.repeat(lengths[:, 1], lengths[:, 2]))
+
+
+def epoch_batches(manifest, batch_size, batch_type="sents",
+                  batch_size_multiple=1):
+    """Number of training batches of an epoch over the shards of
+    ``manifest``.
+
+    It is exact with ``batch_type="sents"``. With ``"tokens"``, the
+    batches are planned from the sorted lengths of each whole shard
+    rather than from its shuffled pools, which usually gives a few
+    batches less.
+    """
+
+    # avoid a circular import
+    from onmt.inputters.inputter import plan_batches
+
+    pool_size = 100 * batch_size
+    n_batches = 0
+    for stats in manifest["shards"].values():
+        n = stats["examples"]
+        if batch_type == "tokens":
+            src, tgt = shard_lengths(stats)
+            bounds = plan_batches(src, tgt, batch_size, "tokens",
+                                  batch_size_multiple)
+        else:
+            bounds = []
+            for start in range(0, n, pool_size):
+                bounds += plan_batches(
+                    np.ones(min(pool_size, n - start), dtype=np.int64),
+                    None, batch_size, "sents", batch_size_multiple)
+        n_batches += sum(1 for start, end in bounds if end > start)
+    return n_batches
+
+
+def shard_size_for_memory(manifest, memory_mb):
+    """Number of examples of a shard taking about ``memory_mb``
+    megabytes, from the size of the shards of ``manifest``."""
+    examples = sum(s["examples"] for s in manifest["shards"].values())
+    size = sum(s["bytes"] for s in manifest["shards"].values())
+    if not examples or not size:
+        raise ValueError("The manifest has no examples to size shards.")
+    return max(1, int(math.floor(memory_mb * 2 ** 20 * examples / size)))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Memory-mapped binary shards.
+
+A shard file starts with a small JSON header followed by the flat
+arrays of an :class:`onmt.inputters.example_store.ExampleStore`: for each
+text side (``src``/``tgt``) an ``int64`` offsets index and one ``int32``
+token-id array per field layer, plus the token table the ids point into.
+Opening a shard only reads the header; the arrays are memory-mapped, so
+they are shared through the page cache by every process reading the
+same file.
+"""
+import json
+import struct
+
+import numpy as np
+from torchtext.data import Dataset as TorchtextDataset
+
+from onmt.inputters.dataset_base import dataset_store
+from onmt.inputters.example_store import ExampleStore, ExampleViews, \
+    CopyVocabs
+from onmt.inputters.text_dataset import text_sort_key
+
+
+MMAP_MAGIC = b"ONMTMMAP"
+MMAP_VERSION = 1
+MMAP_EXT = ".bin"
+_HEADER = struct.Struct("<8sIQ")
+_ALIGN = 64
+
+
+def is_mmap_shard(path):
+    """Whether ``path`` is a binary shard written by
+    :func:`save_mmap_shard`."""
+    if not path.endswith(MMAP_EXT):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MMAP_MAGIC)) == MMAP_MAGIC
+
+
+class _ArrayWriter(object):
+    """Accumulate named arrays and lay them out after the header."""
+
+    def __init__(self):
+        self.arrays = []
+
+    def add(self, name, array):
+        self.arrays.append((name, np.ascontiguousarray(array)))
+
+    def write(self, path, meta):
+        index = {}
+        offset = 0
+        for name, array in self.arrays:
+            index[name] = [array.dtype.str, offset, int(array.size)]
+            offset += -(-array.nbytes // _ALIGN) * _ALIGN
+        meta = dict(meta, arrays=index)
+        header = json.dumps(meta).encode("utf-8")
+        start = -(-(_HEADER.size + len(header)) // _ALIGN) * _ALIGN
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MMAP_MAGIC, MMAP_VERSION, len(header)))
+            f.write(header)
+            f.write(b"\0" * (start - _HEADER.size - len(header)))
+            for name, array in self.arrays:
+                f.write(array.tobytes())
+                f.write(b"\0" * (-array.nbytes % _ALIGN))
+            f.flush()
+
+
+def save_mmap_shard(dataset, path):
+    """Write ``dataset`` as a binary shard.
+
+    The shard holds the arrays of the dataset's
+    :class:`onmt.inputters.example_store.ExampleStore`, with the token
+    tables encoded as ``"<layer>.vocab"`` arrays.
+
+    Args:
+        dataset (onmt.inputters.Dataset): A text dataset whose ``fields``
+            are still attached.
+        path (str): Output path.
+    """
+
+    store = dataset_store(dataset)
+    if "src" not in store.meta["text"] or store.objects:
+        raise ValueError("Binary shards only support text data.")
+
+    writer = _ArrayWriter()
+    for names in store.meta["text"].values():
+        for layer in names:
+            writer.add(layer + ".vocab", np.frombuffer(
+                "\n".join(store.table(layer)).encode("utf-8"),
+                dtype=np.uint8))
+    for name, array in store.arrays.items():
+        # the token tables of a shard that is saved again
+        if not name.endswith(".vocab"):
+            writer.add(name, array)
+    meta = dict(store.meta)
+    if "copy_specials" not in meta and getattr(dataset, "src_vocabs", None):
+        src_field = dataset.fields["src"].base_field
+        meta["copy_specials"] = [src_field.unk_token, src_field.pad_token]
+    writer.write(path, meta)
+
+
+class MmapShard(ExampleStore):
+    """Read-only :class:`onmt.inputters.example_store.ExampleStore`
+    over a binary shard.
+
+    Args:
+        path (str): Location of a file written by :func:`save_mmap_shard`.
+
+    Attributes:
+        meta (dict): The shard header.
+        arrays (dict[str, numpy.ndarray]): Memory-mapped arrays.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, header_len = _HEADER.unpack(
+                f.read(_HEADER.size))
+            if magic != MMAP_MAGIC:
+                raise ValueError("%s is not a binary shard." % path)
+            if version > MMAP_VERSION:
+                raise ValueError(
+                    "%s uses binary shard version %d, this version of "
+                    "OpenNMT-py reads up to %d." % (
+                        path, version, MMAP_VERSION))
+            meta = json.loads(f.read(header_len).decode("utf-8"))
+        start = -(-(_HEADER.size + header_len) // _ALIGN) * _ALIGN
+        buf = np.memmap(path, dtype=np.uint8, mode="r")
+        arrays = {}
+        for name, (dtype, offset, size) in meta["arrays"].items():
+            dtype = np.dtype(dtype)
+            begin = start + offset
+            arrays[name] = buf[begin:begin + size * dtype.itemsize] \
+                .view(dtype)
+        super(MmapShard, self).__init__(meta, arrays)
+
+
+class MmapDataset(TorchtextDataset):
+    """A :class:`torchtext.data.Dataset` backed by a binary shard.
+
+    Examples are views that decode their tokens on access, so
+    opening the dataset does not unpickle or copy the shard.
+
+    Args:
+        path (str): Location of the shard.
+        sort_key (Callable): See :class:`onmt.inputters.Dataset`.
+    """
+
+    def __init__(self, path, sort_key=text_sort_key):
+        self.sort_key = sort_key
+        self.shard = MmapShard(path)
+        if "copy_specials" in self.shard.meta:
+            self.src_vocabs = CopyVocabs(
+                self.shard, self.shard.meta["copy_specials"])
+        else:
+            self.src_vocabs = []
+        super(MmapDataset, self).__init__(ExampleViews(self.shard), [])
+
+    @property
+    def lengths(self):
+        """See :attr:`onmt.inputters.Dataset.lengths`."""
+        return self.shard.lengths()
+
+    def __getattr__(self, attr):
+        # avoid infinite recursion when fields isn't defined
+        if 'fields' not in vars(self):
+            raise AttributeError
+        if attr in self.fields:
+            return (getattr(x, attr) for x in self.examples)
+        else:
+            raise AttributeError
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from functools import partial
 
+import numpy as np
 import six
 import torch
 from torchtext.data import Field, RawField
@@ -69,6 +70,52 @@ def _feature_tokenize(
     return tokens
 
 
+def _feature_layers(
+        string, layers, tok_delim=None, feat_delim=None, truncate=None):
+    """Split apart the tokens and their features in a single pass.
+
+    Same as calling :func:`_feature_tokenize` for each layer of
+    ``layers``.
+
+    Returns:
+        List[List[str]] of tokens for each layer.
+    """
+
+    tokens = string.split(tok_delim)
+    if truncate is not None:
+        tokens = tokens[:truncate]
+    if feat_delim is None:
+        return [list(tokens) for _ in layers]
+    split = [t.split(feat_delim) for t in tokens]
+    if not split:
+        return [[] for _ in layers]
+    if min(map(len, split)) <= max(layers):
+        raise IndexError("Missing features in %r" % string)
+    columns = list(zip(*split))
+    return [list(columns[layer]) for layer in layers]
+
+
+def _layer_tokenize_kwargs(fields):
+    """The layer of each of ``fields`` and the other arguments of their
+    :func:`_feature_tokenize`, if they only differ by their ``layer``.
+    ``None`` if some field is tokenized otherwise."""
+
+    layers = []
+    shared = None
+    for _, f in fields:
+        tokenize = getattr(f, "tokenize", None)
+        if not isinstance(tokenize, partial) \
+                or tokenize.func is not _feature_tokenize or tokenize.args:
+            return None
+        kwargs = dict(tokenize.keywords)
+        layers.append(kwargs.pop("layer", 0))
+        if shared is None:
+            shared = kwargs
+        elif kwargs != shared:
+            return None
+    return dict(shared, layers=layers)
+
+
 class TextMultiField(RawField):
     """Container for subfields.
 
@@ -98,13 +145,20 @@ class TextMultiField(RawField):
     def base_field(self):
         return self.fields[0][1]
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("_tokenize_kwargs", None)
+        return state
+
     def process(self, batch, device=None):
         """Convert outputs of preprocess into Tensors.
 
         Args:
-            batch (List[List[List[str]]]): A list of length batch size.
-                Each element is a list of the preprocess results for each
-                field (which are lists of str "words" or feature tags.
+            batch (List[List[List[str]]] or List[numpy.ndarray]): A list of
+                length batch size. Each element is a list of the preprocess
+                results for each field (which are lists of str "words" or
+                feature tags), or the vocab ids of these results as an
+                array of shape ``(len(self.fields), seq_len)``.
             device (torch.device or str): The device on which the tensor(s)
                 are built.
 
@@ -116,6 +170,9 @@ class TextMultiField(RawField):
                 and have shape ``(batch_size,)``.
         """
 
+        if batch and isinstance(batch[0], np.ndarray):
+            return self._process_ids(batch, device=device)
+
         # batch (list(list(list))): batch_size x len(self.fields) x seq_len
         batch_by_feat = list(zip(*batch))
         base_data = self.base_field.process(batch_by_feat[0], device=device)
@@ -133,6 +190,32 @@ class TextMultiField(RawField):
         else:
             return data
 
+    def _process_ids(self, batch, device=None):
+        # Same as padding and numericalizing with the fields, from the ids.
+        # The layers share their bos/eos settings (see text_fields).
+        n_bos = int(self.base_field.init_token is not None)
+        n_eos = int(self.base_field.eos_token is not None)
+        ends = np.array([n_bos + ex.shape[1] for ex in batch])
+        # data: seq_len x batch_size x len(self.fields)
+        data = np.empty(
+            (ends.max() + n_eos, len(batch), len(self.fields)),
+            dtype=np.int64)
+        for i, (_, f) in enumerate(self.fields):
+            data[:, :, i] = f.vocab.stoi[f.pad_token]
+            if n_bos:
+                data[0, :, i] = f.vocab.stoi[f.init_token]
+        for b, ex in enumerate(batch):
+            data[n_bos:ends[b], b] = ex.T
+        if n_eos:
+            data[ends, np.arange(len(batch))] = [
+                f.vocab.stoi[f.eos_token] for _, f in self.fields]
+        data = torch.from_numpy(data).to(device)
+        if self.base_field.include_lengths:
+            lengths = torch.tensor(
+                ends + n_eos, dtype=self.base_field.dtype, device=device)
+            return data, lengths
+        return data
+
     def preprocess(self, x):
         """Preprocess data.
 
@@ -145,7 +228,15 @@ class TextMultiField(RawField):
                 is ordered like ``self.fields``.
         """
 
-        return [f.preprocess(x) for _, f in self.fields]
+        if "_tokenize_kwargs" not in self.__dict__:
+            self._tokenize_kwargs = _layer_tokenize_kwargs(self.fields)
+        if self._tokenize_kwargs is None \
+                or not isinstance(x, six.text_type):
+            return [f.preprocess(x) for _, f in self.fields]
+        # split the sentence once, the fields get their layer as tokens
+        layers = _feature_layers(x.rstrip("\n"), **self._tokenize_kwargs)
+        return [f.preprocess(layer)
+                for (_, f), layer in zip(self.fields, layers)]
 
     def __getitem__(self, item):
         return self.fields[item]
@@ -0,0 +1,128 @@
+"""Token counts that spill to disk, to build vocabularies of corpora
+with more distinct tokens than fit in memory.
+
+The counts of a (sub)field are kept in a ``Counter`` until it holds
+``max_size`` distinct tokens. They are then written to disk as a run
+sorted by token and the counter is emptied. The runs and the counter
+are merged back into a single sorted stream of ``(token, count)``, from
+which the vocabulary is selected with a heap of its size.
+"""
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+from collections import Counter
+from itertools import groupby, islice
+from operator import itemgetter
+
+_BLOCK_SIZE = 10000
+
+
+def _write_run(path, items):
+    with open(path, "wb") as f:
+        items = iter(items)
+        while True:
+            block = list(islice(items, _BLOCK_SIZE))
+            if not block:
+                break
+            pickle.dump(block, f, pickle.HIGHEST_PROTOCOL)
+
+
+def _read_run(path):
+    with open(path, "rb") as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            for item in block:
+                yield item
+
+
+def merge_counts(*streams):
+    """Merge streams of ``(token, count)`` sorted by token into one,
+    summing the counts of the same token."""
+    # the key argument of heapq.merge is not in python 2, tuples are
+    # ordered by token first
+    merged = heapq.merge(*[((token, count) for token, count in stream)
+                           for stream in streams])
+    for token, items in groupby(merged, key=itemgetter(0)):
+        yield token, sum(count for _, count in items)
+
+
+def most_common(counts, max_size=None, min_freq=1, specials=()):
+    """Select the tokens of a vocabulary like ``torchtext.vocab.Vocab``.
+
+    Args:
+        counts (Iterable[(str, int)]): Token counts, each token once.
+        max_size (int or NoneType): Number of tokens selected, all of
+            them if ``None``.
+        min_freq (int): Minimum count of the selected tokens.
+        specials (Iterable[str]): Tokens not selected.
+
+    Returns:
+        Counter: The counts of the selected tokens. A ``Vocab`` built
+        from it with ``max_size`` and ``min_freq`` is the same as one
+        built from all the counts.
+    """
+
+    min_freq = max(min_freq, 1)
+    specials = set(specials)
+    counts = ((token, count) for token, count in counts
+              if count >= min_freq and token not in specials)
+
+    # the most frequent first, in alphabetical order for the same count
+    def key(item):
+        return -item[1], item[0]
+
+    if max_size is None:
+        return Counter(dict(counts))
+    return Counter(dict(heapq.nsmallest(max_size, counts, key=key)))
+
+
+class TokenCounts(object):
+    """Counts of the tokens of a (sub)field, spilled to disk beyond
+    ``max_size`` distinct tokens.
+
+    Args:
+        max_size (int): Number of distinct tokens kept in memory, no
+            limit if 0.
+        spill_dir (str or NoneType): Directory of the runs spilled to
+            disk, the default temporary directory if ``None``.
+    """
+
+    def __init__(self, max_size=0, spill_dir=None):
+        self.max_size = max_size
+        self.spill_dir = spill_dir
+        self.counter = Counter()
+        self._run_dir = None
+        self._runs = []
+
+    def update(self, counts):
+        """Add the counts of a ``Counter`` or dict."""
+        self.counter.update(counts)
+        if 0 < self.max_size <= len(self.counter):
+            self._spill()
+
+    def _spill(self):
+        if self._run_dir is None:
+            self._run_dir = tempfile.mkdtemp(
+                prefix="counts.", dir=self.spill_dir)
+        path = os.path.join(self._run_dir, "%d.run" % len(self._runs))
+        _write_run(path, sorted(self.counter.items()))
+        self._runs.append(path)
+        self.counter = Counter()
+
+    def items(self):
+        """The ``(token, count)`` of all tokens, sorted by token."""
+        runs = [_read_run(path) for path in self._runs]
+        return merge_counts(sorted(self.counter.items()), *runs)
+
+    def close(self):
+        """Remove the runs spilled to disk."""
+        if self._run_dir is not None:
+            shutil.rmtree(self._run_dir, ignore_errors=True)
+        self._run_dir = None
+        self._runs = []
+        self.counter = Counter()
@@ -94,6 +94,9 @@ def load_test_model(opt, model_path=None):
         )
     else:
         fields = vocab
+    if "src_map" in fields:
+        fields["src_map"] = inputters.src_map_field(
+            model_opt.copy_attn_index)
 
     model = build_base_model(model_opt, fields, use_gpu(opt), checkpoint,
                              opt.gpu)
@@ -223,5 +226,12 @@ def build_base_model(model_opt, fields, gpu, checkpoint=None, gpu_id=None):
 def build_model(model_opt, opt, fields, checkpoint):
     logger.info('Building model...')
     model = build_base_model(model_opt, fields, use_gpu(opt), checkpoint)
+    # a training option rather than a model one, so that it can be
+    # changed when training from a checkpoint
+    if opt.checkpoint_layers != "none":
+        for module in [model.encoder, model.decoder]:
+            if hasattr(module, "set_checkpoint"):
+                module.set_checkpoint(
+                    opt.checkpoint_layers, opt.checkpoint_every)
     logger.info(model)
     return model
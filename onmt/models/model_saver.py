@@ -5,8 +5,6 @@ import torch.nn as nn
 from collections import deque
 from onmt.utils.logging import logger
 
-from copy import deepcopy
-
 
 def build_model_saver(model_opt, opt, model, fields, optim):
     model_saver = ModelSaver(opt.save_model,
@@ -38,40 +36,40 @@ class ModelSaverBase(object):
         if keep_checkpoint > 0:
             self.checkpoint_queue = deque([], maxlen=keep_checkpoint)
 
-    def save(self, step, moving_average=None):
+    def save(self, step, moving_average=None, data_state=None):
         """Main entry point for model saver
 
         It wraps the `_save` method with checks and apply `keep_checkpoint`
-        related logic
+        related logic. ``data_state`` is the position of the training
+        data iterator, to resume training from it (see
+        :meth:`onmt.inputters.inputter.DatasetLazyIter.state_dict`).
+        The parameters are saved with the values of ``moving_average``
+        (:class:`onmt.utils.moving_average.MovingAverage`) if given.
         """
 
         if self.keep_checkpoint == 0 or step == self.last_saved_step:
             return
 
-        if moving_average:
-            save_model = deepcopy(self.model)
-            for avg, param in zip(moving_average, save_model.parameters()):
-                param.data.copy_(avg.data)
+        if moving_average is not None:
+            with moving_average.swapped():
+                chkpt, chkpt_name = self._save(step, self.model, data_state)
         else:
-            save_model = self.model
-
-        chkpt, chkpt_name = self._save(step, save_model)
+            chkpt, chkpt_name = self._save(step, self.model, data_state)
         self.last_saved_step = step
 
-        if moving_average:
-            del save_model
-
         if self.keep_checkpoint > 0:
             if len(self.checkpoint_queue) == self.checkpoint_queue.maxlen:
                 todel = self.checkpoint_queue.popleft()
                 self._rm_checkpoint(todel)
             self.checkpoint_queue.append(chkpt_name)
 
-    def _save(self, step):
+    def _save(self, step, model, data_state=None):
         """Save a resumable checkpoint.
 
         Args:
             step (int): step number
+            model (nn.Module): model to save
+            data_state (dict or NoneType): position of the training data
 
         Returns:
             (object, str):
@@ -96,7 +94,7 @@ class ModelSaverBase(object):
 class ModelSaver(ModelSaverBase):
     """Simple model saver to filesystem"""
 
-    def _save(self, step, model):
+    def _save(self, step, model, data_state=None):
         real_model = (model.module
                       if isinstance(model, nn.DataParallel)
                       else model)
@@ -114,6 +112,7 @@ class ModelSaver(ModelSaverBase):
             'vocab': self.fields,
             'opt': self.model_opt,
             'optim': self.optim.state_dict(),
+            'data_state': data_state,
         }
 
         logger.info("Saving checkpoint %s_step_%d.pt" % (self.base_path, step))
@@ -96,16 +96,20 @@ class CopyGenerator(nn.Module):
         Args:
            hidden (FloatTensor): hidden outputs ``(batch x tlen, input_size)``
            attn (FloatTensor): attn for each ``(batch x tlen, input_size)``
-           src_map (FloatTensor):
+           src_map (FloatTensor or LongTensor):
                A sparse indicator matrix mapping each source word to
                its index in the "extended" vocab containing.
-               ``(src_len, batch, extra_words)``
+               ``(src_len, batch, extra_words)``. Or the index of each
+               source word in that vocab, ``(src_len, batch)``, with -1
+               for padding, in which case the attention is added to the
+               extended vocab with ``scatter_add`` (see
+               :func:`onmt.inputters.src_map_field`).
         """
 
         # CHECKS
         batch_by_tlen, _ = hidden.size()
         batch_by_tlen_, slen = attn.size()
-        slen_, batch, cvocab = src_map.size()
+        slen_, batch = src_map.size()[:2]
         aeq(batch_by_tlen, batch_by_tlen_)
         aeq(slen, slen_)
 
@@ -119,6 +123,17 @@ class CopyGenerator(nn.Module):
         # Probability of not copying: p_{word}(w) * (1 - p(z))
         out_prob = torch.mul(prob, 1 - p_copy)
         mul_attn = torch.mul(attn, p_copy)
+        if src_map.dim() == 2:
+            cvocab = int(src_map.max()) + 1
+            # padding goes to an extra column, dropped below
+            index = src_map.masked_fill(src_map.lt(0), cvocab)
+            # rows of mul_attn are ordered (tlen, batch)
+            index = index.t().unsqueeze(0).expand(
+                batch_by_tlen // batch, batch, slen).reshape(-1, slen)
+            copy_prob = mul_attn.new_zeros(batch_by_tlen, cvocab + 1)
+            copy_prob.scatter_add_(1, index, mul_attn)
+            return torch.cat([out_prob, copy_prob[:, :cvocab]], 1)
+        cvocab = src_map.size(2)
         copy_prob = torch.bmm(
             mul_attn.view(-1, batch, slen).transpose(0, 1),
             src_map.transpose(0, 1)
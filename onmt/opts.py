@@ -169,6 +169,11 @@ def model_opts(parser):
               help='When available, train to copy.')
     group.add('--reuse_copy_attn', '-reuse_copy_attn', action="store_true",
               help="Reuse standard attention for copy")
+    group.add('--copy_attn_index', '-copy_attn_index', action="store_true",
+              help="Give the copy generator the copy vocabulary id of "
+                   "each source token, instead of a one-hot "
+                   "(src_len x batch x extra_words) source map. Same "
+                   "results, with less memory, for long sources.")
     group.add('--copy_loss_by_seqlength', '-copy_loss_by_seqlength',
               action="store_true",
               help="Divide copy loss by length of sequence")
@@ -215,6 +220,28 @@ def preprocess_opts(parser):
                    "shard_size=0 means no segmentation "
                    "shard_size>0 means segment dataset into multiple shards, "
                    "each shard has shard_size samples")
+    group.add('--shard_memory', '-shard_memory', type=int, default=0,
+              help="Set -shard_size so that a shard takes about this "
+                   "many MB, from the sizes recorded in the manifest "
+                   "given by -shard_manifest, e.g. the manifest of a "
+                   "sample of the corpus. Disabled if 0.")
+    group.add('--shard_manifest', '-shard_manifest',
+              help="Manifest of shards (a \"*.train.manifest.json\" "
+                   "file written by preprocess.py) used by -shard_memory.")
+    group.add('--shard_format', '-shard_format', default='pt',
+              choices=['pt', 'mmap'],
+              help="Format of the saved shards. 'pt' pickles the "
+                   "examples; 'mmap' writes flat token id arrays "
+                   "that are memory-mapped at training time. "
+                   "'mmap' is only available for text data.")
+    group.add('--num_threads', '-num_threads', type=int, default=1,
+              help="Number of worker processes used to build and save "
+                   "shards, and to count their tokens, in parallel.")
+    group.add('--numericalize', '-numericalize', action='store_true',
+              help="Once the vocabulary is built, map the tokens of the "
+                   "text shards to their vocabulary ids and save these "
+                   "ids in the shards, so that training batches are "
+                   "built from integer ids.")
 
     # Dictionary options, for text corpus
 
@@ -242,6 +269,12 @@ def preprocess_opts(parser):
               '-src_words_min_frequency', type=int, default=0)
     group.add('--tgt_words_min_frequency',
               '-tgt_words_min_frequency', type=int, default=0)
+    group.add('--vocab_max_counts', '-vocab_max_counts', type=int,
+              default=0,
+              help="Number of distinct tokens of a (sub)field counted in "
+                   "memory while building the vocabulary. Beyond it, "
+                   "the counts are spilled to disk next to -save_data. "
+                   "No limit if 0.")
 
     group.add('--dynamic_dict', '-dynamic_dict', action='store_true',
               help="Create dynamic dictionaries")
@@ -263,6 +296,16 @@ def preprocess_opts(parser):
     group.add('--lower', '-lower', action='store_true', help='lowercase data')
     group.add('--filter_valid', '-filter_valid', action='store_true',
               help='Filter validation data by src and/or tgt length')
+    group.add('--filter_length_ratio', '-filter_length_ratio', type=float,
+              default=0,
+              help="Reject the training pairs whose longer side has more "
+                   "than this many times the tokens of the shorter side. "
+                   "Disabled if 0.")
+    group.add('--remove_duplicates', '-remove_duplicates',
+              action='store_true',
+              help="Reject the training pairs already in their shard. "
+                   "Duplicates are only looked for within each shard "
+                   "(see -shard_size), not across shards.")
 
     # Data processing options
     group = parser.add_argument_group('Random')
@@ -291,6 +334,14 @@ def preprocess_opts(parser):
               help="Window stride for spectrogram in seconds.")
     group.add('--window', '-window', default='hamming',
               help="Window type for spectrogram generation.")
+    group.add('--feature_cache', '-feature_cache', default=None,
+              help="Directory where the spectrograms are cached as "
+                   "float16 arrays. The shards then only hold references "
+                   "to the cache, and the spectrograms of unchanged files "
+                   "are not extracted again.")
+    group.add('--num_feature_workers', '-num_feature_workers', type=int,
+              default=0,
+              help="Number of worker processes extracting spectrograms.")
 
     # Option most relevant to image input
     group.add('--image_channel_size', '-image_channel_size',
@@ -298,6 +349,9 @@ def preprocess_opts(parser):
               choices=[3, 1],
               help="Using grayscale image can training "
                    "model faster and smaller")
+    group.add('--lazy_images', '-lazy_images', action='store_true',
+              help="Only save the path and size of the images in the "
+                   "shards. The images are decoded when they are batched.")
 
 
 def train_opts(parser):
@@ -306,7 +360,8 @@ def train_opts(parser):
     group = parser.add_argument_group('General')
     group.add('--data', '-data', required=True,
               help='Path prefix to the ".train.pt" and '
-                   '".valid.pt" file path from preprocess.py')
+                   '".valid.pt" file path from preprocess.py. '
+                   'Only the ".vocab.pt" file is used with -train_src.')
 
     group.add('--save_model', '-save_model', default='model',
               help="Model filename (the model will be saved as "
@@ -325,10 +380,39 @@ def train_opts(parser):
     group.add('--gpu_ranks', '-gpu_ranks', default=[], nargs='*', type=int,
               help="list of ranks of each process.")
     group.add('--world_size', '-world_size', default=1, type=int,
-              help="total number of distributed processes.")
+              help="total number of distributed processes. Without "
+                   "-gpu_ranks, as many processes train on CPU.")
     group.add('--gpu_backend', '-gpu_backend',
               default="nccl", type=str,
-              help="Type of torch distributed backend")
+              help="Type of torch distributed backend. The processes "
+                   "training on CPU use gloo.")
+    group.add('--cpu_threads', '-cpu_threads', default=0, type=int,
+              help="Number of threads of each process training on CPU. "
+                   "By default, the processes share the cores and each "
+                   "one is pinned to its own.")
+    group.add('--overlap_grad_reduce', '-overlap_grad_reduce',
+              action='store_true',
+              help="All-reduce the gradients in buckets while the "
+                   "backward pass computes them, instead of after it.")
+    group.add('--grad_bucket_size', '-grad_bucket_size', type=int,
+              default=10,
+              help="Size in MB of the buckets of gradients all-reduced "
+                   "together.")
+    group.add('--grad_reduce_dtype', '-grad_reduce_dtype', default="fp32",
+              choices=["fp32", "fp16", "bf16"],
+              help="Cast the gradients to this type to all-reduce them, "
+                   "to send less data between the processes.")
+    group.add('--grad_topk_ratio', '-grad_topk_ratio', type=float,
+              default=0,
+              help="Only send this ratio of the largest values of the "
+                   "gradients of -grad_topk_params. The values that are "
+                   "not sent are added to the gradients of the next "
+                   "steps. Not used if 0.")
+    group.add('--grad_topk_params', '-grad_topk_params', nargs='+',
+              default=["embeddings", "generator"],
+              choices=["embeddings", "generator"],
+              help="Parameters whose gradients are sparsified with "
+                   "-grad_topk_ratio.")
     group.add('--gpu_verbose_level', '-gpu_verbose_level', default=0, type=int,
               help="Gives more info on each process per GPU.")
     group.add('--master_ip', '-master_ip', default="localhost", type=str,
@@ -340,6 +424,38 @@ def train_opts(parser):
               help="Random seed used for the experiments "
                    "reproducibility.")
 
+    group = parser.add_argument_group('Raw Data')
+    group.add('--train_src', '-train_src',
+              help="Train on this raw source text file instead of the "
+                   "shards of -data. Its lines are tokenized, filtered "
+                   "and numericalized while training.")
+    group.add('--train_tgt', '-train_tgt',
+              help="Raw target text file, with -train_src.")
+    group.add('--valid_src', '-valid_src',
+              help="Raw source text file for validation, with -train_src.")
+    group.add('--valid_tgt', '-valid_tgt',
+              help="Raw target text file for validation, with -train_src.")
+    group.add('--shard_size', '-shard_size', type=int, default=100000,
+              help="Number of lines of the raw text files read, "
+                   "tokenized and batched together. "
+                   "Set to 0 to read the whole files at once.")
+    group.add('--src_seq_length', '-src_seq_length', type=int, default=50,
+              help="Maximum source sequence length of the raw training "
+                   "examples, once tokenized.")
+    group.add('--tgt_seq_length', '-tgt_seq_length', type=int, default=50,
+              help="Maximum target sequence length of the raw training "
+                   "examples, once tokenized.")
+    group.add('--tokenizer_config', '-tokenizer_config',
+              help="JSON file with the options of the tokenizer of the "
+                   "raw text, like the \"tokenizer\" of a model of the "
+                   "REST server. Its paths are relative to the directory "
+                   "of the file. The text is already tokenized if unset.")
+    group.add('--num_shard_workers', '-num_shard_workers', type=int,
+              default=0,
+              help="Number of worker processes building the shards of "
+                   "the raw text files. Set to 0 to build them in the "
+                   "training process.")
+
     # Init options
     group = parser.add_argument_group('Initialization')
     group.add('--param_init', '-param_init', type=float, default=0.1,
@@ -356,6 +472,11 @@ def train_opts(parser):
     group.add('--reset_optim', '-reset_optim', default='none',
               choices=['none', 'all', 'states', 'keep_states'],
               help="Optimization resetter when train_from.")
+    group.add('--reset_data_state', '-reset_data_state', action='store_true',
+              help="Start again from the beginning of the training data "
+                   "when train_from, instead of the position saved in the "
+                   "checkpoint. The saved position is only used with the "
+                   "same training data anyway.")
 
     # Pretrained word vectors
     group.add('--pre_word_vecs_enc', '-pre_word_vecs_enc',
@@ -402,10 +523,36 @@ def train_opts(parser):
               help="Maximum batches of words in a sequence to run "
                    "the generator on in parallel. Higher is faster, but "
                    "uses more memory. Set to 0 to disable.")
+    group.add('--checkpoint_layers', '-checkpoint_layers', default='none',
+              choices=['none', 'all', 'attention'],
+              help="Recompute the activations of the transformer "
+                   "encoder and decoder layers during the backward pass "
+                   "instead of keeping them, to train on larger batches "
+                   "at the cost of a slower step: 'all' of them, or only "
+                   "those of the attention sublayers, which grow with the "
+                   "square of the sequence length. Needs torch >= 1.1.")
+    group.add('--checkpoint_every', '-checkpoint_every', type=int,
+              default=1,
+              help="Only recompute the activations of every X-th layer "
+                   "with -checkpoint_layers, from the first one.")
     group.add('--train_steps', '-train_steps', type=int, default=100000,
               help='Number of training steps')
     group.add('--single_pass', '-single_pass', action='store_true',
               help="Make a single pass over the training dataset.")
+    group.add('--prefetch_shards', '-prefetch_shards', type=int, default=0,
+              help="Number of training shards loaded ahead, on a "
+                   "background thread, while the current one is used. "
+                   "Each prefetched shard is held in memory. "
+                   "Set to 0 to load shards when they are reached.")
+    group.add('--num_collate_workers', '-num_collate_workers', type=int,
+              default=0,
+              help="Number of worker processes turning training examples "
+                   "into padded tensor batches. Set to 0 to build the "
+                   "batches in the training process.")
+    group.add('--collate_queue_size', '-collate_queue_size', type=int,
+              default=8,
+              help="Maximum number of batches built by the collate "
+                   "workers ahead of the one being trained on.")
     group.add('--epochs', '-epochs', type=int, default=0,
               help='Deprecated epochs see train_steps')
     group.add('--optim', '-optim', default='sgd',
@@ -462,6 +609,9 @@ def train_opts(parser):
               help="Step for moving average. "
                    "Default is every update, "
                    "if -average_decay is set.")
+    group.add('--average_offload', '-average_offload', action='store_true',
+              help="Keep the moving average of -average_decay in CPU "
+                   "memory rather than on the GPU.")
 
     # learning rate
     group = parser.add_argument_group('Optimization- Rate')
@@ -521,6 +671,15 @@ def train_opts(parser):
               type=int, default=3, choices=[3, 1],
               help="Using grayscale image can training "
                    "model faster and smaller")
+    group.add('--image_loader_threads', '-image_loader_threads',
+              type=int, default=4,
+              help="Number of threads decoding the images of a batch "
+                   "saved by preprocess.py -lazy_images.")
+    group.add('--image_cache_size', '-image_cache_size', type=int,
+              default=0,
+              help="Number of decoded images kept in memory by each "
+                   "process building batches, with -lazy_images. "
+                   "No cache if 0.")
 
 
 def translate_opts(parser):
@@ -676,12 +835,21 @@ def translate_opts(parser):
               help='Window stride for spectrogram in seconds')
     group.add('--window', '-window', default='hamming',
               help='Window type for spectrogram generation')
+    group.add('--feature_cache', '-feature_cache', default=None,
+              help="Directory where the spectrograms are cached as "
+                   "float16 arrays, see preprocess.py.")
+    group.add('--num_feature_workers', '-num_feature_workers', type=int,
+              default=0,
+              help="Number of worker processes extracting spectrograms.")
 
     # Option most relevant to image input
     group.add('--image_channel_size', '-image_channel_size',
               type=int, default=3, choices=[3, 1],
               help="Using grayscale image can training "
                    "model faster and smaller")
+    group.add('--lazy_images', '-lazy_images', action='store_true',
+              help="Only read the size of the images up front. They are "
+                   "decoded when they are batched.")
 
 
 # Copyright 2016 The Chromium Authors. All rights reserved.
@@ -197,6 +197,12 @@ ${PYTHON} preprocess.py -train_src /tmp/src-val.txt \
 ${PYTHON} train.py -data /tmp/q -rnn_size 2 -batch_size 10 \
 		-word_vec_size 5 -report_every 5        \
 		-rnn_size 10 -train_steps 10        >> ${LOG_FILE} 2>&1
+[ "$?" -eq 0 ] || error_exit
+${PYTHON} train.py -data /tmp/q -rnn_size 2 -batch_size 10 \
+		-word_vec_size 5 -report_every 5        \
+		-rnn_size 10 -train_steps 10 -world_size 2 \
+		-overlap_grad_reduce        >> ${LOG_FILE} 2>&1
+[ "$?" -eq 0 ] || error_exit
 ${PYTHON} translate.py -model ${TEST_DIR}/test_model2.pt  \
 		    -src ${DATA_DIR}/morph/src.valid   \
 		    -verbose -batch_size 10     \
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 import unittest
 from onmt.inputters.audio_dataset import AudioSeqField, AudioDataReader
+from onmt.inputters.feature_cache import CachedArray
 
 import itertools
 import os
 import shutil
+import tempfile
 
 import torch
 import torchaudio
@@ -225,3 +227,26 @@ class TestAudioDataReader(unittest.TestCase):
             self.assertEqual(aud["src_path"],
                              self._AUDIO_DATA_FMT.format(i))
         self.assertGreater(i, 0, "No audio data was read.")
+
+    def test_read_with_cache_and_workers(self):
+        cache_dir = tempfile.mkdtemp()
+        try:
+            rdr = AudioDataReader(self._SAMPLE_RATE, window="hamming",
+                                  window_size=0.02, window_stride=0.01)
+            cached_rdr = AudioDataReader(
+                self._SAMPLE_RATE, window="hamming", window_size=0.02,
+                window_stride=0.01, cache_dir=cache_dir, num_workers=2)
+            for _ in range(2):
+                for aud, cached in zip(
+                        rdr.read(self._AUDIO_LIST_FNAMES_PATH, "src",
+                                 self._AUDIO_DATA_DIR),
+                        cached_rdr.read(self._AUDIO_LIST_FNAMES_PATH,
+                                        "src", self._AUDIO_DATA_DIR)):
+                    self.assertIsInstance(cached["src"], CachedArray)
+                    self.assertEqual(cached["src"].size(), aud["src"].size())
+                    self.assertTrue(torch.allclose(
+                        cached["src"].load(), aud["src"], atol=1e-2))
+                self.assertEqual(len(os.listdir(cache_dir)),
+                                 self._N_EXAMPLES)
+        finally:
+            shutil.rmtree(cache_dir)
@@ -1,5 +1,6 @@
 import unittest
 from onmt.modules.copy_generator import CopyGenerator, CopyGeneratorLoss
+from onmt.inputters.inputter import make_src, make_src_index
 
 import itertools
 from copy import deepcopy
@@ -76,6 +77,23 @@ class TestCopyGenerator(unittest.TestCase):
                     .ne(old_weights[param_name]).any(),
                     param_name + " " + init_case.__str__())
 
+    def test_copy_gen_index_src_map_matches_dense(self):
+        for params, init_case in itertools.product(
+                self.PARAMS, self.INIT_CASES):
+            cgen = CopyGenerator(**init_case)
+            hidden, attn, _ = self.dummy_inputs(params, init_case)
+            src_ids = [torch.randint(0, params["n_extra_words"], (n,))
+                       for n in torch.randint(
+                           1, params["max_seq_len"] + 1,
+                           (params["batch_size"],)).tolist()]
+            src_ids[0][0] = params["n_extra_words"] - 1
+            src_ids[-1] = torch.arange(params["max_seq_len"])
+            expected = cgen(hidden, attn, make_src(src_ids, None))
+            res = cgen(hidden, attn, make_src_index(src_ids, None))
+            self.assertEqual(res.shape, expected.shape)
+            self.assertTrue(res.allclose(expected, atol=1e-6))
+            res.sum().backward()
+
 
 class TestCopyGeneratorLoss(unittest.TestCase):
     INIT_CASES = list(product_dict(
@@ -0,0 +1,250 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import torch
+import torch.distributed
+import torch.multiprocessing
+import torch.nn as nn
+
+import onmt
+import onmt.inputters
+import onmt.opts
+from onmt.model_builder import build_base_model
+from onmt.utils.distributed import GradientBucketReducer, TopKReducer, \
+    all_gather_list, all_reduce_and_rescale_tensors, process_rank
+from onmt.utils.parse import ArgumentParser
+
+WORLD_SIZE = 2
+
+
+def _init(rank, init_file):
+    torch.distributed.init_process_group(
+        "gloo", init_method="file://" + init_file, world_size=WORLD_SIZE,
+        rank=rank)
+
+
+def _assert_same_grads(params, expected):
+    for p, e in zip(params, expected):
+        if e.grad is None:
+            assert p.grad is None
+        else:
+            assert torch.allclose(p.grad, e.grad, atol=1e-6)
+
+
+def _reducer_worker(rank, init_file):
+    _init(rank, init_file)
+    torch.manual_seed(1)
+    model = nn.Sequential(nn.Linear(4, 8), nn.ReLU(), nn.Linear(8, 8),
+                          nn.ReLU(), nn.Linear(8, 3))
+    unused = nn.Linear(2, 2)
+    params = list(unused.parameters()) + list(model.parameters())
+    expected_model = copy.deepcopy(model)
+    expected = list(copy.deepcopy(unused).parameters()) + \
+        list(expected_model.parameters())
+    reducer = GradientBucketReducer(params, 2.0, bucket_size=100)
+    assert len(reducer.buckets) > 2
+
+    torch.manual_seed(rank + 2)
+    for step in range(2):
+        inputs = [torch.randn(5, 4) for _ in range(3)]
+        for i, x in enumerate(inputs):
+            reducer.prepare(i == len(inputs) - 1)
+            model(x).pow(2).sum().backward()
+            expected_model(x).pow(2).sum().backward()
+        # the buckets were started during the backward pass, but the
+        # last one whose gradients are not computed
+        assert reducer._next == len(reducer.buckets) - 1
+        reducer.wait()
+        all_reduce_and_rescale_tensors(
+            [p.grad.data for p in expected if p.grad is not None], 2.0)
+        _assert_same_grads(params, expected)
+        for p in params + expected:
+            p.grad = None
+
+
+def _trainer_worker(rank, init_file, opt):
+    _init(rank, init_file)
+    fields = onmt.inputters.get_fields("text", 0, 0)
+    for side in ["src", "tgt"]:
+        fields[side].base_field.build_vocab(
+            [[str(i) for i in range(20)]])
+    torch.manual_seed(1)
+    model = build_base_model(opt, fields, False)
+    expected_model = copy.deepcopy(model)
+    tgt_field = fields["tgt"].base_field
+
+    def trainer(model, overlap):
+        loss = onmt.utils.loss.build_loss_compute(model, tgt_field, opt)
+        optim = onmt.utils.Optimizer.from_opt(model, opt)
+        return onmt.Trainer(
+            model, loss, loss, optim, trunc_size=opt.truncated_decoder,
+            shard_size=opt.max_generator_batches,
+            accum_count=opt.accum_count, n_gpu=WORLD_SIZE, gpu_rank=rank,
+            overlap_grad_reduce=overlap, grad_bucket_size=2000,
+            grad_dtype=torch.float16
+            if opt.grad_reduce_dtype == "fp16" else None,
+            grad_topk_ratio=opt.grad_topk_ratio)
+
+    overlapped = trainer(model, True)
+    expected = trainer(expected_model, False)
+    reducer = overlapped.grad_reducer
+    assert len(reducer.buckets) > 2
+    started = []
+    wait = reducer.wait
+
+    def record_started():
+        started.append(reducer._next)
+        return wait()
+    reducer.wait = record_started
+
+    torch.manual_seed(rank + 2)
+    batches = []
+    for _ in range(opt.accum_count[0]):
+        src = torch.randint(4, 22, (7, 3, 1))
+        tgt = torch.randint(4, 22, (6, 3, 1))
+        batches.append(SimpleNamespace(
+            src=(src, torch.full((3,), 7, dtype=torch.long)), tgt=tgt,
+            batch_size=3))
+    stats = onmt.utils.Statistics()
+    for t in [overlapped, expected]:
+        t.accum_count = opt.accum_count[0]
+        t._gradient_accumulation(
+            batches, 15, stats, onmt.utils.Statistics())
+    for p, e in zip(model.parameters(), expected_model.parameters()):
+        assert torch.allclose(p, e, atol=1e-6)
+    # buckets were started during the backward passes
+    assert started and all(n > 0 for n in started)
+    # the bytes sent by both trainers
+    full_size = 4 * sum(p.numel() for p in model.parameters())
+    assert stats.n_updates == 2 * len(started)
+    if opt.grad_reduce_dtype == "fp32" and not opt.grad_topk_ratio:
+        assert stats.n_sent_bytes == stats.n_updates * full_size
+    else:
+        assert stats.n_sent_bytes < stats.n_updates * full_size
+
+
+def _compression_worker(rank, init_file):
+    _init(rank, init_file)
+    torch.manual_seed(rank + 2)
+    grads = [torch.randn(50, 4), torch.randn(1000)]
+    expected = [g.clone() for g in grads]
+    sent = all_reduce_and_rescale_tensors(expected, 2.0, buffer_size=400)
+    assert sent == 4 * 1200
+    half = [g.clone() for g in grads]
+    sent = all_reduce_and_rescale_tensors(
+        half, 2.0, buffer_size=400, dtype=torch.float16)
+    assert sent == 2 * 1200
+    for g, e in zip(half, expected):
+        assert torch.allclose(g, e, atol=1e-2)
+
+    # all the values are sent with a ratio of 1
+    params = [nn.Parameter(torch.zeros_like(g)) for g in grads]
+    reducer = TopKReducer(params, 1.0)
+    for p, g in zip(params, grads):
+        p.grad = g.clone()
+    reducer(2.0)
+    for p, e in zip(params, expected):
+        assert torch.allclose(p.grad, e, atol=1e-6)
+
+    # a gradient that was not computed by a process is sent as zeros
+    for p, g in zip(params, grads):
+        p.grad = g.clone()
+    if rank == 1:
+        params[0].grad = None
+    reducer(2.0)
+    if rank == 1:
+        assert params[0].grad is None
+    else:
+        assert torch.allclose(params[0].grad, grads[0] / 2.0, atol=1e-6)
+    assert torch.allclose(params[1].grad, expected[1], atol=1e-6)
+
+    # the values that are not sent are kept for the next steps
+    reducer = TopKReducer(params, 0.1, dtype=torch.float16)
+    total = [torch.zeros_like(g) for g in grads]
+    for step in range(3):
+        for p, g in zip(params, grads):
+            p.grad = g.clone()
+        sent = reducer(1.0)
+        assert sent == 120 * (2 + 4)
+        for t, p in zip(total, params):
+            t += p.grad
+    for t, g, residual in zip(total, grads, reducer.residuals):
+        unsent = residual.clone()
+        torch.distributed.all_reduce(unsent)
+        summed = g.clone()
+        torch.distributed.all_reduce(summed)
+        assert torch.allclose(t.view(-1) + unsent, 3 * summed.view(-1),
+                              atol=1e-2)
+
+
+def _gather_worker(rank, init_file):
+    _init(rank, init_file)
+    opt = SimpleNamespace(world_size=WORLD_SIZE, gpu_ranks=[])
+    assert process_rank(opt, -1) == rank
+    assert all_gather_list({"rank": rank}) == \
+        [{"rank": r} for r in range(WORLD_SIZE)]
+    stats = onmt.utils.Statistics(
+        loss=rank + 1, n_words=10 * (rank + 1), n_correct=rank)
+    stats = onmt.utils.Statistics.all_gather_stats(stats)
+    assert (stats.loss, stats.n_words, stats.n_correct) == (3, 30, 1)
+    # every rank saves its own data position
+    train_iter = SimpleNamespace(
+        state_dict=lambda: {"rank": rank, "random": list(range(1000))})
+    data_state = onmt.Trainer._data_state(
+        SimpleNamespace(n_gpu=WORLD_SIZE), train_iter)
+    assert data_state == {"ranks": {r: {"rank": r, "random": list(range(1000))}
+                                    for r in range(WORLD_SIZE)}}
+
+
+class TestDistributed(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def spawn(self, fn, *args):
+        init_file = os.path.join(self.tmp_dir, "init")
+        if os.path.exists(init_file):
+            os.remove(init_file)
+        torch.multiprocessing.spawn(
+            fn, args=(init_file,) + args, nprocs=WORLD_SIZE)
+
+    def test_gather_on_cpu(self):
+        self.spawn(_gather_worker)
+
+    def test_compression(self):
+        self.spawn(_compression_worker)
+
+    def test_same_grads_as_all_reduce(self):
+        self.spawn(_reducer_worker)
+
+    def test_trainer_same_update(self):
+        parser = ArgumentParser()
+        onmt.opts.model_opts(parser)
+        onmt.opts.train_opts(parser)
+        for args in [[], ["-max_generator_batches", "0"],
+                     ["-accum_count", "2"],
+                     ["-share_decoder_embeddings"],
+                     ["-share_decoder_embeddings", "-accum_count", "2"],
+                     ["-truncated_decoder", "2"],
+                     ["-grad_reduce_dtype", "fp16", "-accum_count", "2"],
+                     ["-grad_topk_ratio", "0.05"],
+                     ["-grad_reduce_dtype", "fp16",
+                      "-grad_topk_ratio", "0.05",
+                      "-share_decoder_embeddings"]]:
+            opt = parser.parse_args(
+                ["-data", "dummy", "-layers", "1", "-rnn_size", "16",
+                 "-word_vec_size", "16", "-max_generator_batches", "2",
+                 "-dropout", "0", "-optim", "sgd"] + args)
+            ArgumentParser.update_model_opts(opt)
+            ArgumentParser.validate_model_opts(opt)
+            self.spawn(_trainer_worker, opt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import pickle
+
+import torch
+from torchtext.data import Example
+
+import onmt.inputters as inputters
+from onmt.inputters.dataset_base import dataset_store
+from onmt.inputters.example_store import ExampleViews
+from onmt.inputters.inputter import make_batch
+
+
+class TestExampleStore(unittest.TestCase):
+    SRC = [
+        "hello￨A world￨B".encode("utf-8"),
+        "a￨A longer￨C sentence￨A with￨B features￨C".encode("utf-8"),
+        "one￨A".encode("utf-8"),
+        "hello￨B again￨A".encode("utf-8"),
+    ]
+    TGT = [
+        "bonjour le monde".encode("utf-8"),
+        "une phrase plus longue".encode("utf-8"),
+        "un".encode("utf-8"),
+        "bonjour encore".encode("utf-8"),
+    ]
+
+    def build_dataset(self, dynamic_dict, filter_pred=None):
+        fields = inputters.get_fields(
+            "text", 1, 0, dynamic_dict=dynamic_dict)
+        reader = inputters.TextDataReader()
+        return inputters.Dataset(
+            fields, readers=[reader, reader],
+            data=[("src", self.SRC), ("tgt", self.TGT)],
+            dirs=[None, None], sort_key=inputters.text_sort_key,
+            filter_pred=filter_pred)
+
+    def test_views_match_examples(self):
+        fields = inputters.get_fields("text", 1, 0, dynamic_dict=False)
+        ex_fields = {k: [(k, v)] for k, v in fields.items()}
+        dataset = self.build_dataset(False)
+        self.assertIsInstance(dataset.examples, ExampleViews)
+        self.assertEqual(len(dataset), len(self.SRC))
+        for i, ex in enumerate(dataset.examples):
+            ex_dict = {"src": self.SRC[i].decode("utf-8"),
+                       "tgt": self.TGT[i].decode("utf-8"), "indices": i}
+            expected = Example.fromdict(ex_dict, ex_fields)
+            self.assertEqual(ex.src, expected.src)
+            self.assertEqual(ex.tgt, expected.tgt)
+            self.assertEqual(ex.indices, i)
+            self.assertFalse(hasattr(ex, "src_map"))
+        self.assertEqual(list(dataset.lengths["src"]), [2, 5, 1, 2])
+        self.assertEqual(list(dataset.lengths["tgt"]), [3, 4, 1, 2])
+
+    def test_filter_keeps_copy_vocabs_by_index(self):
+        dataset = self.build_dataset(
+            True, filter_pred=lambda ex: len(ex.src[0]) > 1)
+        self.assertEqual([ex.indices for ex in dataset.examples], [0, 1, 3])
+        for ex in dataset.examples:
+            src_vocab = dataset.src_vocabs[ex.indices]
+            self.assertEqual(
+                ex.src_map.tolist(), [src_vocab.stoi[w] for w in ex.src[0]])
+            self.assertEqual(ex.alignment.tolist()[1:-1],
+                             [src_vocab.stoi[w] for w in ex.tgt[0]])
+        with self.assertRaises(IndexError):
+            dataset.src_vocabs[2]
+
+    def test_copy_vocabs_are_cached(self):
+        dataset = self.build_dataset(True)
+        src_vocabs = dataset.src_vocabs
+        src_vocabs.cache_size = 2
+        first = src_vocabs[0]
+        self.assertIs(src_vocabs[0], first)
+        src_vocabs[1]
+        src_vocabs[0]
+        # 1 is the least recently used
+        src_vocabs[2]
+        self.assertEqual(list(src_vocabs._cache), [0, 2])
+        self.assertIs(src_vocabs[0], first)
+        self.assertEqual(
+            pickle.loads(pickle.dumps(src_vocabs))._cache, {})
+
+    def test_pickle_roundtrip(self):
+        dataset = self.build_dataset(True)
+        dataset.fields = []
+        loaded = pickle.loads(pickle.dumps(dataset))
+        for ex, loaded_ex in zip(dataset.examples, loaded.examples):
+            self.assertEqual(ex.src, loaded_ex.src)
+            self.assertEqual(ex.tgt, loaded_ex.tgt)
+            self.assertTrue(torch.equal(ex.src_map, loaded_ex.src_map))
+
+    def test_store_from_torchtext_examples(self):
+        dataset = self.build_dataset(False)
+        store = dataset.examples.store
+        dataset.examples = list(dataset.examples)
+        self.assertIsNot(dataset_store(dataset), store)
+        rebuilt = dataset_store(dataset)
+        for i in range(len(store)):
+            self.assertEqual(rebuilt.get(i, "src"), store.get(i, "src"))
+            self.assertEqual(rebuilt.get(i, "tgt"), store.get(i, "tgt"))
+
+    def test_numericalized_batches_match(self):
+        for dynamic_dict in [False, True]:
+            dataset = self.build_dataset(dynamic_dict)
+            fields = inputters.get_fields(
+                "text", 1, 0, dynamic_dict=dynamic_dict)
+            counters = inputters.count_tokens(dataset.examples, fields)
+            for side in ["src", "tgt"]:
+                for name, field in fields[side]:
+                    # leave some tokens out of the vocab
+                    inputters.inputter._build_field_vocab(
+                        field, counters[name], max_size=3)
+            dataset.fields = fields
+            examples = dataset.examples[::-1]
+            expected = make_batch(dataset, examples)
+            dataset.examples.store.numericalize(fields)
+            batch = make_batch(dataset, examples)
+            self.assertTrue(torch.equal(batch.src[0], expected.src[0]))
+            self.assertTrue(torch.equal(batch.src[1], expected.src[1]))
+            self.assertTrue(torch.equal(batch.tgt, expected.tgt))
+            if dynamic_dict:
+                self.assertTrue(
+                    torch.equal(batch.src_map, expected.src_map))
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import torch
+
+from onmt.inputters.audio_dataset import AudioSeqField
+from onmt.inputters.feature_cache import FeatureCache, CachedArray
+
+
+class TestFeatureCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = FeatureCache(os.path.join(self.tmp_dir, "cache"))
+        self.path = os.path.join(self.tmp_dir, "sound.wav")
+        with open(self.path, "w") as f:
+            f.write("sound")
+        self.extracted = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def extract(self, path):
+        self.extracted.append(path)
+        torch.manual_seed(len(self.extracted))
+        return torch.randn(5, 3 + len(self.extracted))
+
+    def test_features_are_extracted_once(self):
+        cached = self.cache.get(self.path, {"n_fft": 4}, self.extract)
+        self.assertIsInstance(cached, CachedArray)
+        self.assertEqual(cached.size(), torch.Size([5, 4]))
+        self.assertEqual(cached.size(1), 4)
+        torch.manual_seed(1)
+        expected = torch.randn(5, 4)
+        self.assertTrue(torch.allclose(cached.load(), expected, atol=1e-2))
+        again = self.cache.get(self.path, {"n_fft": 4}, self.extract)
+        self.assertEqual(self.extracted, [self.path])
+        self.assertTrue(torch.equal(again.load(), cached.load()))
+
+    def test_features_are_extracted_again_on_changes(self):
+        self.cache.get(self.path, {"n_fft": 4}, self.extract)
+        self.cache.get(self.path, {"n_fft": 8}, self.extract)
+        self.assertEqual(len(self.extracted), 2)
+        with open(self.path, "a") as f:
+            f.write(" changed")
+        cached = self.cache.get(self.path, {"n_fft": 4}, self.extract)
+        self.assertEqual(len(self.extracted), 3)
+        self.assertEqual(cached.size(1), 6)
+
+    def test_cached_paths_are_absolute(self):
+        cwd = os.getcwd()
+        os.chdir(self.tmp_dir)
+        try:
+            cache = FeatureCache("relative")
+            cached = cache.get(self.path, {}, self.extract)
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(cached.path, os.path.join(
+            os.path.realpath(self.tmp_dir), "relative",
+            os.path.basename(cached.path)))
+        self.assertEqual(cached.load().size(), torch.Size([5, 4]))
+
+    def test_pad_cached_spectrograms(self):
+        field = AudioSeqField(include_lengths=True)
+        spects = [self.extract(self.path) for _ in range(2)]
+        cached = [self.cache.get(self.path, {"i": i}, lambda _: spect)
+                  for i, spect in enumerate(spects)]
+        expected, expected_lengths = field.pad(spects)
+        padded, lengths = field.pad(cached)
+        self.assertEqual(lengths, expected_lengths)
+        self.assertTrue(torch.allclose(padded, expected, atol=1e-2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
-from onmt.inputters.image_dataset import ImageDataReader
+from onmt.inputters.image_dataset import ImageDataReader, LazyImage, \
+    ImageBatcher, batch_img
 
 import os
 import shutil
@@ -87,6 +88,23 @@ class TestImageDataReader(unittest.TestCase):
                              self._IMG_DATA_FMT.format(i))
         self.assertGreater(i, 0, "No image data was read.")
 
+    def test_read_lazy_images(self):
+        rdr = ImageDataReader(channel_size=self._N_CHANNELS)
+        lazy_rdr = ImageDataReader(channel_size=self._N_CHANNELS, lazy=True)
+        imgs = [img["src"] for img in rdr.read(
+            self._IMG_LIST_FNAMES_PATH, "src", self._IMG_DATA_DIR)]
+        lazy_imgs = [img["src"] for img in lazy_rdr.read(
+            self._IMG_LIST_FNAMES_PATH, "src", self._IMG_DATA_DIR)]
+        for img, lazy_img in zip(imgs, lazy_imgs):
+            self.assertIsInstance(lazy_img, LazyImage)
+            self.assertEqual(lazy_img.size(), img.size())
+            self.assertTrue(torch.equal(lazy_img.load(), img))
+        expected = batch_img(imgs, None)
+        batcher = ImageBatcher(num_threads=3, cache_size=5)
+        for _ in range(2):
+            self.assertTrue(torch.equal(batcher(lazy_imgs, None), expected))
+        self.assertEqual(len(batcher._cache), 5)
+
 
 class TestImageDataReader1Channel(TestImageDataReader):
     _N_CHANNELS = 1
@@ -0,0 +1,426 @@
+import unittest
+import os
+import random
+import shutil
+import tempfile
+from collections import Counter
+from functools import partial
+from itertools import islice
+
+import numpy as np
+import torch
+
+import onmt.inputters as inputters
+from onmt.inputters.manifest import shard_stats, shard_lengths, \
+    epoch_batches
+from onmt.inputters.inputter import DatasetLazyIter, RawTextLazyIter, \
+    batch_iter, plan_batches, make_src, make_tgt, make_src_index, \
+    filter_example, filter_raw_example, OrderedIterator, _flat_positions
+
+
+def _read_lines(path, n):
+    with open(path, "rb") as f:
+        return list(islice(f, n))
+
+
+class _Example(object):
+    def __init__(self, src_len, tgt_len):
+        self.src = [["a"] * src_len]
+        self.tgt = [["b"] * tgt_len]
+
+
+def _max_tok_len():
+    # batch_iter size function for token batching
+    longest = {}
+
+    def batch_size_fn(new, count, sofar):
+        if count == 1:
+            longest["src"], longest["tgt"] = 0, 0
+        longest["src"] = max(longest["src"], len(new.src[0]) + 2)
+        longest["tgt"] = max(longest["tgt"], len(new.tgt[0]) + 1)
+        return count * max(longest["src"], longest["tgt"])
+    return batch_size_fn
+
+
+class TestPlanBatches(unittest.TestCase):
+    def check(self, src_lengths, tgt_lengths, batch_size, batch_type,
+              batch_size_multiple):
+        examples = [_Example(s, t) for s, t in zip(src_lengths, tgt_lengths)]
+        expected = [len(b) for b in batch_iter(
+            examples, batch_size,
+            batch_size_fn=_max_tok_len() if batch_type == "tokens" else None,
+            batch_size_multiple=batch_size_multiple)]
+        bounds = plan_batches(
+            src_lengths, tgt_lengths, batch_size, batch_type=batch_type,
+            batch_size_multiple=batch_size_multiple)
+        self.assertEqual([end - start for start, end in bounds], expected)
+        self.assertEqual(
+            [start for start, _ in bounds],
+            [0] + [end for _, end in bounds[:-1]])
+
+    def test_same_batches_as_batch_iter(self):
+        rng = np.random.RandomState(1)
+        for trial in range(500):
+            n = rng.randint(1, 80)
+            src_lengths = rng.randint(0, 30, n)
+            tgt_lengths = rng.randint(0, 30, n)
+            if trial % 3:
+                order = np.lexsort((tgt_lengths, src_lengths))
+                src_lengths = src_lengths[order]
+                tgt_lengths = tgt_lengths[order]
+            self.check(
+                src_lengths, tgt_lengths, rng.randint(1, 150),
+                ["sents", "tokens"][trial % 2], rng.choice([1, 2, 3, 8]))
+
+    def test_empty(self):
+        self.assertEqual(
+            plan_batches(np.zeros(0), np.zeros(0), 10, "tokens"), [])
+
+
+class TestCopyAlignment(unittest.TestCase):
+    DATA = [torch.tensor([2, 3, 2]), torch.tensor([4]),
+            torch.tensor([2, 5, 3, 6, 0])]
+
+    def test_make_src(self):
+        src_map = make_src(self.DATA, None)
+        self.assertEqual(src_map.shape, (5, 3, 7))
+        for i, sent in enumerate(self.DATA):
+            expected = torch.zeros(5, 7)
+            expected[torch.arange(len(sent)), sent] = 1
+            self.assertTrue(torch.equal(src_map[:, i], expected))
+
+    def test_make_tgt(self):
+        alignment = make_tgt(self.DATA, None)
+        self.assertEqual(alignment.tolist(), [
+            [2, 4, 2], [3, 0, 5], [2, 0, 3], [0, 0, 6], [0, 0, 0]])
+
+    def test_flat_positions(self):
+        data = self.DATA[:1] + [torch.tensor([], dtype=torch.long)] + \
+            self.DATA[1:]
+        flat, pos, batch_idx, max_len = _flat_positions(data)
+        self.assertEqual(flat.tolist(), [2, 3, 2, 4, 2, 5, 3, 6, 0])
+        self.assertEqual(pos.tolist(), [0, 1, 2, 0, 0, 1, 2, 3, 4])
+        self.assertEqual(batch_idx.tolist(), [0, 0, 0, 2, 3, 3, 3, 3, 3])
+        self.assertEqual(max_len, 5)
+
+    def test_make_src_index(self):
+        src_map = make_src_index(self.DATA, None)
+        self.assertEqual(src_map.tolist(), [
+            [2, 4, 2], [3, -1, 5], [2, -1, 3], [-1, -1, 6], [-1, -1, 0]])
+
+
+class TestFilterRawExample(unittest.TestCase):
+    def dataset(self, src, tgt, **kwargs):
+        reader = inputters.TextDataReader()
+        return inputters.Dataset(
+            inputters.get_fields("text", 0, 0), readers=[reader, reader],
+            data=[("src", src), ("tgt", tgt)], dirs=[None, None],
+            sort_key=inputters.text_sort_key, **kwargs)
+
+    def test_reasons(self):
+        ex = {"src": "a b c d", "tgt": "e", "indices": 0}
+        self.assertIsNone(filter_raw_example(ex))
+        self.assertEqual(filter_raw_example(ex, max_src_len=3), "length")
+        self.assertIsNone(
+            filter_raw_example(ex, max_src_len=3, src_truncate=3))
+        self.assertEqual(filter_raw_example(ex, min_tgt_len=2), "length")
+        self.assertEqual(filter_raw_example(ex, max_ratio=3), "ratio")
+        self.assertIsNone(filter_raw_example(ex, max_ratio=4))
+        self.assertEqual(
+            filter_raw_example({"src": "", "tgt": "e"}, max_ratio=3),
+            "length")
+        self.assertIsNone(
+            filter_raw_example({"src": "a b c d", "tgt": "/img.png"}))
+
+    def test_same_examples_as_filter_pred(self):
+        src = _read_lines("data/src-val.txt", 200)
+        tgt = _read_lines("data/tgt-val.txt", 200)
+        expected = self.dataset(src, tgt, filter_pred=partial(
+            filter_example, max_src_len=20, max_tgt_len=25))
+        dataset = self.dataset(src, tgt, raw_filter=partial(
+            filter_raw_example, max_src_len=20, max_tgt_len=25))
+        self.assertEqual([(ex.src, ex.tgt, ex.indices) for ex in dataset],
+                         [(ex.src, ex.tgt, ex.indices) for ex in expected])
+        self.assertEqual(dataset.rejected["length"], 200 - len(expected))
+
+    def test_dedup(self):
+        src = [b"a b\n", b"c\n", b"a b\n", b"a b\n", b"d\n"]
+        tgt = [b"x\n", b"y\n", b"x\n", b"z\n", b"\n"]
+        dataset = self.dataset(src, tgt, dedup=True, raw_filter=partial(
+            filter_raw_example))
+        self.assertEqual([ex.indices for ex in dataset], [0, 1, 3])
+        self.assertEqual(dataset.rejected,
+                         Counter({"duplicate": 1, "length": 1}))
+
+    def test_dedup_keeps_sides_apart(self):
+        dataset = self.dataset([b"a\n", b"a b\n"], [b"b c\n", b"c\n"],
+                               dedup=True)
+        self.assertEqual(len(dataset), 2)
+        self.assertEqual(dataset.rejected, Counter())
+
+    def test_all_rejected(self):
+        src = _read_lines("data/src-val.txt", 10)
+        tgt = _read_lines("data/tgt-val.txt", 10)
+        dataset = self.dataset(src, tgt, raw_filter=partial(
+            filter_raw_example, max_src_len=0))
+        self.assertEqual(len(dataset), 0)
+        self.assertEqual(dataset.rejected["length"], 10)
+
+
+class TestDatasetLazyIter(unittest.TestCase):
+    N_SHARDS = 3
+    SHARD_SIZE = 40
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        n = cls.N_SHARDS * cls.SHARD_SIZE
+        src = _read_lines("data/src-val.txt", n)
+        tgt = _read_lines("data/tgt-val.txt", n)
+        fields = inputters.get_fields("text", 0, 0)
+        reader = inputters.TextDataReader()
+        cls.raw_paths = []
+        for side, lines in [("src", src), ("tgt", tgt)]:
+            path = os.path.join(cls.tmp_dir, "%s.txt" % side)
+            with open(path, "wb") as f:
+                f.writelines(lines)
+            cls.raw_paths.append(path)
+        cls.paths = []
+        cls.manifest = {"shards": {}}
+        for i in range(cls.N_SHARDS):
+            begin, end = i * cls.SHARD_SIZE, (i + 1) * cls.SHARD_SIZE
+            dataset = inputters.Dataset(
+                fields, readers=[reader, reader],
+                data=[("src", src[begin:end]), ("tgt", tgt[begin:end])],
+                dirs=[None, None], sort_key=inputters.text_sort_key)
+            path = os.path.join(cls.tmp_dir, "data.train.%d.pt" % i)
+            dataset.save(path)
+            cls.paths.append(path)
+            cls.manifest["shards"][path] = shard_stats(
+                dataset, path, cls.SHARD_SIZE)
+        cls.fields = inputters.build_vocab(
+            cls.paths, fields, "text", False, "", 1000, 1, "", 1000, 1)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+    def batches(self, n_batches=None, **kwargs):
+        random.seed(1)
+        it = DatasetLazyIter(
+            self.paths, self.fields, 100, "tokens", 1, "cpu", True,
+            **kwargs)
+        return [(batch.src[0], batch.tgt, batch.indices)
+                for batch in islice(it, n_batches)]
+
+    def resumed_batches(self, n_first, n_batches=None, rank=0, **kwargs):
+        random.seed(1)
+        it = DatasetLazyIter(
+            self.paths, self.fields, 100, "tokens", 1, "cpu", True,
+            **kwargs)
+        for _ in islice(it, n_first):
+            pass
+        random.seed(1)
+        resumed = DatasetLazyIter(
+            self.paths, self.fields, 100, "tokens", 1, "cpu", True,
+            rank=rank, **kwargs)
+        resumed.load_state_dict(it.state_dict())
+        return [(batch.src[0], batch.tgt, batch.indices)
+                for batch in islice(resumed, n_batches)]
+
+    def raw_batches(self, n_batches=None, **kwargs):
+        random.seed(1)
+        it = RawTextLazyIter(
+            self.raw_paths[0], self.raw_paths[1], self.fields, 100,
+            "tokens", 1, "cpu", True, shard_size=self.SHARD_SIZE, **kwargs)
+        return [(batch.src[0], batch.tgt, batch.indices)
+                for batch in islice(it, n_batches)]
+
+    def assert_same_batches(self, batches, other):
+        self.assertEqual(len(batches), len(other))
+        for (src, tgt, idx), (o_src, o_tgt, o_idx) in zip(batches, other):
+            self.assertTrue(torch.equal(src, o_src))
+            self.assertTrue(torch.equal(tgt, o_tgt))
+            self.assertTrue(torch.equal(idx, o_idx))
+
+    def test_prefetch_yields_same_batches(self):
+        expected = self.batches(repeat=False, num_batches_multiple=7)
+        for prefetch in [1, 2]:
+            self.assert_same_batches(
+                expected,
+                self.batches(repeat=False, num_batches_multiple=7,
+                             prefetch=prefetch))
+
+    def test_prefetch_cycles_shards(self):
+        n_batches = 3 * len(self.batches(repeat=False))
+        self.assert_same_batches(
+            self.batches(n_batches),
+            self.batches(n_batches, prefetch=1))
+
+    def test_collate_workers_yield_same_batches(self):
+        expected = self.batches(repeat=False, num_batches_multiple=7)
+        self.assert_same_batches(
+            expected,
+            self.batches(repeat=False, num_batches_multiple=7,
+                         num_workers=2, queue_size=3))
+        self.assert_same_batches(
+            expected,
+            self.batches(repeat=False, num_batches_multiple=7,
+                         num_workers=2, prefetch=1))
+
+    def test_workers_are_stopped(self):
+        it = RawTextLazyIter(
+            self.raw_paths[0], self.raw_paths[1], self.fields, 100,
+            "tokens", 1, "cpu", True, shard_size=self.SHARD_SIZE,
+            repeat=False, num_workers=2, num_shard_workers=1)
+        n_batches = sum(1 for _ in it)
+        self.assertIsNone(it._collator._pool)
+        self.assertIsNone(it._pool)
+        batches = iter(it)
+        for _ in islice(batches, n_batches // 2):
+            pass
+        pools = [it._collator._pool, it._pool]
+        workers = [w for pool in pools for w in pool._pool]
+        self.assertTrue(all(w.is_alive() for w in workers))
+        # the iteration is left before its end
+        batches.close()
+        self.assertIsNone(it._collator._pool)
+        self.assertIsNone(it._pool)
+        self.assertFalse(any(w.is_alive() for w in workers))
+
+    def test_ranks_take_turns_on_batches(self):
+        expected = self.batches(repeat=False, num_batches_multiple=6)
+        for rank in range(3):
+            self.assert_same_batches(
+                expected[rank::3],
+                self.batches(repeat=False, num_batches_multiple=6,
+                             rank=rank, world_size=3, num_workers=rank))
+
+    def test_ranks_cycle_through_own_shards(self):
+        n_batches = 10
+        paths = self.paths
+        for rank in range(2):
+            self.paths = paths[rank::2]
+            expected = self.batches(n_batches)
+            self.paths = paths
+            self.assert_same_batches(
+                expected,
+                self.batches(n_batches, rank=rank, world_size=2))
+
+    def test_manifest_epoch_batches(self):
+        for batch_size, batch_type in [(7, "sents"), (100, "tokens")]:
+            it = DatasetLazyIter(
+                self.paths, self.fields, batch_size, batch_type, 1, "cpu",
+                True, repeat=False)
+            n_batches = sum(1 for _ in it)
+            estimate = epoch_batches(self.manifest, batch_size, batch_type)
+            if batch_type == "sents":
+                self.assertEqual(estimate, n_batches)
+            else:
+                self.assertLessEqual(estimate, n_batches)
+
+    def test_manifest_lengths_sorted_like_pools(self):
+        for path in self.paths:
+            dataset = inputters.inputter.load_dataset(path)
+            src, tgt = dataset.lengths["src"], dataset.lengths["tgt"]
+            it = OrderedIterator(dataset, 10, train=False)
+            pool = it._sort_pool(np.arange(len(dataset)), src, tgt)
+            src_lengths, tgt_lengths = shard_lengths(
+                self.manifest["shards"][path])
+            self.assertEqual(src_lengths.tolist(), src[pool].tolist())
+            self.assertEqual(tgt_lengths.tolist(), tgt[pool].tolist())
+
+    def test_resume_from_state(self):
+        n_batches = 3 * len(self.batches(repeat=False))
+        expected = self.batches(n_batches)
+        for n_first in [0, 1, 20, 50]:
+            self.assert_same_batches(
+                expected[n_first:],
+                self.resumed_batches(n_first, n_batches - n_first))
+        self.assert_same_batches(
+            expected[20:],
+            self.resumed_batches(20, n_batches - 20, prefetch=1,
+                                 num_workers=2))
+        expected = self.batches(repeat=False, num_batches_multiple=7)
+        self.assert_same_batches(
+            expected[len(expected) - 3:],
+            self.resumed_batches(len(expected) - 3, repeat=False,
+                                 num_batches_multiple=7))
+
+    def test_ranks_resume_from_state(self):
+        expected = self.batches(repeat=False, num_batches_multiple=6)
+        for rank in range(3):
+            self.assert_same_batches(
+                expected[rank::3][5:],
+                self.resumed_batches(5, rank=rank, repeat=False,
+                                     num_batches_multiple=6, world_size=3))
+
+    def test_ranks_resume_from_own_state(self):
+        n_first, n_batches = 7, 10
+        # the ranks take turns on the batches, then have their own shards
+        for world_size, kwargs in [
+                (3, {"repeat": False, "num_batches_multiple": 6}), (2, {})]:
+            states = {}
+            expected = {}
+            for rank in range(world_size):
+                random.seed(1)
+                it = DatasetLazyIter(
+                    self.paths, self.fields, 100, "tokens", 1, "cpu", True,
+                    rank=rank, world_size=world_size, **kwargs)
+                batches = [(batch.src[0], batch.tgt, batch.indices)
+                           for batch in islice(it, n_first + n_batches)]
+                expected[rank] = batches[n_first:]
+                random.seed(1)
+                it = DatasetLazyIter(
+                    self.paths, self.fields, 100, "tokens", 1, "cpu", True,
+                    rank=rank, world_size=world_size, **kwargs)
+                for _ in islice(it, n_first):
+                    pass
+                states[rank] = it.state_dict()
+            # the states of all the ranks, as saved by the trainer
+            for rank in range(world_size):
+                random.seed(1)
+                resumed = DatasetLazyIter(
+                    self.paths, self.fields, 100, "tokens", 1, "cpu", True,
+                    rank=rank, world_size=world_size, **kwargs)
+                resumed.load_state_dict({"ranks": states})
+                self.assert_same_batches(
+                    expected[rank],
+                    [(batch.src[0], batch.tgt, batch.indices)
+                     for batch in islice(resumed, n_batches)])
+
+        # the shards of rank 1 are not at the position of rank 0
+        random.seed(1)
+        resumed = DatasetLazyIter(
+            self.paths, self.fields, 100, "tokens", 1, "cpu", True,
+            rank=1, world_size=2)
+        resumed.load_state_dict(states[0])
+        self.assert_same_batches(
+            self.batches(n_batches, rank=1, world_size=2),
+            [(batch.src[0], batch.tgt, batch.indices)
+             for batch in islice(resumed, n_batches)])
+
+    def test_raw_text_yields_same_batches(self):
+        expected = self.batches(repeat=False, num_batches_multiple=7)
+        self.assert_same_batches(
+            expected,
+            self.raw_batches(repeat=False, num_batches_multiple=7))
+        self.assert_same_batches(
+            expected,
+            self.raw_batches(repeat=False, num_batches_multiple=7,
+                             num_shard_workers=2))
+
+    def test_raw_text_cycles_files(self):
+        n_batches = 3 * len(self.batches(repeat=False))
+        self.assert_same_batches(
+            self.batches(n_batches),
+            self.raw_batches(n_batches, num_shard_workers=1, prefetch=1))
+
+    def test_prefetch_raises_loading_errors(self):
+        it = DatasetLazyIter(
+            self.paths + [os.path.join(self.tmp_dir, "missing.pt")],
+            self.fields, 100, "sents", 1, "cpu", True, repeat=False,
+            prefetch=1)
+        with self.assertRaises(IOError):
+            for _ in it:
+                pass
@@ -0,0 +1,63 @@
+import unittest
+import os
+
+import torch
+
+import onmt.inputters as inputters
+from onmt.inputters.mmap_dataset import save_mmap_shard, MmapDataset, \
+    is_mmap_shard
+
+
+class TestMmapDataset(unittest.TestCase):
+    SRC = [
+        "hello￨A world￨B".encode("utf-8"),
+        "a￨A longer￨C sentence￨A with￨B features￨C".encode("utf-8"),
+        "one￨A".encode("utf-8"),
+    ]
+    TGT = [
+        "bonjour le monde".encode("utf-8"),
+        "une phrase plus longue".encode("utf-8"),
+        "un".encode("utf-8"),
+    ]
+    FILE_NAME = "test_mmap_dataset.bin"
+
+    def build_dataset(self, dynamic_dict):
+        fields = inputters.get_fields(
+            "text", 1, 0, dynamic_dict=dynamic_dict)
+        reader = inputters.TextDataReader()
+        return inputters.Dataset(
+            fields, readers=[reader, reader],
+            data=[("src", self.SRC), ("tgt", self.TGT)],
+            dirs=[None, None], sort_key=inputters.text_sort_key,
+            filter_pred=lambda ex: len(ex.src[0]) > 1)
+
+    def tearDown(self):
+        if os.path.exists(self.FILE_NAME):
+            os.remove(self.FILE_NAME)
+
+    def test_examples_match_pickled_dataset(self):
+        for dynamic_dict in [False, True]:
+            dataset = self.build_dataset(dynamic_dict)
+            save_mmap_shard(dataset, self.FILE_NAME)
+            self.assertTrue(is_mmap_shard(self.FILE_NAME))
+            mm_dataset = MmapDataset(self.FILE_NAME)
+            self.assertEqual(len(mm_dataset), len(dataset))
+            for ex, mm_ex in zip(dataset.examples, mm_dataset.examples):
+                self.assertEqual(ex.src, mm_ex.src)
+                self.assertEqual(ex.tgt, mm_ex.tgt)
+                self.assertEqual(ex.indices, mm_ex.indices)
+                if dynamic_dict:
+                    self.assertTrue(torch.equal(ex.src_map, mm_ex.src_map))
+                    self.assertTrue(
+                        torch.equal(ex.alignment, mm_ex.alignment))
+                    self.assertEqual(
+                        dataset.src_vocabs[ex.indices].itos,
+                        mm_dataset.src_vocabs[mm_ex.indices].itos)
+                else:
+                    self.assertFalse(hasattr(mm_ex, "src_map"))
+
+    def test_load_dataset_dispatches_on_format(self):
+        dataset = self.build_dataset(False)
+        save_mmap_shard(dataset, self.FILE_NAME)
+        loaded = inputters.inputter.load_dataset(self.FILE_NAME)
+        self.assertIsInstance(loaded, MmapDataset)
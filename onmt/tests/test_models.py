@@ -3,6 +3,7 @@ import unittest
 import math
 
 import torch
+import torch.utils.checkpoint
 
 import onmt
 import onmt.inputters
@@ -211,6 +212,55 @@ class TestModel(unittest.TestCase):
         self.assertEqual(outputs.size(), outputsize.size())
         self.assertEqual(type(outputs), torch.Tensor)
 
+    @unittest.skipIf(
+        not hasattr(torch.utils.checkpoint, "set_device_states"),
+        "torch.utils.checkpoint does not restore the RNG state")
+    def test_checkpoint_layers_same_grads(self):
+        word_field = self.get_field()
+        word_field.base_field.build_vocab([[str(i) for i in range(10)]])
+        for self_attn_type, max_relative_positions in [
+                ("scaled-dot", 0), ("scaled-dot", 4), ("average", 0)]:
+            opt = copy.deepcopy(self.opt)
+            opt.encoder_type = opt.decoder_type = "transformer"
+            opt.layers, opt.rnn_size, opt.word_vec_size = 3, 16, 16
+            opt.heads, opt.transformer_ff, opt.dropout = 2, 32, 0.3
+            opt.position_encoding = True
+            opt.self_attn_type = self_attn_type
+            opt.max_relative_positions = max_relative_positions
+            ArgumentParser.update_model_opts(opt)
+            enc = build_encoder(opt, build_embeddings(opt, word_field))
+            dec = build_decoder(
+                opt, build_embeddings(opt, word_field, for_encoder=False))
+            model = onmt.models.model.NMTModel(enc, dec)
+            src = torch.randint(2, 12, (7, 3, 1))
+            tgt = torch.randint(2, 12, (6, 3, 1))
+            lengths = torch.full((3,), 7, dtype=torch.long)
+            # the sums of the normalized outputs and of the attention
+            # have no gradients
+            weights = torch.randn(5, 3, 16), torch.randn(5, 3, 7)
+
+            def grads(checkpoint, every=1):
+                model.zero_grad()
+                enc.set_checkpoint(checkpoint, every)
+                dec.set_checkpoint(checkpoint, every)
+                torch.manual_seed(1)
+                outputs, attns = model(src, tgt, lengths)
+                loss = (outputs * weights[0]).sum() + \
+                    (attns["std"] * weights[1]).sum()
+                loss.backward()
+                return [p.grad.clone() for p in model.parameters()]
+
+            expected = grads("none")
+            for checkpoint, every in [("all", 1), ("all", 2),
+                                      ("attention", 1), ("attention", 2)]:
+                for g, e in zip(grads(checkpoint, every), expected):
+                    self.assertTrue(torch.allclose(g, e, atol=1e-6))
+            # nothing is recomputed when decoding
+            model.eval()
+            with torch.no_grad():
+                outputs, _ = model(src, tgt, lengths)
+            self.assertFalse(outputs.requires_grad)
+
 
 def _add_test(param_setting, methodname):
     """
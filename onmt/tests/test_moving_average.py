@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+import torch
+import torch.nn as nn
+
+from onmt.models.model_saver import ModelSaver
+from onmt.utils.moving_average import MovingAverage
+
+
+def _expected_average(steps, decay):
+    """The average computed like before, with a copy per update."""
+    average = None
+    for step, params in steps:
+        if average is None:
+            average = [p.float() for p in params]
+        else:
+            d = max(decay, 1 - (step + 1) / (step + 10))
+            average = [(1 - d) * avg + p.float() * d
+                       for avg, p in zip(average, params)]
+    return average
+
+
+class TestMovingAverage(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(1)
+        self.model = nn.Sequential(nn.Linear(4, 3), nn.Linear(3, 2))
+        self.model.generator = nn.Linear(2, 5)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def train(self, average, n_steps=5, dtype=torch.float):
+        steps = [(0, [p.detach().clone() for p in self.model.parameters()])]
+        for step in range(1, n_steps + 1):
+            with torch.no_grad():
+                for p in self.model.parameters():
+                    p.copy_(torch.randn(p.size()).to(dtype))
+            average.update(step)
+            steps.append(
+                (step, [p.detach().clone()
+                        for p in self.model.parameters()]))
+        return steps
+
+    def assert_params(self, values, atol=1e-6):
+        for p, v in zip(self.model.parameters(), values):
+            self.assertTrue(torch.allclose(p.float(), v.float(), atol=atol))
+
+    def test_update_in_place(self):
+        average = MovingAverage(self.model.parameters(), 0.1)
+        flat = average.flat.data_ptr()
+        steps = self.train(average)
+        self.assertEqual(average.flat.data_ptr(), flat)
+        for avg, e in zip(average.average, _expected_average(steps, 0.1)):
+            self.assertTrue(torch.allclose(avg, e, atol=1e-6))
+
+    def test_swapped(self):
+        average = MovingAverage(self.model.parameters(), 0.1)
+        steps = self.train(average)
+        ptrs = [p.data_ptr() for p in self.model.parameters()]
+        with average.swapped():
+            self.assert_params(average.average)
+        self.assertEqual([p.data_ptr() for p in self.model.parameters()],
+                         ptrs)
+        self.assert_params(steps[-1][1])
+
+    def test_swapped_copies_converted_average(self):
+        self.model.half()
+        average = MovingAverage(self.model.parameters(), 0.1, "cpu")
+        self.assertIsNotNone(average._buffer)
+        steps = self.train(average, dtype=torch.half)
+        with average.swapped():
+            self.assert_params(average.average, atol=1e-2)
+        self.assert_params(steps[-1][1], atol=0)
+        for avg, e in zip(average.average, _expected_average(steps, 0.1)):
+            self.assertTrue(torch.allclose(avg, e, atol=1e-6))
+
+    def test_save_average(self):
+        average = MovingAverage(self.model.parameters(), 0.1)
+        steps = self.train(average)
+        saver = ModelSaver(os.path.join(self.tmp_dir, "model"), self.model,
+                           None, None, SimpleNamespace(state_dict=dict))
+        saver.save(5, moving_average=average)
+        self.assert_params(steps[-1][1])
+        checkpoint = torch.load(os.path.join(self.tmp_dir,
+                                             "model_step_5.pt"))
+        saved = dict(checkpoint["model"])
+        saved.update(("generator." + k, v)
+                     for k, v in checkpoint["generator"].items())
+        for (name, _), avg in zip(self.model.named_parameters(),
+                                  average.average):
+            self.assertTrue(torch.equal(saved[name], avg))
+
+
+if __name__ == "__main__":
+    unittest.main()
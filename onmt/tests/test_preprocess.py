@@ -9,9 +9,13 @@ import glob
 import os
 import codecs
 
+import torch
+
 import onmt
 import onmt.inputters
 import onmt.opts
+from onmt.inputters.manifest import manifest_path, load_manifest, \
+    shard_lengths
 import preprocess
 
 
@@ -52,19 +56,91 @@ class TestData(unittest.TestCase):
         train_data_files = preprocess.build_save_dataset(
             'train', fields, src_reader, tgt_reader, opt)
 
+        manifest = load_manifest(manifest_path(SAVE_DATA_PREFIX, 'train'))
+        with open(opt.train_src, 'rb') as f:
+            n_read = sum(1 for _ in f)
+        self.assertEqual(
+            manifest["examples"] + manifest["filtered"], n_read)
+        for path in train_data_files[:2]:
+            stats = manifest["shards"][path]
+            dataset = onmt.inputters.inputter.load_dataset(path)
+            self.assertEqual(stats["examples"], len(dataset))
+            src_lengths, tgt_lengths = shard_lengths(stats)
+            self.assertEqual(sorted(src_lengths),
+                             sorted(dataset.lengths["src"]))
+            self.assertEqual(sorted(tgt_lengths),
+                             sorted(dataset.lengths["tgt"]))
+
         preprocess.build_save_vocab(train_data_files, fields, opt)
+        counted = torch.load(SAVE_DATA_PREFIX + '.vocab.pt')
+
+        # the saved token counts give the same vocab as reloading shards
+        for path in train_data_files:
+            os.remove(onmt.inputters.counts_path(path))
+        fields = onmt.inputters.get_fields("text", 0, 0)
+        fields = preprocess.build_save_vocab(train_data_files, fields, opt)
+        reloaded = torch.load(SAVE_DATA_PREFIX + '.vocab.pt')
+        for side in ['src', 'tgt']:
+            self.assertEqual(reloaded[side].base_field.vocab.itos,
+                             counted[side].base_field.vocab.itos)
+
+        if opt.numericalize:
+            preprocess.numericalize_shards(train_data_files, fields, opt)
+            for path in train_data_files:
+                dataset = onmt.inputters.inputter.load_dataset(path)
+                store = dataset.examples.store
+                for side in ['src', 'tgt']:
+                    ids = store.vocab_ids(0, side)[0].tolist()
+                    self.assertEqual(
+                        ids, [fields[side].base_field.vocab.stoi[tok]
+                              for tok in getattr(dataset[0], side)[0]])
 
         preprocess.build_save_dataset(
             'valid', fields, src_reader, tgt_reader, opt)
 
-        # Remove the generated *pt files.
-        for pt in glob.glob(SAVE_DATA_PREFIX + '*.pt'):
+        # Remove the generated *pt, *bin, *json and *npy files.
+        for pt in glob.glob(SAVE_DATA_PREFIX + '*.pt') + \
+                glob.glob(SAVE_DATA_PREFIX + '*.bin') + \
+                glob.glob(SAVE_DATA_PREFIX + '*.json') + \
+                glob.glob(SAVE_DATA_PREFIX + '*.npy'):
             os.remove(pt)
         if hasattr(opt, 'src_vocab') and os.path.exists(opt.src_vocab):
             os.remove(opt.src_vocab)
         if hasattr(opt, 'tgt_vocab') and os.path.exists(opt.tgt_vocab):
             os.remove(opt.tgt_vocab)
 
+    def _build_shards(self, opt):
+        fields = onmt.inputters.get_fields("text", 0, 0)
+        reader = onmt.inputters.str2reader["text"].from_opt(opt)
+        paths = preprocess.build_save_dataset(
+            'train', fields, reader, reader, opt)
+        fields = preprocess.build_save_vocab(paths, fields, opt)
+        shards = []
+        for path in paths:
+            dataset = onmt.inputters.inputter.load_dataset(path)
+            shards.append([(ex.src, ex.tgt) for ex in dataset])
+        manifest = load_manifest(manifest_path(SAVE_DATA_PREFIX, 'train'))
+        for stats in manifest["shards"].values():
+            del stats["bytes"]
+        vocab = {side: fields[side].base_field.vocab.itos
+                 for side in ['src', 'tgt']}
+        for path in paths:
+            os.remove(onmt.inputters.counts_path(path))
+        for pt in glob.glob(SAVE_DATA_PREFIX + '*.pt') + \
+                glob.glob(SAVE_DATA_PREFIX + '*.json') + \
+                glob.glob(SAVE_DATA_PREFIX + '*.npy'):
+            os.remove(pt)
+        return shards, manifest, vocab
+
+    def test_parallel_same_as_serial(self):
+        opt = copy.deepcopy(self.opt)
+        opt.shard_size = 2000
+        serial = self._build_shards(opt)
+        opt.num_threads = 2
+        parallel = self._build_shards(opt)
+        self.assertGreater(len(serial[0]), 1)
+        self.assertEqual(parallel, serial)
+
 
 def _add_test(param_setting, methodname):
     """
@@ -115,6 +191,18 @@ test_databuild = [[],
                    ('shard_size', 500000)],
                   [('src_vocab', '/tmp/src_vocab.txt'),
                    ('tgt_vocab', '/tmp/tgt_vocab.txt')],
+                  [('shard_format', 'mmap')],
+                  [('shard_format', 'mmap'),
+                   ('dynamic_dict', True),
+                   ('shard_size', 500)],
+                  [('num_threads', 2),
+                   ('shard_size', 2000)],
+                  [('numericalize', True)],
+                  [('numericalize', True),
+                   ('shard_format', 'mmap'),
+                   ('dynamic_dict', True),
+                   ('num_threads', 2),
+                   ('shard_size', 5000)],
                   ]
 
 for p in test_databuild:
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from onmt.utils.misc import split_corpus, corpus_shards, read_shard, \
+    line_index, LINE_INDEX_EXT
+
+
+class TestSplitCorpus(unittest.TestCase):
+    LINES = [b"first line\n", b"\n", b"a \r carriage return\n",
+             "caf\xe9\n".encode("utf-8"), b"no newline"]
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, "corpus.txt")
+        with open(self.path, "wb") as f:
+            f.write(b"".join(self.LINES))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_shards_match_readlines(self):
+        with open(self.path, "rb") as f:
+            lines = f.readlines()
+        self.assertEqual(lines, self.LINES)
+        self.assertEqual(list(split_corpus(self.path, 0)), [lines])
+        for shard_size in range(1, len(lines) + 2):
+            shards = list(split_corpus(self.path, shard_size))
+            self.assertEqual(
+                shards, [lines[i:i + shard_size]
+                         for i in range(0, len(lines), shard_size)])
+
+    def test_index_is_cached(self):
+        offsets = line_index(self.path)
+        self.assertEqual(len(offsets), len(self.LINES) + 1)
+        self.assertEqual(offsets[-1], os.path.getsize(self.path))
+        self.assertEqual(os.listdir(self.root), ["corpus.txt"])
+        prefix = os.path.join(self.root, "cache", "data")
+        os.mkdir(os.path.dirname(prefix))
+        self.assertEqual(list(line_index(self.path, prefix)), list(offsets))
+        cached = os.listdir(os.path.dirname(prefix))
+        self.assertEqual(len(cached), 1)
+        self.assertTrue(cached[0].startswith("data."))
+        self.assertTrue(cached[0].endswith(LINE_INDEX_EXT))
+        self.assertEqual(list(line_index(self.path, prefix)), list(offsets))
+
+    def test_index_is_rebuilt_when_the_file_changes(self):
+        prefix = os.path.join(self.root, "data")
+        corpus_shards(self.path, 2, prefix)
+        with open(self.path, "ab") as f:
+            f.write(b"\nlast line\n")
+        shards = corpus_shards(self.path, 5, prefix)
+        self.assertEqual(read_shard(shards[-1]), [b"last line\n"])
+
+    def test_index_is_not_cached_in_missing_dir(self):
+        prefix = os.path.join(self.root, "missing", "data")
+        self.assertEqual(len(line_index(self.path, prefix)),
+                         len(self.LINES) + 1)
+        self.assertEqual(os.listdir(self.root), ["corpus.txt"])
+
+    def test_empty_file(self):
+        path = os.path.join(self.root, "empty.txt")
+        open(path, "wb").close()
+        self.assertEqual(list(split_corpus(path, 0)), [[]])
+        self.assertEqual(list(split_corpus(path, 2)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 import unittest
-from onmt.inputters.text_dataset import TextMultiField, TextDataReader
+from onmt.inputters.text_dataset import TextMultiField, TextDataReader, \
+    text_fields
 
 import itertools
 import os
@@ -83,6 +84,23 @@ class TestTextMultiField(unittest.TestCase):
             proc = mf.preprocess(sample_str)
             self.assertEqual(len(proc), len(init_case["feats_fields"]) + 1)
 
+    def test_preprocess_splits_features_once(self):
+        sample_str = u"a\uffe8A\uffe8x b\uffe8B\uffe8y c\uffe8C\uffe8z\n"
+        for n_feats, truncate in itertools.product([0, 2, 11], [None, 2]):
+            line = sample_str if n_feats < 11 else u" ".join(
+                u"\uffe8".join([w] + [str(i) for i in range(n_feats)])
+                for w in "abc")
+            mf = text_fields(base_name="src", n_feats=n_feats,
+                             include_lengths=True, truncate=truncate)
+            expected = [f.preprocess(line) for _, f in mf.fields]
+            self.assertEqual(mf.preprocess(line), expected)
+            self.assertIsNotNone(mf._tokenize_kwargs)
+
+    def test_preprocess_missing_features_fail(self):
+        mf = text_fields(base_name="src", n_feats=2, include_lengths=True)
+        with self.assertRaises(IndexError):
+            mf.preprocess(u"a\uffe8A\uffe8x b\uffe8B")
+
     def test_base_field(self):
         for init_case, params in itertools.product(
                 self.INIT_CASES, self.PARAMS):
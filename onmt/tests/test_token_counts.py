@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+from collections import Counter
+
+from torchtext.vocab import Vocab
+
+import onmt.inputters as inputters
+from onmt.inputters.token_counts import TokenCounts, merge_counts, \
+    most_common
+
+
+def _read_lines(path, n):
+    with open(path, "rb") as f:
+        return [next(f) for _ in range(n)]
+
+
+class TestTokenCounts(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        with open("data/src-val.txt") as f:
+            self.counters = [Counter(line.split()) for line in f]
+        self.counter = Counter()
+        for counter in self.counters:
+            self.counter.update(counter)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_spilled_counts_match(self):
+        counts = TokenCounts(max_size=100, spill_dir=self.tmp_dir)
+        for counter in self.counters:
+            counts.update(counter)
+        self.assertGreater(len(counts._runs), 1)
+        items = list(counts.items())
+        self.assertEqual(items, sorted(self.counter.items()))
+        counts.close()
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_merge_counts(self):
+        a = [("a", 1), ("b", 2), ("d", 1)]
+        b = [("b", 1), ("c", 3), ("d", 4)]
+        self.assertEqual(list(merge_counts(a, b)),
+                         [("a", 1), ("b", 3), ("c", 3), ("d", 5)])
+
+    def test_most_common_matches_vocab(self):
+        counter = self.counter
+        specials = ["<unk>", "<blank>"]
+        for max_size, min_freq in [(None, 1), (50, 1), (1000, 3), (0, 1)]:
+            expected = Vocab(counter, specials=specials,
+                             max_size=max_size, min_freq=min_freq)
+            selected = most_common(counter.items(), max_size, min_freq,
+                                   specials)
+            vocab = Vocab(selected, specials=specials,
+                          max_size=max_size, min_freq=min_freq)
+            self.assertEqual(vocab.itos, expected.itos)
+
+    def test_build_vocab_spilled_in_parallel(self):
+        reader = inputters.TextDataReader()
+        paths = []
+        for i in range(3):
+            src = _read_lines("data/src-val.txt", 30 * (i + 1))[30 * i:]
+            tgt = _read_lines("data/tgt-val.txt", 30 * (i + 1))[30 * i:]
+            dataset = inputters.Dataset(
+                inputters.get_fields("text", 0, 0), readers=[reader, reader],
+                data=[("src", src), ("tgt", tgt)],
+                dirs=[None, None], sort_key=inputters.text_sort_key)
+            path = os.path.join(self.tmp_dir, "data.train.%d.pt" % i)
+            dataset.save(path)
+            paths.append(path)
+        for share_vocab in [False, True]:
+            expected = inputters.build_vocab(
+                paths, inputters.get_fields("text", 0, 0), "text",
+                share_vocab, "", 200, 1, "", 200, 2)
+            fields = inputters.build_vocab(
+                paths, inputters.get_fields("text", 0, 0), "text",
+                share_vocab, "", 200, 1, "", 200, 2, num_workers=2,
+                max_counts=50, spill_dir=self.tmp_dir)
+            for side in ["src", "tgt"]:
+                self.assertEqual(fields[side].base_field.vocab.itos,
+                                 expected[side].base_field.vocab.itos)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)),
+                         sorted(os.path.basename(p) for p in paths))
+
+
+if __name__ == "__main__":
+    unittest.main()
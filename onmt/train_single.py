@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 """Training on a single process."""
+import multiprocessing
 import os
 
 import torch
 
+import onmt.utils.distributed
+
 from onmt.inputters.inputter import build_dataset_iter, \
-    load_old_vocab, old_style_vocab
+    load_old_vocab, old_style_vocab, src_map_field
+from onmt.inputters.image_dataset import image_fields
 from onmt.model_builder import build_model
 from onmt.utils.optimizers import Optimizer
 from onmt.utils.misc import set_random_seed
@@ -33,9 +37,32 @@ def _tally_parameters(model):
     return enc + dec, enc, dec
 
 
+def _same_data(ckpt_opt, opt):
+    return all(getattr(ckpt_opt, name, None) == getattr(opt, name, None)
+               for name in ["data", "train_src", "train_tgt", "world_size"])
+
+
+def _set_cpu_threads(opt):
+    # The processes training on CPU share the cores, and each one is
+    # pinned to its own cores so that they do not compete for them.
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(multiprocessing.cpu_count()))
+    n_threads = opt.cpu_threads or max(1, len(cores) // opt.world_size)
+    torch.set_num_threads(n_threads)
+    if opt.world_size > 1 and opt.world_size * n_threads <= len(cores) \
+            and hasattr(os, "sched_setaffinity"):
+        rank = onmt.utils.distributed.process_rank(opt, -1)
+        os.sched_setaffinity(
+            0, cores[rank * n_threads:(rank + 1) * n_threads])
+
+
 def configure_process(opt, device_id):
     if device_id >= 0:
         torch.cuda.set_device(device_id)
+    elif opt.cpu_threads or opt.world_size > 1:
+        _set_cpu_threads(opt)
     set_random_seed(opt.seed, device_id >= 0)
 
 
@@ -69,6 +96,11 @@ def main(opt, device_id):
             vocab, opt.model_type, dynamic_dict=opt.copy_attn)
     else:
         fields = vocab
+    if "src_map" in fields:
+        fields["src_map"] = src_map_field(opt.copy_attn_index)
+    if opt.model_type == "img":
+        fields["src"] = image_fields(
+            opt.image_loader_threads, opt.image_cache_size)
 
     # Report src and tgt vocab sizes, including for features
     for side in ['src', 'tgt']:
@@ -98,12 +130,21 @@ def main(opt, device_id):
     trainer = build_trainer(
         opt, device_id, model, fields, optim, model_saver=model_saver)
 
-    train_iter = build_dataset_iter("train", fields, opt)
+    gpu_rank = onmt.utils.distributed.process_rank(opt, device_id)
+    train_iter = build_dataset_iter("train", fields, opt, rank=gpu_rank)
+    if checkpoint is not None and not opt.reset_data_state and \
+            checkpoint.get("data_state") is not None and \
+            _same_data(checkpoint["opt"], opt):
+        logger.info('Resuming training data from checkpoint position.')
+        train_iter.load_state_dict(checkpoint["data_state"])
     valid_iter = build_dataset_iter(
         "valid", fields, opt, is_train=False)
 
     if len(opt.gpu_ranks):
         logger.info('Starting training on GPU: %s' % opt.gpu_ranks)
+    elif opt.world_size > 1:
+        logger.info('Starting training on %d CPU processes'
+                    % opt.world_size)
     else:
         logger.info('Starting training on CPU, could be very slow')
     train_steps = opt.train_steps
@@ -9,13 +9,12 @@
           users of this library) for the strategy things we do.
 """
 
-from copy import deepcopy
-import itertools
 import torch
 import traceback
 
 import onmt.utils
 from onmt.utils.logging import logger
+from onmt.utils.moving_average import MovingAverage
 
 
 def build_trainer(opt, device_id, model, fields, optim, model_saver=None):
@@ -46,13 +45,17 @@ def build_trainer(opt, device_id, model, fields, optim, model_saver=None):
     n_gpu = opt.world_size
     average_decay = opt.average_decay
     average_every = opt.average_every
-    if device_id >= 0:
-        gpu_rank = opt.gpu_ranks[device_id]
+    if device_id >= 0 or n_gpu > 1:
+        gpu_rank = onmt.utils.distributed.process_rank(opt, device_id)
     else:
         gpu_rank = 0
         n_gpu = 0
     gpu_verbose_level = opt.gpu_verbose_level
 
+    grad_dtype = {"fp16": torch.float16,
+                  "bf16": getattr(torch, "bfloat16", None)}.get(
+                      opt.grad_reduce_dtype)
+
     report_manager = onmt.utils.build_report_manager(opt)
     trainer = onmt.Trainer(model, train_loss, valid_loss, optim, trunc_size,
                            shard_size, norm_method,
@@ -62,7 +65,13 @@ def build_trainer(opt, device_id, model, fields, optim, model_saver=None):
                            model_saver=model_saver if gpu_rank == 0 else None,
                            average_decay=average_decay,
                            average_every=average_every,
-                           model_dtype=opt.model_dtype)
+                           average_offload=opt.average_offload,
+                           model_dtype=opt.model_dtype,
+                           overlap_grad_reduce=opt.overlap_grad_reduce,
+                           grad_bucket_size=opt.grad_bucket_size * 2 ** 20,
+                           grad_dtype=grad_dtype,
+                           grad_topk_ratio=opt.grad_topk_ratio,
+                           grad_topk_params=opt.grad_topk_params)
     return trainer
 
 
@@ -90,6 +99,21 @@ class Trainer(object):
             model_saver(:obj:`onmt.models.ModelSaverBase`): the saver is
                 used to save a checkpoint.
                 Thus nothing will be saved if this parameter is None
+            overlap_grad_reduce(bool): with n_gpu > 1, all-reduce the
+                gradients in buckets during the backward pass (see
+                :class:`onmt.utils.distributed.GradientBucketReducer`)
+            grad_bucket_size(int): size in bytes of the all-reduced
+                gradient buckets
+            grad_dtype(torch.dtype): type the gradients are cast to to
+                be all-reduced, their own type if None
+            grad_topk_ratio(float): with n_gpu > 1, only send this ratio
+                of the gradients of the ``grad_topk_params`` (see
+                :class:`onmt.utils.distributed.TopKReducer`), not used if 0
+            grad_topk_params(list): groups of parameters whose gradients
+                are sparsified, "embeddings" and/or "generator"
+            average_offload(bool): keep the moving average of the
+                parameters on the CPU (see
+                :class:`onmt.utils.moving_average.MovingAverage`)
     """
 
     def __init__(self, model, train_loss, valid_loss, optim,
@@ -98,7 +122,11 @@ class Trainer(object):
                  accum_steps=[0],
                  n_gpu=1, gpu_rank=1,
                  gpu_verbose_level=0, report_manager=None, model_saver=None,
-                 average_decay=0, average_every=1, model_dtype='fp32'):
+                 average_decay=0, average_every=1, model_dtype='fp32',
+                 overlap_grad_reduce=False, grad_bucket_size=10485760,
+                 grad_dtype=None, grad_topk_ratio=0,
+                 grad_topk_params=("embeddings", "generator"),
+                 average_offload=False):
         # Basic attributes.
         self.model = model
         self.train_loss = train_loss
@@ -118,7 +146,24 @@ class Trainer(object):
         self.average_decay = average_decay
         self.moving_average = None
         self.average_every = average_every
+        self.average_offload = average_offload
         self.model_dtype = model_dtype
+        self.grad_bucket_size = grad_bucket_size
+        self.grad_dtype = grad_dtype
+        self.dense_params = [p for p in model.parameters()
+                             if p.requires_grad]
+        self.topk_reducer = None
+        if grad_topk_ratio > 0 and n_gpu > 1:
+            topk_params = self._param_groups(grad_topk_params)
+            topk_ids = set(id(p) for p in topk_params)
+            self.dense_params = [p for p in self.dense_params
+                                 if id(p) not in topk_ids]
+            self.topk_reducer = onmt.utils.distributed.TopKReducer(
+                topk_params, grad_topk_ratio, grad_dtype)
+        self.grad_reducer = None
+        if overlap_grad_reduce and n_gpu > 1:
+            self.grad_reducer = onmt.utils.distributed.GradientBucketReducer(
+                self.dense_params, float(1), grad_bucket_size, grad_dtype)
 
         for i in range(len(self.accum_count_l)):
             assert self.accum_count_l[i] > 0
@@ -158,17 +203,30 @@ class Trainer(object):
 
     def _update_average(self, step):
         if self.moving_average is None:
-            copy_params = [params.detach().float()
-                           for params in self.model.parameters()]
-            self.moving_average = copy_params
+            self.moving_average = MovingAverage(
+                self.model.parameters(), self.average_decay,
+                device="cpu" if self.average_offload else None)
         else:
-            average_decay = max(self.average_decay,
-                                1 - (step + 1)/(step + 10))
-            for (i, avg), cpt in zip(enumerate(self.moving_average),
-                                     self.model.parameters()):
-                self.moving_average[i] = \
-                    (1 - average_decay) * avg + \
-                    cpt.detach().float() * average_decay
+            self.moving_average.update(step)
+
+    def _data_state(self, train_iter):
+        state_dict = getattr(train_iter, "state_dict", None)
+        state = state_dict() if state_dict is not None else None
+        if self.n_gpu > 1:
+            # the ranks iterate over their own data, they all save their
+            # position (see DatasetLazyIter.load_state_dict)
+            states = onmt.utils.distributed.all_gather_list(
+                state, max_size=32768)
+            state = {"ranks": dict(enumerate(states))}
+        return state
+
+    def _save(self, step, train_iter):
+        # all the ranks gather the position of the data
+        data_state = self._data_state(train_iter)
+        if self.model_saver is not None:
+            self.model_saver.save(
+                step, moving_average=self.moving_average,
+                data_state=data_state)
 
     def train(self,
               train_iter,
@@ -182,6 +240,9 @@ class Trainer(object):
 
         Args:
             train_iter: A generator that returns the next training batch.
+              With ``n_gpu > 1``, it only returns the batches of this
+              process (see :class:`onmt.inputters.inputter.DatasetLazyIter`
+              ``rank``).
             train_steps: Run training for this many iterations.
             save_checkpoint_steps: Save a checkpoint every this many
               iterations.
@@ -201,10 +262,6 @@ class Trainer(object):
         report_stats = onmt.utils.Statistics()
         self._start_report_manager(start_time=total_stats.start_time)
 
-        if self.n_gpu > 1:
-            train_iter = itertools.islice(
-                train_iter, self.gpu_rank, None, self.n_gpu)
-
         for i, (batches, normalization) in enumerate(
                 self._accum_batches(train_iter)):
             step = self.optim.training_step
@@ -249,16 +306,14 @@ class Trainer(object):
                 self._report_step(self.optim.learning_rate(),
                                   step, valid_stats=valid_stats)
 
-            if (self.model_saver is not None
-                and (save_checkpoint_steps != 0
-                     and step % save_checkpoint_steps == 0)):
-                self.model_saver.save(step, moving_average=self.moving_average)
+            if save_checkpoint_steps != 0 and \
+                    step % save_checkpoint_steps == 0:
+                self._save(step, train_iter)
 
             if train_steps > 0 and step >= train_steps:
                 break
 
-        if self.model_saver is not None:
-            self.model_saver.save(step, moving_average=self.moving_average)
+        self._save(step, train_iter)
         return total_stats
 
     def validate(self, valid_iter, moving_average=None):
@@ -267,17 +322,12 @@ class Trainer(object):
         Returns:
             :obj:`nmt.Statistics`: validation loss statistics
         """
-        if moving_average:
-            valid_model = deepcopy(self.model)
-            for avg, param in zip(self.moving_average,
-                                  valid_model.parameters()):
-                param.data = avg.data.half() if self.model_dtype == "fp16" \
-                    else avg.data
-        else:
-            valid_model = self.model
+        if moving_average is not None:
+            with moving_average.swapped():
+                return self.validate(valid_iter)
 
         # Set model in validating mode.
-        valid_model.eval()
+        self.model.eval()
 
         with torch.no_grad():
             stats = onmt.utils.Statistics()
@@ -288,7 +338,7 @@ class Trainer(object):
                 tgt = batch.tgt
 
                 # F-prop through the model.
-                outputs, attns = valid_model(src, tgt, src_lengths)
+                outputs, attns = self.model(src, tgt, src_lengths)
 
                 # Compute loss.
                 _, batch_stats = self.valid_loss(batch, outputs, attns)
@@ -296,11 +346,8 @@ class Trainer(object):
                 # Update statistics.
                 stats.update(batch_stats)
 
-        if moving_average:
-            del valid_model
-        else:
-            # Set model back to training mode.
-            valid_model.train()
+        # Set model back to training mode.
+        self.model.train()
 
         return stats
 
@@ -334,6 +381,10 @@ class Trainer(object):
                     self.optim.zero_grad()
                 outputs, attns = self.model(src, tgt, src_lengths, bptt=bptt)
                 bptt = True
+                if self.grad_reducer is not None:
+                    self._prepare_grad_reduce(
+                        outputs, attns,
+                        self.accum_count == 1 or k == len(true_batches) - 1)
 
                 # 3. Compute loss.
                 try:
@@ -361,11 +412,7 @@ class Trainer(object):
                 if self.accum_count == 1:
                     # Multi GPU gradient gather
                     if self.n_gpu > 1:
-                        grads = [p.grad.data for p in self.model.parameters()
-                                 if p.requires_grad
-                                 and p.grad is not None]
-                        onmt.utils.distributed.all_reduce_and_rescale_tensors(
-                            grads, float(1))
+                        self._all_reduce_grads(total_stats, report_stats)
                     self.optim.step()
 
                 # If truncated, don't backprop fully.
@@ -379,13 +426,53 @@ class Trainer(object):
         # update only after accum batches
         if self.accum_count > 1:
             if self.n_gpu > 1:
-                grads = [p.grad.data for p in self.model.parameters()
-                         if p.requires_grad
-                         and p.grad is not None]
-                onmt.utils.distributed.all_reduce_and_rescale_tensors(
-                    grads, float(1))
+                self._all_reduce_grads(total_stats, report_stats)
             self.optim.step()
 
+    def _prepare_grad_reduce(self, outputs, attns, sync):
+        if not sync or not self.shard_size:
+            self.grad_reducer.prepare(sync)
+            return
+        # The loss computed in shards runs a backward pass per shard that
+        # only reaches the generator, then a last one from the outputs,
+        # that computes the gradients of the other parameters.
+        generator = self.model.generator
+        others = set(id(p) for m in self.model.children()
+                     if m is not generator for p in m.parameters())
+        ready = [p for p in generator.parameters()
+                 if p.requires_grad and id(p) not in others]
+
+        def hook(grad):
+            self.grad_reducer.prepare(True, ready)
+        self.grad_reducer.prepare(False)
+        for value in [outputs] + list(attns.values()):
+            if torch.is_tensor(value) and value.requires_grad:
+                value.register_hook(hook)
+
+    def _param_groups(self, names):
+        # the parameters of the groups of names, of the embeddings
+        # and/or of the generator
+        generator = set(id(p) for p in self.model.generator.parameters())
+        return [p for name, p in self.model.named_parameters()
+                if p.requires_grad and (
+                    ("embeddings" in names and "embeddings" in name) or
+                    ("generator" in names and id(p) in generator))]
+
+    def _all_reduce_grads(self, *stats):
+        if self.grad_reducer is not None:
+            sent = self.grad_reducer.wait()
+        else:
+            grads = [p.grad.data for p in self.dense_params
+                     if p.grad is not None]
+            sent = onmt.utils.distributed.all_reduce_and_rescale_tensors(
+                grads, float(1), self.grad_bucket_size,
+                self.grad_dtype) if grads else 0
+        if self.topk_reducer is not None:
+            sent += self.topk_reducer(float(1))
+        for s in stats:
+            s.n_sent_bytes += sent
+            s.n_updates += 1
+
     def _start_report_manager(self, start_time=None):
         """
         Simple function to start report manager (if any)
@@ -16,6 +16,7 @@ import onmt.opts
 from onmt.utils.logging import init_logger
 from onmt.utils.misc import set_random_seed
 from onmt.utils.parse import ArgumentParser
+from onmt.utils.tokenization import build_tokenizer, tokenize
 from onmt.translate.translator import build_translator
 
 
@@ -286,41 +287,8 @@ class ServerModel(object):
         timer.tick("model_loading")
         if self.tokenizer_opt is not None:
             self.logger.info("Loading tokenizer")
-
-            if "type" not in self.tokenizer_opt:
-                raise ValueError(
-                    "Missing mandatory tokenizer option 'type'")
-
-            if self.tokenizer_opt['type'] == 'sentencepiece':
-                if "model" not in self.tokenizer_opt:
-                    raise ValueError(
-                        "Missing mandatory tokenizer option 'model'")
-                import sentencepiece as spm
-                sp = spm.SentencePieceProcessor()
-                model_path = os.path.join(self.model_root,
-                                          self.tokenizer_opt['model'])
-                sp.Load(model_path)
-                self.tokenizer = sp
-            elif self.tokenizer_opt['type'] == 'pyonmttok':
-                if "params" not in self.tokenizer_opt:
-                    raise ValueError(
-                        "Missing mandatory tokenizer option 'params'")
-                import pyonmttok
-                if self.tokenizer_opt["mode"] is not None:
-                    mode = self.tokenizer_opt["mode"]
-                else:
-                    mode = None
-                # load can be called multiple times: modify copy
-                tokenizer_params = dict(self.tokenizer_opt["params"])
-                for key, value in self.tokenizer_opt["params"].items():
-                    if key.endswith("path"):
-                        tokenizer_params[key] = os.path.join(
-                            self.model_root, value)
-                tokenizer = pyonmttok.Tokenizer(mode,
-                                                **tokenizer_params)
-                self.tokenizer = tokenizer
-            else:
-                raise ValueError("Invalid value for tokenizer type")
+            self.tokenizer = build_tokenizer(
+                self.tokenizer_opt, self.model_root)
 
         self.load_time = timer.tick()
         self.reset_unload_timer()
@@ -517,13 +485,7 @@ class ServerModel(object):
         if self.tokenizer is None:
             raise ValueError("No tokenizer loaded")
 
-        if self.tokenizer_opt["type"] == "sentencepiece":
-            tok = self.tokenizer.EncodeAsPieces(sequence)
-            tok = " ".join(tok)
-        elif self.tokenizer_opt["type"] == "pyonmttok":
-            tok, _ = self.tokenizer.tokenize(sequence)
-            tok = " ".join(tok)
-        return tok
+        return tokenize(self.tokenizer, self.tokenizer_opt["type"], sequence)
 
     def maybe_detokenize(self, sequence):
         """De-tokenize the sequence (or not)
@@ -17,34 +17,58 @@ def is_master(opt, device_id):
     return opt.gpu_ranks[device_id] == 0
 
 
-def multi_init(opt, device_id):
+def process_rank(opt, device_id):
+    """Rank of the training process of GPU ``device_id``, or of this CPU
+    process if ``device_id`` is -1."""
+    if device_id >= 0:
+        return opt.gpu_ranks[device_id]
+    if opt.world_size > 1:
+        return torch.distributed.get_rank()
+    return 0
+
+
+def multi_init(opt, device_id, rank=None):
+    """Join the process group of distributed training as the process of
+    GPU ``device_id``, or as the CPU process of rank ``rank`` with the
+    gloo backend if ``device_id`` is -1."""
     dist_init_method = 'tcp://{master_ip}:{master_port}'.format(
         master_ip=opt.master_ip,
         master_port=opt.master_port)
     dist_world_size = opt.world_size
+    if device_id >= 0:
+        backend, rank = opt.gpu_backend, opt.gpu_ranks[device_id]
+    else:
+        backend = "gloo"
     torch.distributed.init_process_group(
-        backend=opt.gpu_backend, init_method=dist_init_method,
-        world_size=dist_world_size, rank=opt.gpu_ranks[device_id])
+        backend=backend, init_method=dist_init_method,
+        world_size=dist_world_size, rank=rank)
     gpu_rank = torch.distributed.get_rank()
-    if not is_master(opt, device_id):
+    if gpu_rank != 0:
         logger.disabled = True
 
     return gpu_rank
 
 
 def all_reduce_and_rescale_tensors(tensors, rescale_denom,
-                                   buffer_size=10485760):
+                                   buffer_size=10485760, dtype=None):
     """All-reduce and rescale tensors in chunks of the specified size.
 
     Args:
         tensors: list of Tensors to all-reduce
         rescale_denom: denominator for rescaling summed Tensors
         buffer_size: all-reduce chunk size in bytes
+        dtype: type the Tensors are cast to to be all-reduced, their own
+            type if None
+
+    Returns:
+        The number of bytes all-reduced.
     """
+    dtype = dtype or tensors[0].dtype
     # buffer size in bytes, determine equiv. # of elements based on data type
-    buffer_t = tensors[0].new(
-        math.ceil(buffer_size / tensors[0].element_size())).zero_()
+    buffer_t = tensors[0].new_zeros(
+        math.ceil(buffer_size / tensors[0].element_size()), dtype=dtype)
     buffer = []
+    sent = [0]
 
     def all_reduce_buffer():
         # copy tensors into buffer_t
@@ -54,15 +78,16 @@ def all_reduce_and_rescale_tensors(tensors, rescale_denom,
             buffer_t[offset:offset+numel].copy_(t.view(-1))
             offset += numel
 
-        # all-reduce and rescale
+        # all-reduce
         torch.distributed.all_reduce(buffer_t[:offset])
-        buffer_t.div_(rescale_denom)
+        sent[0] += offset * buffer_t.element_size()
 
-        # copy all-reduced buffer back into tensors
+        # copy all-reduced buffer back into tensors and rescale
         offset = 0
         for t in buffer:
             numel = t.numel()
             t.view(-1).copy_(buffer_t[offset:offset+numel])
+            t.div_(rescale_denom)
             offset += numel
 
     filled = 0
@@ -70,7 +95,10 @@ def all_reduce_and_rescale_tensors(tensors, rescale_denom,
         sz = t.numel() * t.element_size()
         if sz > buffer_size:
             # tensor is bigger than buffer, all-reduce and rescale directly
-            torch.distributed.all_reduce(t)
+            reduced = t.to(dtype)
+            torch.distributed.all_reduce(reduced)
+            sent[0] += reduced.numel() * reduced.element_size()
+            t.copy_(reduced)
             t.div_(rescale_denom)
         elif filled + sz > buffer_size:
             # buffer is full, all-reduce and replace buffer with grad
@@ -84,16 +112,234 @@ def all_reduce_and_rescale_tensors(tensors, rescale_denom,
 
     if len(buffer) > 0:
         all_reduce_buffer()
+    return sent[0]
+
+
+class GradientBucketReducer(object):
+    """All-reduce and rescale the gradients of ``params`` in buckets, while
+    the backward pass computes them.
+
+    The parameters are put in buckets of about ``bucket_size`` bytes in
+    reverse order, the order in which their gradients are usually
+    computed. A hook on each parameter marks its gradient as computed and
+    the all-reduce of a bucket is started asynchronously as soon as all
+    its gradients are computed, so that it overlaps with the rest of the
+    backward pass. The buckets are started in the same order on all
+    processes.
+
+    Call :func:`prepare` before each backward pass, and :func:`wait`
+    before the optimizer step. The gradients of a bucket must be
+    computed once after :func:`prepare`, or be given as ready to it.
+    A bucket with gradients that are not computed, and the buckets after
+    it, are only started by :func:`wait`.
+
+    Args:
+        params: list of parameters whose gradients are all-reduced
+        rescale_denom: denominator for rescaling summed gradients
+        bucket_size: size of the buckets in bytes
+        dtype: type the gradients are cast to to be all-reduced, their
+            own type if None
+    """
+
+    def __init__(self, params, rescale_denom=1.0, bucket_size=10485760,
+                 dtype=None):
+        self.params = [p for p in params if p.requires_grad]
+        self.rescale_denom = rescale_denom
+        self.dtype = dtype
+        self.buckets = []
+        self._bucket_of = {}
+        # keep the gradient accumulators alive to keep their hooks
+        self._grad_accs = []
+        filled = 0
+        for p in reversed(self.params):
+            sz = p.numel() * p.element_size()
+            if not self.buckets or filled + sz > bucket_size or \
+                    p.dtype != self.buckets[-1][0].dtype:
+                self.buckets.append([])
+                filled = 0
+            self.buckets[-1].append(p)
+            self._bucket_of[id(p)] = len(self.buckets) - 1
+            filled += sz
+            grad_acc = p.expand_as(p).grad_fn.next_functions[0][0]
+            grad_acc.register_hook(self._make_hook(len(self.buckets) - 1))
+            self._grad_accs.append(grad_acc)
+        self._buffers = [None] * len(self.buckets)
+        self._sync = False
+        self._reset()
+
+    def _reset(self):
+        self._pending = [len(bucket) for bucket in self.buckets]
+        self._handles = [None] * len(self.buckets)
+        self._next = 0
+
+    def _make_hook(self, i):
+        def hook(*unused):
+            if self._sync:
+                self._ready(i)
+        return hook
+
+    def _ready(self, i):
+        self._pending[i] -= 1
+        if self._pending[i] == 0:
+            self._start_ready()
+
+    def prepare(self, sync=True, ready=()):
+        """Set whether the gradients of the next backward pass are the
+        last ones before the optimizer step, and are all-reduced.
+
+        Args:
+            sync: all-reduce the gradients of the next backward pass
+            ready: parameters whose gradients are already computed and
+                are not computed by the next backward pass, ignored if
+                they are not all-reduced by this reducer
+        """
+        if sync and not self._sync:
+            self._sync = True
+            for p in ready:
+                if id(p) in self._bucket_of:
+                    self._ready(self._bucket_of[id(p)])
+        self._sync = sync
+
+    def _start(self, i):
+        bucket = self.buckets[i]
+        if self._buffers[i] is None:
+            self._buffers[i] = bucket[0].new_zeros(
+                sum(p.numel() for p in bucket),
+                dtype=self.dtype or bucket[0].dtype)
+        buffer_t = self._buffers[i]
+        offset = 0
+        for p in bucket:
+            numel = p.numel()
+            if p.grad is None:
+                buffer_t[offset:offset+numel].zero_()
+            else:
+                buffer_t[offset:offset+numel].copy_(p.grad.data.view(-1))
+            offset += numel
+        self._handles[i] = torch.distributed.all_reduce(
+            buffer_t, async_op=True)
+
+    def _start_ready(self):
+        while self._next < len(self.buckets) and \
+                self._pending[self._next] == 0:
+            self._start(self._next)
+            self._next += 1
+
+    def wait(self):
+        """Start the all-reduce of the remaining buckets, wait for all of
+        them and copy the rescaled gradients back. The gradients that
+        were not computed are all-reduced as zeros and stay ``None``.
+
+        Returns:
+            The number of bytes all-reduced.
+        """
+        for i in range(self._next, len(self.buckets)):
+            self._start(i)
+        sent = 0
+        for i, bucket in enumerate(self.buckets):
+            self._handles[i].wait()
+            buffer_t = self._buffers[i]
+            sent += buffer_t.numel() * buffer_t.element_size()
+            offset = 0
+            for p in bucket:
+                numel = p.numel()
+                if p.grad is not None:
+                    p.grad.data.view(-1).copy_(
+                        buffer_t[offset:offset+numel])
+                    p.grad.data.div_(self.rescale_denom)
+                offset += numel
+        self._sync = False
+        self._reset()
+        return sent
+
+
+class TopKReducer(object):
+    """All-reduce the gradients of ``params`` by only sending the
+    ``ratio`` of their values that are the largest in magnitude.
+
+    The values that are not sent are kept and added to the gradients
+    of the next steps (error feedback), so that they are sent once they
+    have grown large enough. The processes all-gather the values they
+    send with their indices, and each one sums them in its gradients.
+
+    Args:
+        params: list of parameters whose gradients are all-reduced
+        ratio: ratio of the values of each gradient that are sent
+        dtype: type the values are cast to to be sent, their own type
+            if None
+    """
+
+    def __init__(self, params, ratio, dtype=None):
+        self.params = [p for p in params if p.requires_grad]
+        self.ratio = ratio
+        self.dtype = dtype
+        self.residuals = [None] * len(self.params)
+
+    def __call__(self, rescale_denom):
+        """All-reduce and rescale the gradients of the parameters.
+
+        Returns:
+            The number of bytes sent.
+        """
+        world_size = torch.distributed.get_world_size()
+        grads, sizes, values, indices = [], [], [], []
+        for i, p in enumerate(self.params):
+            residual = self.residuals[i]
+            # the gradients that were not computed are sent as zeros, so
+            # that every process sends as many values, and stay None
+            if p.grad is None:
+                grad = None
+                acc = p.data.new_zeros(p.numel()) if residual is None \
+                    else residual
+            else:
+                grad = p.grad.data.view(-1)
+                acc = grad if residual is None else grad + residual
+            k = min(max(1, int(acc.numel() * self.ratio)), acc.numel())
+            _, top = acc.abs().topk(k, sorted=False)
+            top_values = acc[top].to(self.dtype or acc.dtype)
+            # the error of what is sent is sent later
+            residual = acc.clone() if residual is None else acc
+            residual[top] -= top_values.to(acc.dtype)
+            self.residuals[i] = residual
+            grads.append(grad)
+            sizes.append(k)
+            values.append(top_values)
+            indices.append(top.int())
+        if not grads:
+            return 0
+        values = torch.cat(values)
+        indices = torch.cat(indices)
+        all_values = [torch.empty_like(values) for _ in range(world_size)]
+        all_indices = [torch.empty_like(indices) for _ in range(world_size)]
+        torch.distributed.all_gather(all_values, values)
+        torch.distributed.all_gather(all_indices, indices)
+
+        for grad in grads:
+            if grad is not None:
+                grad.zero_()
+        for rank_values, rank_indices in zip(all_values, all_indices):
+            for grad, v, idx in zip(grads, rank_values.split(sizes),
+                                    rank_indices.split(sizes)):
+                if grad is not None:
+                    grad.index_add_(0, idx.long(), v.to(grad.dtype))
+        for grad in grads:
+            if grad is not None:
+                grad.div_(rescale_denom)
+        return (values.numel() * values.element_size() +
+                indices.numel() * indices.element_size())
 
 
 def all_gather_list(data, max_size=4096):
     """Gathers arbitrary data from all nodes into a list."""
     world_size = torch.distributed.get_world_size()
+    # nccl only gathers CUDA tensors, gloo CPU tensors
+    device = "cuda" if torch.distributed.get_backend() == "nccl" else "cpu"
     if not hasattr(all_gather_list, '_in_buffer') or \
-            max_size != all_gather_list._in_buffer.size():
-        all_gather_list._in_buffer = torch.cuda.ByteTensor(max_size)
+            max_size != all_gather_list._in_buffer.numel() or \
+            device != all_gather_list._in_buffer.device.type:
+        all_gather_list._in_buffer = torch.zeros(
+            max_size, dtype=torch.uint8, device=device)
         all_gather_list._out_buffers = [
-            torch.cuda.ByteTensor(max_size)
+            torch.zeros(max_size, dtype=torch.uint8, device=device)
             for i in range(world_size)
         ]
     in_buffer = all_gather_list._in_buffer
@@ -109,7 +355,7 @@ def all_gather_list(data, max_size=4096):
     in_buffer[1] = enc_size % 255
     in_buffer[2:enc_size+2] = torch.ByteTensor(list(enc))
 
-    torch.distributed.all_gather(out_buffers, in_buffer.cuda())
+    torch.distributed.all_gather(out_buffers, in_buffer)
 
     results = []
     for i in range(world_size):
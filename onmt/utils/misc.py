@@ -1,21 +1,112 @@
 # -*- coding: utf-8 -*-
 
+import hashlib
+import io
+import mmap
+import os
+
+import numpy as np
 import torch
+import torch.utils.checkpoint
 import random
 import inspect
-from itertools import islice
 
+LINE_INDEX_EXT = ".lineidx.npy"
 
-def split_corpus(path, shard_size):
+
+def _build_line_index(path, chunk_size=1 << 24):
+    size = os.path.getsize(path)
+    starts = [np.zeros(1, dtype=np.int64)]
+    with open(path, "rb") as f:
+        for pos in range(0, size, chunk_size):
+            chunk = np.frombuffer(f.read(chunk_size), dtype=np.uint8)
+            starts.append(np.flatnonzero(chunk == ord("\n")) + (pos + 1))
+    offsets = np.concatenate(starts)
+    if offsets[-1] != size:
+        # the last line has no newline
+        offsets = np.append(offsets, size)
+    return offsets
+
+
+def line_index(path, cache_prefix=None):
+    """Byte offsets of the lines of ``path``.
+
+    With a ``cache_prefix``, e.g. the ``-save_data`` of
+    ``preprocess.py``, the index is cached in
+    ``<cache_prefix>.<digest of the path>.lineidx.npy`` and built again
+    if the file changed since. It is only kept in memory otherwise, or if
+    the cache cannot be written.
+
+    Returns:
+        numpy.ndarray: ``n_lines + 1`` int64 offsets, the start of each
+        line and the size of the file.
+    """
+
+    if cache_prefix is None:
+        return _build_line_index(path)
+    stat = os.stat(path)
+    # st_mtime_ns is not in python 2
+    key = np.array([stat.st_size, int(stat.st_mtime * 1e9)], dtype=np.int64)
+    digest = hashlib.sha1(
+        os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+    index_path = "%s.%s%s" % (cache_prefix, digest, LINE_INDEX_EXT)
+    try:
+        cached = np.load(index_path)
+        if np.array_equal(cached[:2], key):
+            return cached[2:]
+    except (IOError, OSError, ValueError):
+        pass
+    offsets = _build_line_index(path)
+    # concurrent processes indexing the same file write the same index
+    tmp_path = "%s.%d.tmp" % (index_path, os.getpid())
+    try:
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.concatenate([key, offsets]))
+        os.rename(tmp_path, index_path)
+    except (IOError, OSError):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return offsets
+
+
+def corpus_shards(path, shard_size, cache_prefix=None):
+    """Split ``path`` into shards of ``shard_size`` lines, all of them if
+    ``shard_size <= 0``, without reading it (see :func:`line_index` for
+    ``cache_prefix``).
+
+    Returns:
+        List[(str, int, int)]: the path and byte range of each shard, to
+        read with :func:`read_shard`.
+    """
+
+    if shard_size <= 0:
+        return [(path, 0, os.path.getsize(path))]
+    offsets = line_index(path, cache_prefix)
+    bounds = offsets[::shard_size]
+    if bounds[-1] != offsets[-1]:
+        bounds = np.append(bounds, offsets[-1])
+    return [(path, int(start), int(end))
+            for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def read_shard(shard):
+    """Read the lines of a shard of :func:`corpus_shards`, as bytes
+    ending with their newline like ``readlines``."""
+    path, start, end = shard
+    if end <= start:
+        return []
     with open(path, "rb") as f:
-        if shard_size <= 0:
-            yield f.readlines()
-        else:
-            while True:
-                shard = list(islice(f, shard_size))
-                if not shard:
-                    break
-                yield shard
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data = mm[start:end]
+        finally:
+            mm.close()
+    return io.BytesIO(data).readlines()
+
+
+def split_corpus(path, shard_size):
+    for shard in corpus_shards(path, shard_size):
+        yield read_shard(shard)
 
 
 def aeq(*args):
@@ -121,6 +212,24 @@ def relative_matmul(x, z, transpose):
     return x_tz_matmul_r_t
 
 
+def checkpointed(module, function, *args):
+    """``function(*args)``, whose intermediate activations are recomputed
+    during the backward pass instead of being kept (see
+    ``torch.utils.checkpoint``) when ``module`` is training. From torch 1.1,
+    the RNG state is restored before recomputing, so that dropout draws
+    the same masks; older versions are refused by
+    :func:`onmt.utils.parse.ArgumentParser.validate_train_opts`.
+
+    ``args`` must be tensors. Nothing is recomputed if none of them
+    requires grad, since the parameters used by ``function`` would then
+    get no gradients.
+    """
+    if module.training and torch.is_grad_enabled() \
+            and any(a.requires_grad for a in args):
+        return torch.utils.checkpoint.checkpoint(function, *args)
+    return function(*args)
+
+
 def fn_args(fun):
     """Returns the list of function arguments name."""
     return inspect.getfullargspec(fun).args
@@ -0,0 +1,105 @@
+"""Exponential moving average of the parameters of a model."""
+from contextlib import contextmanager
+
+import torch
+
+
+class MovingAverage(object):
+    """Exponential moving average of ``params``, updated in place.
+
+    The average is kept in fp32 in a single flat buffer, initialized
+    with the current values of the parameters, so that it is decayed
+    with one operation per update and never reallocated.
+
+    Args:
+        params (list[torch.nn.Parameter]): The averaged parameters.
+        decay (float): Weight of the parameters in each update, raised
+            during the first steps (see :func:`update`).
+        device (torch.device or str): Where the average is kept, e.g.
+            ``"cpu"`` to offload it from the GPU. The device of the
+            parameters if None.
+    """
+
+    def __init__(self, params, decay, device=None):
+        self.params = list(params)
+        self.decay = decay
+        device = torch.device(device) if device is not None \
+            else self.params[0].device
+        numel = sum(p.numel() for p in self.params)
+        pin = device.type == "cpu" and \
+            any(p.is_cuda for p in self.params)
+        self.flat = torch.empty(numel, dtype=torch.float, device=device)
+        if pin:
+            self.flat = self.flat.pin_memory()
+        self.average = self._views(self.flat)
+        # the parameters that are not fp32 tensors on the device of the
+        # average go through a buffer to be converted
+        self._buffer = None
+        if any(p.dtype != torch.float or p.device != device
+               for p in self.params):
+            self._buffer = torch.empty_like(self.flat)
+            if pin:
+                self._buffer = self._buffer.pin_memory()
+        with torch.no_grad():
+            for avg, p in zip(self.average, self.params):
+                avg.copy_(p)
+
+    def _views(self, flat):
+        views = []
+        offset = 0
+        for p in self.params:
+            views.append(flat[offset:offset + p.numel()].view_as(p))
+            offset += p.numel()
+        return views
+
+    def _copy_to_buffer(self):
+        buffer = self._views(self._buffer)
+        for buf, p in zip(buffer, self.params):
+            buf.copy_(p.detach(), non_blocking=True)
+        if self._buffer.is_pinned():
+            # wait for the copies from the GPU
+            torch.cuda.synchronize()
+
+    def update(self, step):
+        """Move the average towards the current parameters, by
+        ``max(decay, 1 - (step + 1) / (step + 10))``."""
+        decay = max(self.decay, 1 - (step + 1) / (step + 10))
+        with torch.no_grad():
+            self.flat.mul_(1 - decay)
+            if self._buffer is None:
+                for avg, p in zip(self.average, self.params):
+                    avg.add_(p, alpha=decay)
+            else:
+                self._copy_to_buffer()
+                self.flat.add_(self._buffer, alpha=decay)
+
+    @contextmanager
+    def swapped(self):
+        """Context in which the parameters hold the average.
+
+        The parameters are pointed to the average when it is kept with
+        their type and device, and otherwise the average is copied into
+        them after saving their values in a buffer. They are restored
+        when leaving the context.
+        """
+        if self._buffer is None:
+            data = [p.data for p in self.params]
+            for avg, p in zip(self.average, self.params):
+                p.data = avg
+            try:
+                yield
+            finally:
+                for d, p in zip(data, self.params):
+                    p.data = d
+        else:
+            self._copy_to_buffer()
+            with torch.no_grad():
+                for avg, p in zip(self.average, self.params):
+                    p.copy_(avg, non_blocking=True)
+            try:
+                yield
+            finally:
+                with torch.no_grad():
+                    for buf, p in zip(self._views(self._buffer),
+                                      self.params):
+                        p.copy_(buf, non_blocking=True)
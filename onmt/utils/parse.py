@@ -2,6 +2,7 @@ import configargparse as cfargparse
 import os
 
 import torch
+import torch.utils.checkpoint
 
 import onmt.opts as opts
 from onmt.utils.logging import logger
@@ -87,9 +88,34 @@ class ArgumentParser(cfargparse.ArgumentParser):
         if opt.gpuid:
             raise AssertionError("gpuid is deprecated \
                   see world_size and gpu_ranks")
+        if opt.grad_reduce_dtype == "bf16" and \
+                not hasattr(torch, "bfloat16"):
+            raise AssertionError(
+                "-grad_reduce_dtype bf16 needs a newer version of torch.")
+        assert 0 <= opt.grad_topk_ratio <= 1, \
+            "-grad_topk_ratio must be between 0 and 1."
+        assert opt.checkpoint_every > 0, \
+            "-checkpoint_every must be positive."
+        # torch.utils.checkpoint restores the RNG state before
+        # recomputing, so that dropout draws the same masks, from 1.1
+        if opt.checkpoint_layers != "none" and \
+                not hasattr(torch.utils.checkpoint, "set_device_states"):
+            raise AssertionError(
+                "-checkpoint_layers needs a newer version of torch.")
         if torch.cuda.is_available() and not opt.gpu_ranks:
             logger.info("WARNING: You have a CUDA device, \
                         should run with -gpu_ranks")
+        if opt.train_src:
+            assert opt.model_type == "text", \
+                "-train_src is only available for text data."
+            assert opt.train_tgt, "-train_src needs -train_tgt."
+            assert bool(opt.valid_src) == bool(opt.valid_tgt), \
+                "-valid_src and -valid_tgt go together."
+            for path in [opt.train_src, opt.train_tgt,
+                         opt.valid_src, opt.valid_tgt,
+                         opt.tokenizer_config]:
+                assert path is None or os.path.isfile(path), \
+                    "Please check path of your raw data: %s" % path
 
     @classmethod
     def validate_translate_opts(cls, opt):
@@ -105,6 +131,12 @@ class ArgumentParser(cfargparse.ArgumentParser):
             "-shuffle is not implemented. Please shuffle \
             your data before pre-processing."
 
+        assert opt.shard_format != "mmap" or opt.data_type == "text", \
+            "-shard_format mmap is only available for text data."
+        assert opt.shard_memory <= 0 or (
+            opt.shard_manifest and os.path.isfile(opt.shard_manifest)), \
+            "-shard_memory needs the manifest of -shard_manifest."
+
         assert os.path.isfile(opt.train_src) \
             and os.path.isfile(opt.train_tgt), \
             "Please check path of your train src and tgt files!"
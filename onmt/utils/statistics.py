@@ -15,6 +15,7 @@ class Statistics(object):
     * accuracy
     * perplexity
     * elapsed time
+    * bytes of gradients sent per step, in distributed training
     """
 
     def __init__(self, loss=0, n_words=0, n_correct=0):
@@ -22,6 +23,8 @@ class Statistics(object):
         self.n_words = n_words
         self.n_correct = n_correct
         self.n_src_words = 0
+        self.n_sent_bytes = 0
+        self.n_updates = 0
         self.start_time = time.time()
 
     @staticmethod
@@ -97,6 +100,10 @@ class Statistics(object):
         """ compute perplexity """
         return math.exp(min(self.loss / self.n_words, 100))
 
+    def sent_mb_per_step(self):
+        """ compute megabytes of gradients sent per step """
+        return self.n_sent_bytes / 2 ** 20 / max(self.n_updates, 1)
+
     def elapsed_time(self):
         """ compute elapsed time """
         return time.time() - self.start_time
@@ -113,9 +120,12 @@ class Statistics(object):
         step_fmt = "%2d" % step
         if num_steps > 0:
             step_fmt = "%s/%5d" % (step_fmt, num_steps)
+        sent_fmt = ""
+        if self.n_updates:
+            sent_fmt = "; %.2f MB/step sent" % self.sent_mb_per_step()
         logger.info(
             ("Step %s; acc: %6.2f; ppl: %5.2f; xent: %4.2f; " +
-             "lr: %7.5f; %3.0f/%3.0f tok/s; %6.0f sec")
+             "lr: %7.5f; %3.0f/%3.0f tok/s; %6.0f sec%s")
             % (step_fmt,
                self.accuracy(),
                self.ppl(),
@@ -123,7 +133,8 @@ class Statistics(object):
                learning_rate,
                self.n_src_words / (t + 1e-5),
                self.n_words / (t + 1e-5),
-               time.time() - start))
+               time.time() - start,
+               sent_fmt))
         sys.stdout.flush()
 
     def log_tensorboard(self, prefix, writer, learning_rate, step):
@@ -134,3 +145,6 @@ class Statistics(object):
         writer.add_scalar(prefix + "/accuracy", self.accuracy(), step)
         writer.add_scalar(prefix + "/tgtper", self.n_words / t, step)
         writer.add_scalar(prefix + "/lr", learning_rate, step)
+        if self.n_updates:
+            writer.add_scalar(
+                prefix + "/sent_mb", self.sent_mb_per_step(), step)
@@ -0,0 +1,67 @@
+"""Subword tokenizers of raw text, as configured for the REST server."""
+import os
+
+
+def build_tokenizer(tokenizer_opt, root=""):
+    """Build a tokenizer from its options.
+
+    Args:
+        tokenizer_opt (dict): ``{"type": "sentencepiece", "model": path}``
+            or ``{"type": "pyonmttok", "mode": mode, "params": {...}}``
+            where the params ending in ``"path"`` are paths.
+        root (str): directory the paths of ``tokenizer_opt`` are
+            relative to.
+
+    Returns:
+        A ``sentencepiece.SentencePieceProcessor`` or a
+        ``pyonmttok.Tokenizer``.
+    """
+
+    if "type" not in tokenizer_opt:
+        raise ValueError(
+            "Missing mandatory tokenizer option 'type'")
+
+    if tokenizer_opt['type'] == 'sentencepiece':
+        if "model" not in tokenizer_opt:
+            raise ValueError(
+                "Missing mandatory tokenizer option 'model'")
+        import sentencepiece as spm
+        sp = spm.SentencePieceProcessor()
+        model_path = os.path.join(root, tokenizer_opt['model'])
+        sp.Load(model_path)
+        return sp
+    elif tokenizer_opt['type'] == 'pyonmttok':
+        if "params" not in tokenizer_opt:
+            raise ValueError(
+                "Missing mandatory tokenizer option 'params'")
+        import pyonmttok
+        mode = tokenizer_opt.get("mode")
+        # the options can be used multiple times: modify copy
+        tokenizer_params = dict(tokenizer_opt["params"])
+        for key, value in tokenizer_opt["params"].items():
+            if key.endswith("path"):
+                tokenizer_params[key] = os.path.join(root, value)
+        return pyonmttok.Tokenizer(mode, **tokenizer_params)
+    else:
+        raise ValueError("Invalid value for tokenizer type")
+
+
+def tokenize(tokenizer, tokenizer_type, sequence):
+    """Tokenize a single sequence.
+
+    Args:
+        tokenizer: A tokenizer from :func:`build_tokenizer`.
+        tokenizer_type (str): The ``"type"`` option of the tokenizer.
+        sequence (str): The sequence to tokenize.
+
+    Returns:
+        tok (str): The tokens of the sequence joined by spaces.
+    """
+
+    if tokenizer_type == "sentencepiece":
+        tok = tokenizer.EncodeAsPieces(sequence)
+    elif tokenizer_type == "pyonmttok":
+        tok, _ = tokenizer.tokenize(sequence)
+    else:
+        raise ValueError("Invalid value for tokenizer type")
+    return " ".join(tok)
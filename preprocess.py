@@ -5,30 +5,113 @@
 """
 import codecs
 import glob
+import os
 import sys
 import gc
+from collections import Counter
+import multiprocessing
 import torch
 from functools import partial
 
 from onmt.utils.logging import init_logger, logger
-from onmt.utils.misc import split_corpus
+from onmt.utils.misc import corpus_shards, read_shard
 import onmt.inputters as inputters
+from onmt.inputters.inputter import COUNTS_EXT, load_dataset
+from onmt.inputters.example_store import ExampleViews
+from onmt.inputters.mmap_dataset import save_mmap_shard, is_mmap_shard, \
+    MMAP_EXT
+from onmt.inputters.manifest import MANIFEST_EXT, manifest_path, \
+    shard_stats, save_manifest, load_manifest, shard_size_for_memory
 import onmt.opts as opts
 from onmt.utils.parse import ArgumentParser
 
 
 def check_existing_pt_files(opt):
     """ Check if there are existing .pt files to avoid overwriting them """
-    pattern = opt.save_data + '.{}*.pt'
-    for t in ['train', 'valid', 'vocab']:
-        path = pattern.format(t)
-        if glob.glob(path):
-            sys.stderr.write("Please backup existing pt files: %s, "
-                             "to avoid overwriting them!\n" % path)
-            sys.exit(1)
+    for ext in ['.pt', MMAP_EXT, COUNTS_EXT, MANIFEST_EXT]:
+        pattern = opt.save_data + '.{}*' + ext
+        for t in ['train', 'valid', 'vocab']:
+            path = pattern.format(t)
+            if glob.glob(path):
+                sys.stderr.write("Please backup existing pt files: %s, "
+                                 "to avoid overwriting them!\n" % path)
+                sys.exit(1)
+
+
+def _build_save_shard(corpus_type, fields, src_reader, tgt_reader,
+                      raw_filter, count_vocab, opt, shard):
+    """Build and save a single shard, read from the byte ranges of
+    :func:`onmt.utils.misc.corpus_shards`. If ``count_vocab``, the token
+    counts of its examples are saved next to it (see
+    :func:`onmt.inputters.counts_path`).
+
+    Returns:
+        (str, dict): the path of the saved shard and its manifest entry
+        (see :func:`onmt.inputters.manifest.shard_stats`).
+    """
+
+    i, (src_shard, tgt_shard) = shard
+    src_shard = read_shard(src_shard)
+    tgt_shard = read_shard(tgt_shard)
+    assert len(src_shard) == len(tgt_shard)
+    logger.info("Building shard %d." % i)
+    dataset = inputters.Dataset(
+        fields,
+        readers=[src_reader, tgt_reader] if tgt_reader else [src_reader],
+        data=([("src", src_shard), ("tgt", tgt_shard)]
+              if tgt_reader else [("src", src_shard)]),
+        dirs=[opt.src_dir, None] if tgt_reader else [opt.src_dir],
+        sort_key=inputters.str2sortkey[opt.data_type],
+        raw_filter=raw_filter,
+        dedup=corpus_type == "train" and opt.remove_duplicates
+    )
+
+    ext = MMAP_EXT if opt.shard_format == "mmap" else ".pt"
+    data_path = "{:s}.{:s}.{:d}{:s}".format(
+        opt.save_data, corpus_type, i, ext)
+
+    logger.info(" * saving %sth %s data shard to %s."
+                % (i, corpus_type, data_path))
+
+    if opt.shard_format == "mmap":
+        save_mmap_shard(dataset, data_path)
+    else:
+        dataset.save(data_path)
+
+    if count_vocab:
+        counters = inputters.count_tokens(dataset.examples, fields)
+        torch.save(dict(counters), inputters.counts_path(data_path))
+
+    stats = shard_stats(dataset, data_path, len(src_shard))
+    if dataset.rejected:
+        logger.info(" * rejected pairs of shard %d: %s." % (i, ", ".join(
+            "%d %s" % (n, reason)
+            for reason, n in sorted(dataset.rejected.items()))))
+
+    del dataset.examples
+    gc.collect()
+    del dataset
+    gc.collect()
+
+    return data_path, stats
 
 
 def build_save_dataset(corpus_type, fields, src_reader, tgt_reader, opt):
+    """Build and save the shards of a corpus.
+
+    The files are split by lines without being read (see
+    :func:`onmt.utils.misc.line_index`): each shard reads its own lines.
+    With ``-num_threads > 1``, shards are built and saved by a pool of
+    worker processes. The saved shards are the same as in a serial run.
+    The token counts of each training shard are saved next to it, so
+    that building the vocabulary does not need to reload the shards, and
+    the manifest of the shards is saved next to them (see
+    :mod:`onmt.inputters.manifest`).
+
+    Returns:
+        List[str]: The paths of the saved shards, in order.
+    """
+
     assert corpus_type in ['train', 'valid']
 
     if corpus_type == 'train':
@@ -40,42 +123,56 @@ def build_save_dataset(corpus_type, fields, src_reader, tgt_reader, opt):
 
     logger.info("Reading source and target files: %s %s." % (src, tgt))
 
-    src_shards = split_corpus(src, opt.shard_size)
-    tgt_shards = split_corpus(tgt, opt.shard_size)
+    # the line indexes are cached with the saved data
+    src_shards = corpus_shards(src, opt.shard_size, opt.save_data)
+    tgt_shards = corpus_shards(tgt, opt.shard_size, opt.save_data)
     shard_pairs = zip(src_shards, tgt_shards)
     dataset_paths = []
     if (corpus_type == "train" or opt.filter_valid) and tgt is not None:
-        filter_pred = partial(
-            inputters.filter_example, use_src_len=opt.data_type == "text",
-            max_src_len=opt.src_seq_length, max_tgt_len=opt.tgt_seq_length)
+        # pairs are rejected from their text, before examples are built
+        raw_filter = partial(
+            inputters.filter_raw_example,
+            max_src_len=opt.src_seq_length, max_tgt_len=opt.tgt_seq_length,
+            src_truncate=opt.src_seq_length_trunc,
+            tgt_truncate=opt.tgt_seq_length_trunc,
+            max_ratio=opt.filter_length_ratio if corpus_type == "train"
+            else 0)
     else:
-        filter_pred = None
-    for i, (src_shard, tgt_shard) in enumerate(shard_pairs):
-        assert len(src_shard) == len(tgt_shard)
-        logger.info("Building shard %d." % i)
-        dataset = inputters.Dataset(
-            fields,
-            readers=[src_reader, tgt_reader] if tgt_reader else [src_reader],
-            data=([("src", src_shard), ("tgt", tgt_shard)]
-                  if tgt_reader else [("src", src_shard)]),
-            dirs=[opt.src_dir, None] if tgt_reader else [opt.src_dir],
-            sort_key=inputters.str2sortkey[opt.data_type],
-            filter_pred=filter_pred
-        )
-
-        data_path = "{:s}.{:s}.{:d}.pt".format(opt.save_data, corpus_type, i)
-        dataset_paths.append(data_path)
-
-        logger.info(" * saving %sth %s data shard to %s."
-                    % (i, corpus_type, data_path))
-
-        dataset.save(data_path)
-
-        del dataset.examples
-        gc.collect()
-        del dataset
-        gc.collect()
-
+        raw_filter = None
+
+    build_shard = partial(
+        _build_save_shard, corpus_type, fields, src_reader, tgt_reader,
+        raw_filter, corpus_type == 'train', opt)
+    if opt.num_threads > 1:
+        pool = multiprocessing.Pool(opt.num_threads)
+        results = pool.imap(build_shard, enumerate(shard_pairs))
+    else:
+        pool = None
+        results = map(build_shard, enumerate(shard_pairs))
+
+    shards = []
+    try:
+        for data_path, stats in results:
+            dataset_paths.append(data_path)
+            shards.append(stats)
+    except BaseException:
+        if pool is not None:
+            pool.terminate()
+        raise
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    save_manifest(manifest_path(opt.save_data, corpus_type), shards)
+    rejected = Counter()
+    for s in shards:
+        rejected.update(s["rejected"])
+    logger.info(" * %s: %d examples, %d filtered out (%s)."
+                % (corpus_type, sum(s["examples"] for s in shards),
+                   sum(s["filtered"] for s in shards),
+                   ", ".join("%d %s" % (n, reason)
+                             for reason, n in sorted(rejected.items()))
+                   or "none rejected"))
     return dataset_paths
 
 
@@ -84,11 +181,55 @@ def build_save_vocab(train_dataset, fields, opt):
         train_dataset, fields, opt.data_type, opt.share_vocab,
         opt.src_vocab, opt.src_vocab_size, opt.src_words_min_frequency,
         opt.tgt_vocab, opt.tgt_vocab_size, opt.tgt_words_min_frequency,
-        vocab_size_multiple=opt.vocab_size_multiple
+        vocab_size_multiple=opt.vocab_size_multiple,
+        num_workers=opt.num_threads,
+        max_counts=opt.vocab_max_counts,
+        spill_dir=os.path.dirname(os.path.abspath(opt.save_data))
     )
 
     vocab_path = opt.save_data + '.vocab.pt'
     torch.save(fields, vocab_path)
+    return fields
+
+
+def _numericalize_shard(fields, data_path):
+    """Save the vocab ids of the text of a shard in it (see
+    :meth:`onmt.inputters.example_store.ExampleStore.numericalize`)."""
+
+    logger.info(" * numericalizing %s." % data_path)
+    dataset = load_dataset(data_path)
+    if not isinstance(dataset.examples, ExampleViews):
+        logger.info("   %s has no example store, skipped." % data_path)
+        return
+    dataset.examples.store.numericalize(fields)
+    tmp_path = data_path + ".tmp"
+    if is_mmap_shard(data_path):
+        save_mmap_shard(dataset, tmp_path)
+    else:
+        dataset.save(tmp_path)
+    os.rename(tmp_path, data_path)
+
+
+def numericalize_shards(dataset_paths, fields, opt):
+    """Save the vocab ids of the text of the shards in them, with
+    ``-num_threads`` worker processes."""
+
+    if inputters.old_style_vocab(fields):
+        fields = inputters.load_old_vocab(
+            fields, opt.data_type, dynamic_dict=opt.dynamic_dict)
+    numericalize = partial(_numericalize_shard, fields)
+    if opt.num_threads > 1:
+        pool = multiprocessing.Pool(opt.num_threads)
+        try:
+            pool.map(numericalize, dataset_paths)
+        except BaseException:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+    else:
+        for data_path in dataset_paths:
+            numericalize(data_path)
 
 
 def count_features(path):
@@ -108,6 +249,11 @@ def main(opt):
     check_existing_pt_files(opt)
 
     init_logger(opt.log_file)
+    if opt.shard_memory > 0:
+        opt.shard_size = shard_size_for_memory(
+            load_manifest(opt.shard_manifest), opt.shard_memory)
+        logger.info(" * shard size for %d MB: %d examples."
+                    % (opt.shard_memory, opt.shard_size))
     logger.info("Extracting features...")
 
     src_nfeats = count_features(opt.train_src) if opt.data_type == 'text' \
@@ -132,12 +278,19 @@ def main(opt):
     train_dataset_files = build_save_dataset(
         'train', fields, src_reader, tgt_reader, opt)
 
+    valid_dataset_files = []
     if opt.valid_src and opt.valid_tgt:
         logger.info("Building & saving validation data...")
-        build_save_dataset('valid', fields, src_reader, tgt_reader, opt)
+        valid_dataset_files = build_save_dataset(
+            'valid', fields, src_reader, tgt_reader, opt)
 
     logger.info("Building & saving vocabulary...")
-    build_save_vocab(train_dataset_files, fields, opt)
+    fields = build_save_vocab(train_dataset_files, fields, opt)
+
+    if opt.numericalize:
+        logger.info("Numericalizing data...")
+        numericalize_shards(
+            train_dataset_files + valid_dataset_files, fields, opt)
 
 
 def _get_parser():
@@ -1,38 +1,40 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import argparse
-import sys
-
-
-def read_files_batch(file_list):
-    """Reads the provided files in batches"""
-    batch = []  # Keep batch for each file
-    fd_list = []  # File descriptor list
-
-    exit = False  # Flag used for quitting the program in case of error
-
-    try:
-        for filename in file_list:
-            fd_list.append(open(filename))
-
-        for lines in zip(*fd_list):
-            for i, line in enumerate(lines):
-                line = line.rstrip("\n").split(" ")
-                batch.append(line)
-
-            yield batch
-            batch = []  # Reset batch
-
-    except IOError:
-        print("Error reading file " + filename + ".")
-        exit = True  # Flag to exit the program
-
-    finally:
-        for fd in fd_list:
-            fd.close()
-
-        if exit:  # An error occurred, end execution
-            sys.exit(-1)
+import multiprocessing
+from collections import Counter
+
+from onmt.inputters.token_counts import TokenCounts, most_common
+from onmt.utils.misc import corpus_shards, read_shard
+
+
+def count_shard(shard):
+    """Counts the tokens of a shard of lines of a corpus file"""
+    counter = Counter()
+    for line in read_shard(shard):
+        counter.update(line.decode("utf-8").rstrip("\n").split(" "))
+    return counter
+
+
+def count_files(file_list, shard_size, num_workers, max_counts):
+    """Counts the tokens of the files by shards of lines, with
+    num_workers processes. The counts are spilled to disk beyond
+    max_counts distinct tokens."""
+    shards = [shard for filename in file_list
+              for shard in corpus_shards(filename, shard_size)]
+    counts = TokenCounts(max_counts)
+    if num_workers > 1:
+        pool = multiprocessing.Pool(num_workers)
+        results = pool.imap_unordered(count_shard, shards)
+    else:
+        pool = None
+        results = map(count_shard, shards)
+    for counter in results:
+        counts.update(counter)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return counts
 
 
 def main():
@@ -52,25 +54,39 @@ def main():
     parser.add_argument("-file", type=str, nargs="+", required=True)
     parser.add_argument("-out_file", type=str, required=True)
     parser.add_argument("-side", type=str)
+    parser.add_argument("-size", type=int, default=0,
+                        help="Maximum size of the vocabulary created "
+                             "from text, no limit if 0.")
+    parser.add_argument("-min_frequency", type=int, default=1,
+                        help="Minimum frequency of the words of the "
+                             "vocabulary created from text.")
+    parser.add_argument("-num_workers", type=int, default=1,
+                        help="Number of processes counting the words.")
+    parser.add_argument("-shard_size", type=int, default=100000,
+                        help="Number of lines counted at once by a "
+                             "process.")
+    parser.add_argument("-max_counts", type=int, default=0,
+                        help="Number of distinct words counted in memory "
+                             "before spilling the counts to disk, no limit "
+                             "if 0.")
 
     opt = parser.parse_args()
 
-    vocabulary = {}
     if opt.file_type == 'text':
         print("Reading input file...")
-        for batch in read_files_batch(opt.file):
-            for sentence in batch:
-                for w in sentence:
-                    if w in vocabulary:
-                        vocabulary[w] += 1
-                    else:
-                        vocabulary[w] = 1
+        counts = count_files(opt.file, opt.shard_size, opt.num_workers,
+                             opt.max_counts)
+        try:
+            vocabulary = most_common(counts.items(), opt.size or None,
+                                     opt.min_frequency)
+        finally:
+            counts.close()
 
         print("Writing vocabulary file...")
-        with open(opt.out_file, "w") as f:
-            for w, count in sorted(vocabulary.items(), key=lambda x: x[1],
-                                   reverse=True):
-                f.write("{0}\n".format(w))
+        with open(opt.out_file, "wb") as f:
+            for w, count in sorted(vocabulary.items(),
+                                   key=lambda x: (-x[1], x[0])):
+                f.write(u"{0}\n".format(w).encode("utf-8"))
     else:
         import torch
         from onmt.inputters.inputter import _old_style_vocab
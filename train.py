@@ -20,18 +20,24 @@ def main(opt):
     nb_gpu = len(opt.gpu_ranks)
 
     if opt.world_size > 1:
+        if nb_gpu:
+            devices = [(device_id, opt.gpu_ranks[device_id])
+                       for device_id in range(nb_gpu)]
+        else:
+            # data parallel training on CPU with world_size processes
+            devices = [(-1, rank) for rank in range(opt.world_size)]
         mp = torch.multiprocessing.get_context('spawn')
         # Create a thread to listen for errors in the child processes.
         error_queue = mp.SimpleQueue()
         error_handler = ErrorHandler(error_queue)
         # Train with multiprocessing.
         procs = []
-        for device_id in range(nb_gpu):
+        for device_id, rank in devices:
             procs.append(mp.Process(target=run, args=(
-                opt, device_id, error_queue, ), daemon=True))
-            procs[device_id].start()
-            logger.info(" Starting process pid: %d  " % procs[device_id].pid)
-            error_handler.add_child(procs[device_id].pid)
+                opt, device_id, rank, error_queue, ), daemon=True))
+            procs[-1].start()
+            logger.info(" Starting process pid: %d  " % procs[-1].pid)
+            error_handler.add_child(procs[-1].pid)
         for p in procs:
             p.join()
 
@@ -41,11 +47,11 @@ def main(opt):
         single_main(opt, -1)
 
 
-def run(opt, device_id, error_queue):
+def run(opt, device_id, rank, error_queue):
     """ run process """
     try:
-        gpu_rank = onmt.utils.distributed.multi_init(opt, device_id)
-        if gpu_rank != opt.gpu_ranks[device_id]:
+        gpu_rank = onmt.utils.distributed.multi_init(opt, device_id, rank)
+        if gpu_rank != rank:
             raise AssertionError("An error occurred in \
                   Distributed initialization")
         single_main(opt, device_id)
@@ -54,7 +60,7 @@ def run(opt, device_id, error_queue):
     except Exception:
         # propagate exception to parent process, keeping original traceback
         import traceback
-        error_queue.put((opt.gpu_ranks[device_id], traceback.format_exc()))
+        error_queue.put((rank, traceback.format_exc()))
 
 
 class ErrorHandler(object):